@@ -0,0 +1,156 @@
+"""Write-behind buffer for session activity (last seen, IP, user agent).
+
+Authenticated requests call ``buffer.record(session_id, ...)``. Entries are
+coalesced per session in memory, so each session costs at most one row
+update per flush however many requests it makes. They are written by a
+background thread every ACTIVITY_FLUSH_SECONDS, or sooner once
+ACTIVITY_FLUSH_ENTRIES sessions are pending, with one executemany UPDATE.
+``pending()`` lets readers merge not-yet-flushed data.
+
+Activity is best effort. Entries still buffered when a worker is killed are
+lost, and when the database is unavailable at most ACTIVITY_MAX_PENDING
+sessions are kept for the next attempt.
+"""
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import update, bindparam, or_
+from . import models
+from .database import engine
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+ACTIVITY_ENABLED = os.getenv("ACTIVITY_ENABLED", "1") == "1"
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "30"))
+ACTIVITY_FLUSH_ENTRIES = int(os.getenv("ACTIVITY_FLUSH_ENTRIES", "1000"))
+ACTIVITY_MAX_PENDING = int(os.getenv("ACTIVITY_MAX_PENDING", "100000"))
+USER_AGENT_MAX_LENGTH = 512
+
+
+class Activity:
+    __slots__ = ("last_seen_at", "ip", "user_agent")
+
+    def __init__(self, last_seen_at: datetime, ip: str | None, user_agent: str | None):
+        self.last_seen_at = last_seen_at
+        self.ip = ip
+        self.user_agent = user_agent
+
+
+def clean_user_agent(value: str | None) -> str | None:
+    return value[:USER_AGENT_MAX_LENGTH] if value else None
+
+
+class ActivityBuffer:
+    def __init__(self, flush_seconds: float, flush_entries: int, max_pending: int, bind=None):
+        self.flush_seconds = flush_seconds
+        self.flush_entries = flush_entries
+        self.max_pending = max_pending
+        self.bind = bind or engine
+        self._pending = {}
+        self._lock = threading.Lock()
+        # serialises flushes so an older batch never lands after a newer one
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.recorded = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def record(self, session_id: str, ip: str | None, user_agent: str | None, now: datetime | None = None):
+        now = now or datetime.utcnow()
+        user_agent = clean_user_agent(user_agent)
+        with self._lock:
+            self.recorded += 1
+            entry = self._pending.get(session_id)
+            if entry is not None:
+                entry.last_seen_at, entry.ip, entry.user_agent = now, ip, user_agent
+                return
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending[session_id] = Activity(now, ip, user_agent)
+            full = len(self._pending) >= self.flush_entries
+        if full:
+            self._wake.set()
+
+    def pending(self, session_ids) -> dict:
+        """Buffered activity for ``session_ids`` that has not been flushed yet."""
+        with self._lock:
+            return {sid: self._pending[sid] for sid in session_ids if sid in self._pending}
+
+    def flush(self) -> int:
+        """Write everything buffered so far. Returns the number of sessions written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            RT = models.RefreshToken
+            # never move last_seen_at backwards when several workers flush the same session
+            stmt = (
+                update(RT)
+                .where(RT.id == bindparam("b_id"), or_(RT.last_seen_at.is_(None), RT.last_seen_at < bindparam("b_seen")))
+                .values(last_seen_at=bindparam("b_seen"), last_ip=bindparam("b_ip"), device_info=bindparam("b_ua"))
+            )
+            rows = [{"b_id": sid, "b_seen": a.last_seen_at, "b_ip": a.ip, "b_ua": a.user_agent} for sid, a in batch.items()]
+            try:
+                with self.bind.begin() as conn:
+                    conn.execute(stmt, rows)
+            except Exception:
+                self._requeue(batch)
+                raise
+            self.flushes += 1
+            self.rows_written += len(rows)
+            return len(rows)
+
+    def _requeue(self, batch: dict):
+        with self._lock:
+            for sid, entry in batch.items():
+                # newer activity recorded since the swap wins
+                if sid not in self._pending and len(self._pending) < self.max_pending:
+                    self._pending[sid] = entry
+                elif sid not in self._pending:
+                    self.dropped += 1
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="activity-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning("Final session activity flush failed: %s", e)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Session activity flush failed: %s", e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "recorded": self.recorded,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+            }
+
+
+buffer = ActivityBuffer(ACTIVITY_FLUSH_SECONDS, ACTIVITY_FLUSH_ENTRIES, ACTIVITY_MAX_PENDING)
@@ -1,88 +1,231 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, status, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status, Request, Query
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List
+from sqlalchemy import update, select, tuple_, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from . import schemas, models, utils
 import os
-from .database import get_db
-from .emailer import send_email
-from .rate_limiter import check_ip, check_key
+import time
+import uuid
+import base64
+import binascii
+from .database import get_db, get_read_db, run_db, engine
+from .emailer import enqueue_email, LOG_BODIES
+from starlette.concurrency import run_in_threadpool
+from . import rate_limiter, password_pool, principal_cache, metrics, activity, login_guard, revocation, refresh_grace
+from .principal_cache import Principal
+from .log import get_logger
+
+logger = get_logger(__name__)
 
 security = HTTPBearer()
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
-@router.post("/signup", response_model=schemas.MessageResponse)
-def signup(payload: schemas.SignUpRequest, request: Request, db: Session = Depends(get_db)):
-    # basic IP rate-limit
-    if not check_ip(request):
-        raise HTTPException(status_code=429, detail="Too many requests")
-    # basic rate limiting by email and IP
-    # note: request not available here; callers should check IP limiter externally if needed
-    existing = db.query(models.User).filter(models.User.email == payload.email).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    pwd_hash = utils.hash_password(payload.password)
-    user = models.User(email=payload.email, password_hash=pwd_hash)
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+# lifetime of access tokens from signin and refresh (trial tokens: 24h)
+ACCESS_TOKEN_MINUTES = 15
+
+
+def _pool_busy():
+    return HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+
+
+async def hash_password(password: str) -> str:
+    try:
+        return await password_pool.hash_password(password)
+    except password_pool.PasswordPoolBusy:
+        raise _pool_busy()
+
+
+async def verify_password(hash: str, password: str) -> bool:
+    t0 = time.perf_counter()
+    try:
+        ok = await password_pool.verify_password(hash, password)
+    except password_pool.PasswordPoolBusy:
+        raise _pool_busy()
+    # wall time including the queue wait: what a caller can observe
+    login_guard.guard.observe_verify(time.perf_counter() - t0)
+    return ok
+
+
+async def _guarded(fn, *args):
+    # Redis-backed tracker calls go to the threadpool, like RateLimitMiddleware
+    if login_guard.guard.remote:
+        return await run_in_threadpool(fn, *args)
+    return fn(*args)
 
-    # create verification token
+
+async def _off_loop(fn, *args):
+    # Redis round trips go to the threadpool, like RateLimitMiddleware
+    if rate_limiter.redis_client:
+        return await run_in_threadpool(fn, *args)
+    return fn(*args)
+
+def _signup_email_taken(db: Session, email: str) -> bool:
+    return db.query(models.User.id).filter(models.User.email == email).first() is not None
+
+
+def _signup_create(db: Session, email: str, pwd_hash: str):
+    # client-side id: user, verification token and outbox row go out in one
+    # transaction without reading the user back
+    user_id = str(uuid.uuid4())
+    db.add(models.User(id=user_id, email=email, password_hash=pwd_hash))
     token = utils.random_token()
     token_hash = utils.hash_token(token)
-    otp = models.OneTimeToken(user_id=user.id, token_hash=token_hash, type=models.TokenType.email_verification, expires_at=datetime.utcnow()+timedelta(minutes=30))
-    db.add(otp)
-    db.commit()
-
+    db.add(models.OneTimeToken(user_id=user_id, token_hash=token_hash, type=models.TokenType.email_verification, expires_at=datetime.utcnow()+timedelta(minutes=30)))
     frontend = os.getenv('FRONTEND_URL', 'http://localhost:9005')
     link = f"{frontend}/verify-email?token={token}"
-    sent = send_email(user.email, "Verify your email", f"Click to verify: {link}")
-    if not sent:
-        print(f"[DEV] Verification link: {link}")
+    # queued in the same transaction; delivered by the outbox workers
+    sent = enqueue_email(db, email, "Verify your email", f"Click to verify: {link}")
+    try:
+        db.commit()
+    except IntegrityError:
+        # lost a race with a concurrent signup for the same email
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Email already registered")
+    if not sent and LOG_BODIES:
+        logger.info("Verification link: %s", link)
+
+
+@router.post("/signup", response_model=schemas.MessageResponse)
+async def signup(payload: schemas.SignUpRequest, db: Session = Depends(get_db)):
+    # IP rate limit: RateLimitMiddleware
+    if await run_db(db, _signup_email_taken, payload.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    pwd_hash = await hash_password(payload.password)
+    await run_db(db, _signup_create, payload.email, pwd_hash)
+    login_guard.guard.unknown.discard(payload.email)
     return {"detail": "Sign-up successful. Check email for verification link."}
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)) -> models.User:
+def _load_principal(db: Session, uid: str):
+    user = db.query(models.User).filter(models.User.id == uid).first()
+    return Principal.from_user(user) if user else None
+
+
+def _client_info(request: Request):
+    ip = request.client.host if request.client else None
+    return ip, activity.clean_user_agent(request.headers.get("user-agent"))
+
+
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_read_db)) -> Principal:
     token = credentials.credentials
     try:
-        payload = utils.decode_access_token(token)
+        with metrics.timer("jwt_verify"):
+            payload = utils.decode_access_token(token)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
     uid = payload.get("sub")
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user = db.query(models.User).filter(models.User.id == uid).first()
-    if not user or user.status.name == 'deleted':
+    principal, ticket = principal_cache.cache.get_local(uid), None
+    if principal is None:
+        principal, ticket = await _off_loop(principal_cache.cache.lookup, uid)
+    if principal is None:
+        principal = await run_db(db, _load_principal, uid)
+        if not principal:
+            raise HTTPException(status_code=401, detail="User not found")
+        # skipped if the user was invalidated while loading, so staleness stays within the TTL
+        await _off_loop(principal_cache.cache.put, principal, ticket)
+    if principal.status.name == 'deleted':
         raise HTTPException(status_code=401, detail="User not found")
-    if user.status.name == 'suspended':
+    if principal.status.name == 'suspended':
         raise HTTPException(status_code=403, detail="Account suspended")
-    return user
+    # after the status checks so a suspended account still gets its 403
+    revoked, unsure = revocation.denylist.check(payload)
+    if unsure:
+        # filter hit on an older revocation or a false positive
+        revoked = await run_db(db, revocation.denylist.confirm, unsure)
+    if revoked:
+        raise HTTPException(status_code=401, detail="Token revoked")
+    sid = payload.get("sid")
+    if sid and activity.ACTIVITY_ENABLED:
+        activity.buffer.record(sid, *_client_info(request))
+    return principal
+
+
+def _user_by_email(db: Session, email: str):
+    return db.query(models.User).filter(models.User.email == email).first()
+
+
+def _create_refresh_token(db: Session, session_id: str, user_id: str, refresh_hash: str, ip: str | None, user_agent: str | None):
+    now = datetime.utcnow()
+    # a sign-in starts a new rotation family named after its first token
+    rt = models.RefreshToken(id=session_id, user_id=user_id, family_id=session_id, token_hash=refresh_hash,
+                             expires_at=now + timedelta(days=14), device_info=user_agent, last_ip=ip, last_seen_at=now)
+    db.add(rt)
+    db.commit()
+
+
+def _upgrade_password_hash(user_id: str, old_hash: str, new_hash: str) -> bool:
+    # compare-and-set: a password reset that landed in between wins
+    with engine.begin() as conn:
+        return conn.execute(
+            update(models.User)
+            .where(models.User.id == user_id, models.User.password_hash == old_hash)
+            .values(password_hash=new_hash)
+        ).rowcount == 1
+
+
+async def _rehash_password(user_id: str, old_hash: str, password: str):
+    """Re-hash with the current Argon2 profile; runs after the sign-in response is sent."""
+    pool = password_pool.pool
+    if pool.pending >= pool.workers:
+        return  # hashing is contended; the next sign-in tries again
+    try:
+        new_hash = await password_pool.hash_password(password)
+        await run_in_threadpool(_upgrade_password_hash, user_id, old_hash, new_hash)
+    except Exception as e:
+        logger.warning("Password rehash failed: %s", e)
+
 
 @router.post("/signin", response_model=schemas.TokenResponse)
-def signin(payload: schemas.SignInRequest, request: Request, response: Response, db: Session = Depends(get_db)):
-    # basic IP rate-limit
-    if not check_ip(request):
-        raise HTTPException(status_code=429, detail="Too many requests")
-    user = db.query(models.User).filter(models.User.email == payload.email).first()
-    if not user or user.status.name == 'deleted':
+async def signin(payload: schemas.SignInRequest, request: Request, response: Response, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    # the IP limit is applied by RateLimitMiddleware; per account, the guard's
+    # challenge throttles instead of a hard limit anyone could use to lock the account out
+    guard = login_guard.guard if login_guard.LOGIN_GUARD_ENABLED else None
+    ip = request.client.host if request.client else None
+    if guard:
+        # before the user lookup and any hashing: unsolved attempts cost no Argon2 work
+        verdict = await _guarded(guard.check, payload.email, ip, request.headers.get("x-login-proof"))
+        if verdict.action == "challenge":
+            raise HTTPException(status_code=429, detail="Sign-in challenge required",
+                                headers={"X-Login-Challenge": verdict.challenge, "Retry-After": "0"})
+    if guard and payload.email in guard.unknown:
+        user = None
+    else:
+        user = await run_db(db, _user_by_email, payload.email)
+        if user is None and guard:
+            guard.unknown.add(payload.email)
+    if not user or user.status.name == 'deleted' or not user.password_hash:
+        if guard:
+            await _guarded(guard.failed, payload.email, ip)
+            await guard.equalize()
         raise HTTPException(status_code=400, detail="Invalid credentials")
     if user.status.name == 'suspended':
         raise HTTPException(status_code=403, detail="Account suspended")
-    if not user.password_hash or not utils.verify_password(user.password_hash, payload.password):
+    if not await verify_password(user.password_hash, payload.password):
+        if guard:
+            await _guarded(guard.failed, payload.email, ip)
         raise HTTPException(status_code=400, detail="Invalid credentials")
+    if guard:
+        await _guarded(guard.succeeded, payload.email)
+    if utils.needs_rehash(user.password_hash):
+        background_tasks.add_task(_rehash_password, user.id, user.password_hash, payload.password)
 
     if not user.email_verified:
         raise HTTPException(status_code=403, detail="Email not verified")
 
-    access_token = utils.create_access_token(user.id, expires_minutes=15)
+    # the refresh token row is the session; access tokens carry its id as "sid"
+    session_id = str(uuid.uuid4())
+    with metrics.timer("jwt_sign"):
+        access_token = utils.create_access_token(user.id, expires_minutes=ACCESS_TOKEN_MINUTES, extra_claims={"sid": session_id})
     refresh_plain = utils.random_token()
     refresh_hash = utils.hash_token(refresh_plain)
-    expires_at = datetime.utcnow() + timedelta(days=14)
-    rt = models.RefreshToken(user_id=user.id, token_hash=refresh_hash, expires_at=expires_at)
-    db.add(rt)
-    db.commit()
+    await run_db(db, _create_refresh_token, session_id, user.id, refresh_hash, *_client_info(request))
 
     # set refresh token cookie and CSRF double-submit cookie
     secure_flag = os.getenv("ENV", "production") == "production"
@@ -91,8 +234,75 @@ def signin(payload: schemas.SignInRequest, request: Request, response: Response,
     response.set_cookie("csrf_token", csrf, httponly=False, secure=secure_flag, samesite='lax', max_age=14*24*3600)
     return {"access_token": access_token}
 
+
+def _revoke_family(db: Session, family_id: str, now: datetime):
+    RT = models.RefreshToken
+    in_family = or_(RT.family_id == family_id, RT.id == family_id)
+    db.execute(update(RT).where(in_family, RT.revoked == False).values(revoked=True))
+    # access tokens issued from the family's recent tokens are still live
+    recent = db.execute(
+        select(RT.id).where(in_family, RT.created_at > now - timedelta(minutes=ACCESS_TOKEN_MINUTES))
+    ).scalars().all()
+    for sid in recent:
+        revocation.revoke_session(db, sid)
+
+
+def _rotate_refresh_token(db: Session, token: str, new_token: str, ip: str | None, user_agent: str | None):
+    """Rotate ``token``; returns (user_id, session_id, refresh token to hand out)."""
+    RT = models.RefreshToken
+    h = utils.hash_token(token)
+    now = datetime.utcnow()
+    session_id = str(uuid.uuid4())
+    # compare-and-swap: of concurrent rotations only one gets the row back; on
+    # Postgres the others wait on its row lock, then see revoked = true
+    row = db.execute(
+        update(RT)
+        .where(RT.token_hash == h, RT.revoked == False, RT.expires_at > now)
+        .values(revoked=True, rotated_at=now, replaced_by=session_id)
+        .returning(RT.id, RT.user_id, RT.family_id)
+    ).first()
+    if row:
+        db.add(RT(id=session_id, user_id=row.user_id, family_id=row.family_id or row.id, token_hash=utils.hash_token(new_token),
+                  expires_at=now + timedelta(days=14), device_info=user_agent, last_ip=ip, last_seen_at=now))
+        # before the commit, so a refresh that lost the race finds it once it sees the rotation
+        refresh_grace.cache.put(h, token, [row.user_id, session_id, new_token])
+        try:
+            db.commit()
+        except Exception:
+            refresh_grace.cache.discard(h)
+            raise
+        return row.user_id, session_id, new_token
+
+    prev = db.execute(select(RT.id, RT.user_id, RT.family_id, RT.rotated_at).where(RT.token_hash == h)).first()
+    if prev and prev.rotated_at and now - prev.rotated_at <= timedelta(seconds=refresh_grace.cache.seconds):
+        # concurrent refresh of the same token (several tabs): hand out the winner's
+        # successor, as long as it is still live; logout, revoke-all, a password
+        # reset or a suspension since the rotation revoke it and end the grace
+        successor = refresh_grace.cache.get(h, token)
+        live = successor and db.execute(
+            select(RT.id)
+            .join(models.User, models.User.id == RT.user_id)
+            .where(RT.id == successor[1], RT.revoked == False, RT.expires_at > now,
+                   models.User.status == models.UserStatus.active)
+        ).first()
+        db.rollback()
+        if live:
+            return tuple(successor)
+    elif prev and prev.rotated_at:
+        # a rotated token presented again after the grace window has been copied:
+        # end the whole family, the thief's and the owner's tokens alike
+        family_id = prev.family_id or prev.id
+        _revoke_family(db, family_id, now)
+        db.commit()
+        refresh_grace.cache.reuse_detected += 1
+        logger.warning("Refresh token reuse for user %s; revoked token family %s", prev.user_id, family_id)
+    else:
+        db.rollback()
+    raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+
 @router.post("/refresh", response_model=schemas.TokenResponse)
-def refresh(request: Request, response: Response, db: Session = Depends(get_db)):
+async def refresh(request: Request, response: Response, db: Session = Depends(get_db)):
     # CSRF double-submit check
     csrf_header = request.headers.get("x-csrf")
     csrf_cookie = request.cookies.get("csrf_token")
@@ -102,26 +312,28 @@ def refresh(request: Request, response: Response, db: Session = Depends(get_db))
     cookie = request.cookies.get("refresh_token")
     if not cookie:
         raise HTTPException(status_code=401, detail="Missing refresh token")
-    h = utils.hash_token(cookie)
-    rt = db.query(models.RefreshToken).filter(models.RefreshToken.token_hash == h).first()
-    if not rt or rt.revoked or rt.expires_at < datetime.utcnow():
-        # Token reuse detection could go here
-        raise HTTPException(status_code=401, detail="Invalid refresh token")
-    # rotate refresh token
-    new_plain = utils.random_token()
-    new_hash = utils.hash_token(new_plain)
-    rt.revoked = True
-    db.add(models.RefreshToken(user_id=rt.user_id, token_hash=new_hash, expires_at=datetime.utcnow()+timedelta(days=14)))
-    db.commit()
+    # rotate refresh token; concurrent refreshes of the same cookie share one successor
+    user_id, session_id, new_plain = await run_db(db, _rotate_refresh_token, cookie, utils.random_token(), *_client_info(request))
     secure_flag = os.getenv("ENV", "production") == "production"
     csrf = utils.random_token(16)
     response.set_cookie("refresh_token", new_plain, httponly=True, secure=secure_flag, samesite='lax', max_age=14*24*3600)
     response.set_cookie("csrf_token", csrf, httponly=False, secure=secure_flag, samesite='lax', max_age=14*24*3600)
-    access_token = utils.create_access_token(rt.user_id, expires_minutes=15)
+    with metrics.timer("jwt_sign"):
+        access_token = utils.create_access_token(user_id, expires_minutes=ACCESS_TOKEN_MINUTES, extra_claims={"sid": session_id})
     return {"access_token": access_token}
 
+
+def _revoke_by_hash(db: Session, h: str):
+    RT = models.RefreshToken
+    row = db.execute(select(RT.id, RT.family_id).where(RT.token_hash == h)).first()
+    if row:
+        # the whole session: access tokens from its earlier rotations carry other sids
+        _revoke_family(db, row.family_id or row.id, datetime.utcnow())
+    db.commit()
+
+
 @router.post("/logout", response_model=schemas.MessageResponse)
-def logout(request: Request, response: Response, db: Session = Depends(get_db)):
+async def logout(request: Request, response: Response, db: Session = Depends(get_db)):
     csrf_header = request.headers.get("x-csrf")
     csrf_cookie = request.cookies.get("csrf_token")
     if not csrf_header or not csrf_cookie or csrf_header != csrf_cookie:
@@ -129,97 +341,210 @@ def logout(request: Request, response: Response, db: Session = Depends(get_db)):
 
     cookie = request.cookies.get("refresh_token")
     if cookie:
-        h = utils.hash_token(cookie)
-        rt = db.query(models.RefreshToken).filter(models.RefreshToken.token_hash == h).first()
-        if rt:
-            rt.revoked = True
-            db.commit()
+        await run_db(db, _revoke_by_hash, utils.hash_token(cookie))
     response.delete_cookie("refresh_token")
     response.delete_cookie("csrf_token")
     return {"detail": "Logged out"}
 
-@router.post("/verify-email", response_model=schemas.MessageResponse)
-def verify_email(payload: schemas.VerifyRequest, db: Session = Depends(get_db)):
-    h = utils.hash_token(payload.token)
-    otp = db.query(models.OneTimeToken).filter(models.OneTimeToken.token_hash == h, models.OneTimeToken.type==models.TokenType.email_verification).first()
-    if not otp or otp.used or otp.expires_at < datetime.utcnow():
+
+def _consume_one_time_token(db: Session, h: str, type: models.TokenType):
+    """Atomically mark an unused, unexpired token as used; returns its user_id or None."""
+    return db.execute(
+        update(models.OneTimeToken)
+        .where(
+            models.OneTimeToken.token_hash == h,
+            models.OneTimeToken.type == type,
+            models.OneTimeToken.used == False,
+            models.OneTimeToken.expires_at > datetime.utcnow(),
+        )
+        .values(used=True)
+        .returning(models.OneTimeToken.user_id)
+    ).scalar()
+
+
+def _verify_email(db: Session, h: str):
+    user_id = _consume_one_time_token(db, h, models.TokenType.email_verification)
+    if not user_id:
+        db.rollback()
         raise HTTPException(status_code=400, detail="Invalid or expired token")
-    user = db.query(models.User).filter(models.User.id == otp.user_id).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="Invalid token")
-    user.email_verified = True
-    otp.used = True
+    db.execute(update(models.User).where(models.User.id == user_id).values(email_verified=True))
+    principal_cache.invalidate_on_commit(db, user_id)
     db.commit()
+
+
+@router.post("/verify-email", response_model=schemas.MessageResponse)
+async def verify_email(payload: schemas.VerifyRequest, db: Session = Depends(get_db)):
+    await run_db(db, _verify_email, utils.hash_token(payload.token))
     return {"detail": "Email verified"}
 
-@router.post("/forgot-password", response_model=schemas.MessageResponse)
-def forgot_password(payload: schemas.ForgotPasswordRequest, request: Request, db: Session = Depends(get_db)):
-    if not check_ip(request):
-        raise HTTPException(status_code=429, detail="Too many requests")
-    user = db.query(models.User).filter(models.User.email == payload.email).first()
+
+def _forgot_password(db: Session, email: str):
+    user = db.query(models.User).filter(models.User.email == email).first()
     if user:
         token = utils.random_token()
         h = utils.hash_token(token)
         otp = models.OneTimeToken(user_id=user.id, token_hash=h, type=models.TokenType.password_reset, expires_at=datetime.utcnow()+timedelta(hours=1))
         db.add(otp)
-        db.commit()
         frontend = os.getenv('FRONTEND_URL', 'http://localhost:9005')
-        print(f"[DEV] Password reset link: {frontend}/reset-password?token={token}")
+        link = f"{frontend}/reset-password?token={token}"
+        sent = enqueue_email(db, user.email, "Reset your password", f"Click to reset your password: {link}")
+        db.commit()
+        if not sent and LOG_BODIES:
+            logger.info("Password reset link: %s", link)
+
+
+@router.post("/forgot-password", response_model=schemas.MessageResponse)
+async def forgot_password(payload: schemas.ForgotPasswordRequest, request: Request, db: Session = Depends(get_db)):
+    # not in ROUTE_LIMITS: the IP and IP+account limits are checked together
+    ip = request.client.host if request.client else "unknown"
+    if not await _off_loop(rate_limiter.check_ip_and_account, ip, f"forgot:{payload.email.lower()}"):
+        raise HTTPException(status_code=429, detail="Too many requests")
+    await run_db(db, _forgot_password, payload.email)
     # Always return success to avoid enumeration
     return {"detail": "If that email exists, a reset link was sent."}
 
-@router.post("/reset-password", response_model=schemas.MessageResponse)
-def reset_password(payload: schemas.ResetPasswordRequest, db: Session = Depends(get_db)):
-    h = utils.hash_token(payload.token)
+
+def _valid_reset_token(db: Session, h: str) -> bool:
     otp = db.query(models.OneTimeToken).filter(models.OneTimeToken.token_hash == h, models.OneTimeToken.type==models.TokenType.password_reset).first()
-    if not otp or otp.used or otp.expires_at < datetime.utcnow():
+    return bool(otp and not otp.used and otp.expires_at >= datetime.utcnow())
+
+
+def _revoke_user_refresh_tokens(db: Session, user_id: str):
+    db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.user_id == user_id, models.RefreshToken.revoked == False)
+        .values(revoked=True)
+    )
+
+
+def _reset_password(db: Session, h: str, pwd_hash: str):
+    user_id = _consume_one_time_token(db, h, models.TokenType.password_reset)
+    if not user_id:
+        db.rollback()
         raise HTTPException(status_code=400, detail="Invalid or expired token")
-    user = db.query(models.User).filter(models.User.id == otp.user_id).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="Invalid token")
-    user.password_hash = utils.hash_password(payload.new_password)
-    otp.used = True
-    # Revoke refresh tokens
-    rts = db.query(models.RefreshToken).filter(models.RefreshToken.user_id == user.id).all()
-    for r in rts:
-        r.revoked = True
+    db.execute(update(models.User).where(models.User.id == user_id).values(password_hash=pwd_hash, updated_at=datetime.utcnow()))
+    # Revoke refresh tokens and outstanding access tokens
+    _revoke_user_refresh_tokens(db, user_id)
+    revocation.revoke_user(db, user_id)
+    principal_cache.invalidate_on_commit(db, user_id)
     db.commit()
+
+
+@router.post("/reset-password", response_model=schemas.MessageResponse)
+async def reset_password(payload: schemas.ResetPasswordRequest, db: Session = Depends(get_db)):
+    h = utils.hash_token(payload.token)
+    # check the token before paying for Argon2
+    if not await run_db(db, _valid_reset_token, h):
+        raise HTTPException(status_code=400, detail="Invalid or expired token")
+    pwd_hash = await hash_password(payload.new_password)
+    await run_db(db, _reset_password, h, pwd_hash)
     return {"detail": "Password has been reset"}
 
 
-@router.get("/sessions", response_model=List[schemas.SessionInfo])
-def list_sessions(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    rts = db.query(models.RefreshToken).filter(models.RefreshToken.user_id == current_user.id).all()
+SESSIONS_PAGE_DEFAULT = 50
+SESSIONS_PAGE_MAX = 200
+
+
+def _encode_cursor(created_at: datetime, session_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{session_id}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, session_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), session_id
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _list_sessions(db: Session, user_id: str, session_status: schemas.SessionStatus, limit: int, after):
+    RT = models.RefreshToken
+    now = datetime.utcnow()
+    # columns only: no ORM identity map or instance state for rows we just serialise
+    q = select(RT.id, RT.device_info, RT.expires_at, RT.revoked, RT.created_at, RT.last_seen_at, RT.last_ip).where(RT.user_id == user_id)
+    if session_status == schemas.SessionStatus.active:
+        q = q.where(RT.revoked == False, RT.expires_at > now)
+    elif session_status == schemas.SessionStatus.revoked:
+        q = q.where(RT.revoked == True)
+    elif session_status == schemas.SessionStatus.expired:
+        q = q.where(RT.revoked == False, RT.expires_at <= now)
+    if after:
+        # keyset pagination, newest first; served by ix_refresh_tokens_user_id_created_at_id
+        q = q.where(tuple_(RT.created_at, RT.id) < tuple_(*after))
+    rows = db.execute(q.order_by(RT.created_at.desc(), RT.id.desc()).limit(limit + 1)).all()
+    next_cursor = _encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    rows = rows[:limit]
+    # activity not yet flushed by the write-behind buffer is newer than the row
+    buffered = activity.buffer.pending([r.id for r in rows])
     out = []
-    for r in rts:
-        out.append(schemas.SessionInfo(id=r.id, device_info=r.device_info, expires_at=r.expires_at.isoformat() if r.expires_at else None, revoked=bool(r.revoked), created_at=r.created_at.isoformat() if r.created_at else None))
-    return out
+    for r in rows:
+        device_info, last_seen_at, last_ip = r.device_info, r.last_seen_at, r.last_ip
+        a = buffered.get(r.id)
+        if a and (last_seen_at is None or a.last_seen_at > last_seen_at):
+            device_info, last_seen_at, last_ip = a.user_agent, a.last_seen_at, a.ip
+        out.append({
+            "id": r.id,
+            "device_info": device_info,
+            "expires_at": r.expires_at.isoformat() if r.expires_at else None,
+            "revoked": bool(r.revoked),
+            "created_at": r.created_at.isoformat() if r.created_at else None,
+            "last_seen_at": last_seen_at.isoformat() if last_seen_at else None,
+            "last_ip": last_ip,
+        })
+    return out, next_cursor
 
 
-@router.post("/sessions/revoke", response_model=schemas.MessageResponse)
-def revoke_session(req: schemas.RevokeSessionRequest, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    rt = db.query(models.RefreshToken).filter(models.RefreshToken.id == req.session_id, models.RefreshToken.user_id == current_user.id).first()
-    if not rt:
+@router.get("/sessions", response_model=List[schemas.SessionInfo])
+async def list_sessions(
+    session_status: schemas.SessionStatus = Query(schemas.SessionStatus.all, alias="status"),
+    limit: int = Query(SESSIONS_PAGE_DEFAULT, ge=1, le=SESSIONS_PAGE_MAX),
+    cursor: str | None = None,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    """Newest sessions first. When more exist, ``X-Next-Cursor`` holds the
+    value to pass as ``cursor`` for the next page."""
+    after = _decode_cursor(cursor) if cursor else None
+    sessions, next_cursor = await run_db(db, _list_sessions, current_user.id, session_status, limit, after)
+    # rows are built to the SessionInfo shape already; skip per-item model validation
+    response = JSONResponse(sessions)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+def _revoke_session(db: Session, session_id: str, user_id: str):
+    RT = models.RefreshToken
+    row = db.execute(select(RT.id, RT.family_id).where(RT.id == session_id, RT.user_id == user_id)).first()
+    if not row:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Session not found")
-    rt.revoked = True
+    _revoke_family(db, row.family_id or row.id, datetime.utcnow())
     db.commit()
+
+
+@router.post("/sessions/revoke", response_model=schemas.MessageResponse)
+async def revoke_session(req: schemas.RevokeSessionRequest, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    await run_db(db, _revoke_session, req.session_id, current_user.id)
     return {"detail": "Session revoked"}
 
 
-@router.post("/sessions/revoke-all", response_model=schemas.MessageResponse)
-def revoke_all_sessions(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    rts = db.query(models.RefreshToken).filter(models.RefreshToken.user_id == current_user.id, models.RefreshToken.revoked == False).all()
-    for r in rts:
-        r.revoked = True
+def _revoke_all_sessions(db: Session, user_id: str):
+    _revoke_user_refresh_tokens(db, user_id)
+    revocation.revoke_user(db, user_id)
     db.commit()
+
+
+@router.post("/sessions/revoke-all", response_model=schemas.MessageResponse)
+async def revoke_all_sessions(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    await run_db(db, _revoke_all_sessions, current_user.id)
     return {"detail": "All sessions revoked"}
 
 
 @router.post("/trial", response_model=schemas.TokenResponse)
-def trial_access(payload: schemas.TrialRequest, request: Request, db: Session = Depends(get_db)):
-    if not check_ip(request):
-        raise HTTPException(status_code=429, detail="Too many requests")
-    user = db.query(models.User).filter(models.User.email == payload.email).first()
+async def trial_access(payload: schemas.TrialRequest, db: Session = Depends(get_db)):
+    user = await run_db(db, _user_by_email, payload.email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if user.email_verified:
@@ -227,5 +552,6 @@ def trial_access(payload: schemas.TrialRequest, request: Request, db: Session =
     # allow trial only within 1 day of creation
     if user.created_at + timedelta(days=1) < datetime.utcnow():
         raise HTTPException(status_code=403, detail="Trial expired; please verify your email")
-    access_token = utils.create_access_token(user.id, expires_minutes=24 * 60, extra_claims={"trial": True})
+    with metrics.timer("jwt_sign"):
+        access_token = utils.create_access_token(user.id, expires_minutes=24 * 60, extra_claims={"trial": True})
     return {"access_token": access_token}
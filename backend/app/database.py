@@ -1,18 +1,342 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import uuid
+import itertools
+import threading
+import contextvars
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.sql.dml import UpdateBase
+from fastapi import Depends
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+from . import metrics
+from .log import get_logger
+
+logger = get_logger(__name__)
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dev.db")
+# DB_ASYNC=1 serves requests through an AsyncSession (asyncpg / aiosqlite);
+# otherwise request sessions are sync and run on Starlette's threadpool.
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Read replicas (comma-separated URLs) serve the read-only get_read_db
+# dependency; see ReplicaSet and RoutingSession below.
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+DB_REPLICA_CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", "5"))
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "10"))
+# after a write, the client reads from the primary for this long (read-your-writes)
+DB_STICKY_SECONDS = int(os.getenv("DB_STICKY_SECONDS", "5"))
+# DB_PGBOUNCER=1: DATABASE_URL points at PgBouncer in transaction pooling mode
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+# a connection that bypasses the pooler, for session-level state (retention's
+# advisory lock, migrations); defaults to DATABASE_URL
+DATABASE_DIRECT_URL = os.getenv("DATABASE_DIRECT_URL", DATABASE_URL)
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _engine_kwargs(url: str, pgbouncer: bool = False) -> dict:
+    kwargs = {}
+    if pgbouncer and make_url(url).get_backend_name() == "postgresql":
+        # transaction pooling hands each transaction a different server
+        # connection, so named prepared statements must not outlive one
+        # (psycopg2 never prepares; asyncpg does unless told not to)
+        kwargs["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        } if "asyncpg" in url else {}
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if ":memory:" in url or url.rstrip("/").endswith("sqlite:"):
+            # in-memory SQLite uses a per-thread singleton pool; sizing does not apply
+            return kwargs
+    kwargs.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+    return kwargs
+
+
+def async_url(url: str) -> str:
+    u = make_url(url)
+    return u.set(drivername=_ASYNC_DRIVERS.get(u.get_backend_name(), u.drivername)).render_as_string(hide_password=False)
+
+
+pool_counters = {"checkouts": 0, "overflow_checkouts": 0, "invalidated": 0}
+
+
+def _track_pool(sync_engine):
+    @event.listens_for(sync_engine, "checkout")
+    def _checkout(dbapi_conn, record, proxy):
+        pool_counters["checkouts"] += 1
+        overflow = getattr(sync_engine.pool, "overflow", None)
+        if overflow and overflow() > 0:
+            pool_counters["overflow_checkouts"] += 1
+
+    @event.listens_for(sync_engine, "invalidate")
+    def _invalidate(dbapi_conn, record, exc):
+        pool_counters["invalidated"] += 1
+
+    metrics.instrument_engine(sync_engine)
+
+
+def _create_async_engine(url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    url = async_url(url)
+    kwargs = _engine_kwargs(url, DB_PGBOUNCER)
+    if "pool_size" in kwargs:
+        # aiosqlite defaults to NullPool, which starts a connection thread per session
+        kwargs["poolclass"] = AsyncAdaptedQueuePool
+    return create_async_engine(url, **kwargs)
+
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL, DB_PGBOUNCER))
+_track_pool(engine)
+direct_engine = engine if DATABASE_DIRECT_URL == DATABASE_URL else create_engine(DATABASE_DIRECT_URL, **_engine_kwargs(DATABASE_DIRECT_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db():
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = _create_async_engine(DATABASE_URL)
+    _track_pool(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+class RouteState:
+    """Per-request routing state, shared with the threads and greenlets the request uses."""
+    __slots__ = ("sticky", "wrote")
+
+    def __init__(self, sticky: bool = False):
+        self.sticky = sticky  # the client wrote recently (cookie set by ReadYourWritesMiddleware)
+        self.wrote = False    # this request committed on the primary
+
+
+# set per request by middleware.ReadYourWritesMiddleware; a mutable object so
+# writes made on threadpool threads are seen by the request
+route_state = contextvars.ContextVar("db_route_state", default=None)
+
+
+class Replica:
+    __slots__ = ("url", "engine", "bind", "healthy", "lag", "reads", "errors")
+
+    def __init__(self, url: str, async_engine=None):
+        self.url = url
+        # the sync engine runs health checks (and sync-mode sessions)
+        self.engine = create_engine(url, **_engine_kwargs(url, DB_PGBOUNCER))
+        self.bind = async_engine.sync_engine if async_engine is not None else self.engine
+        self.healthy = True
+        self.lag = 0.0
+        self.reads = 0
+        self.errors = 0
+        metrics.instrument_engine(self.bind)
+
+        @event.listens_for(self.bind, "handle_error")
+        def _failed(ctx):
+            if ctx.is_disconnect or isinstance(ctx.sqlalchemy_exception, OperationalError):
+                self.errors += 1
+                self.healthy = False  # until the next health check passes
+
+
+class ReplicaSet:
+    """Read replicas picked round-robin among the healthy ones.
+
+    A background thread checks each replica every DB_REPLICA_CHECK_SECONDS
+    (``SELECT 1``, plus replay lag on Postgres) and takes out any replica
+    that fails or lags by more than DB_REPLICA_MAX_LAG_SECONDS. A connection
+    error during a request takes it out at once. With no healthy replica,
+    reads go to the primary.
+    """
+
+    def __init__(self, replicas=(), check_seconds: float = DB_REPLICA_CHECK_SECONDS, max_lag: float = DB_REPLICA_MAX_LAG_SECONDS):
+        self.replicas = list(replicas)
+        self.check_seconds = check_seconds
+        self.max_lag = max_lag
+        self._next = itertools.count()
+        self.primary_reads = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def pick(self):
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        replica = healthy[next(self._next) % len(healthy)]
+        replica.reads += 1
+        return replica
+
+    def check(self, replica: Replica):
+        try:
+            with replica.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    lag = conn.execute(text(
+                        "SELECT CASE WHEN pg_is_in_recovery() THEN "
+                        "COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END"
+                    )).scalar()
+                    replica.lag = float(lag or 0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    replica.lag = 0.0
+            healthy = replica.lag <= self.max_lag
+        except Exception as e:
+            logger.warning("Read replica %s failed its health check: %s", replica.engine.url.render_as_string(), e)
+            healthy = False
+        if healthy != replica.healthy:
+            logger.info("Read replica %s is %s", replica.engine.url.render_as_string(), "healthy" if healthy else "out of rotation")
+        replica.healthy = healthy
+
+    def check_all(self):
+        for replica in self.replicas:
+            self.check(replica)
+
+    def start(self):
+        if not self.replicas or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check_all()
+            self._stop.wait(self.check_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "configured": len(self.replicas),
+            "healthy": sum(r.healthy for r in self.replicas),
+            "replica_reads": sum(r.reads for r in self.replicas),
+            "primary_reads": self.primary_reads,
+            "errors": sum(r.errors for r in self.replicas),
+            "max_lag_seconds": max((r.lag for r in self.replicas), default=0.0),
+        }
+
+
+class RoutingSession(Session):
+    """Session for get_read_db: reads go to a replica, anything else to the primary.
+
+    Once the request has written (or the client wrote within
+    DB_STICKY_SECONDS), every read goes to the primary too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        primary = self.info["primary"]
+        if self._flushing or isinstance(clause, UpdateBase):
+            return primary
+        state = route_state.get()
+        if state is not None and (state.wrote or state.sticky):
+            replicas.primary_reads += 1
+            return primary
+        replica = replicas.pick()
+        if replica is None:
+            replicas.primary_reads += 1
+            return primary
+        return replica.bind
+
+
+def _mark_written(conn):
+    state = route_state.get()
+    if state is not None:
+        state.wrote = True
+
+
+def configure_replicas(urls) -> ReplicaSet:
+    """Build the replica set and its read sessions (used at import and by tests)."""
+    global replicas, ReadSessionLocal, AsyncReadSessionLocal
+    primary = async_engine.sync_engine if async_engine is not None else engine
+    built = []
+    for url in urls:
+        built.append(Replica(url, _create_async_engine(url) if DB_ASYNC else None))
+    replicas = ReplicaSet(built)
+    if built and not event.contains(primary, "commit", _mark_written):
+        # any commit on the primary during a request makes its later reads sticky
+        event.listen(primary, "commit", _mark_written)
+    ReadSessionLocal = sessionmaker(class_=RoutingSession, autoflush=False, info={"primary": primary})
+    if DB_ASYNC:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        AsyncReadSessionLocal = async_sessionmaker(sync_session_class=RoutingSession, autoflush=False,
+                                                   expire_on_commit=False, info={"primary": primary})
+    return replicas
+
+
+replicas = ReplicaSet()
+ReadSessionLocal = None
+AsyncReadSessionLocal = None
+configure_replicas(DATABASE_REPLICA_URLS)
+
+
+def pool_stats() -> dict:
+    """Connection pool occupancy for the engine serving requests."""
+    pool = (async_engine.sync_engine if async_engine else engine).pool
+    stats = dict(pool_counters)
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if fn:
+            stats[name] = fn()
+    return stats
+
+
+async def get_db():
+    if DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await run_in_threadpool(db.close)
+
+
+async def get_read_db(db=Depends(get_db)):
+    """Session for read-only handlers: routed to a replica when any are configured.
+
+    Without replicas this is the request's get_db session, so a handler using
+    both dependencies still holds one connection.
+    """
+    if not replicas.replicas:
+        yield db
+        return
+    if DB_ASYNC:
+        async with AsyncReadSessionLocal() as read_db:
+            yield read_db
+        return
+    read_db = ReadSessionLocal()
+    try:
+        yield read_db
+    finally:
+        await run_in_threadpool(read_db.close)
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """Run ``fn(session, *args, **kwargs)`` for a request session from ``get_db``.
+
+    Handler database work is written once against the sync Session API. In
+    async mode it runs on the AsyncSession's connection through ``run_sync``
+    without a thread. In sync mode it runs on Starlette's threadpool.
+    """
+    if DB_ASYNC:
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
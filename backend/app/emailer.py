@@ -1,33 +1,289 @@
 import os
+import queue
 import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
 from email.message import EmailMessage
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+from . import models, metrics
+from .database import SessionLocal
+from .log import get_logger
+
+logger = get_logger(__name__)
 
 SMTP_HOST = os.getenv("SMTP_HOST")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
 FROM_EMAIL = os.getenv("FROM_EMAIL", "noreply@example.com")
 
+# outbox delivery
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "5"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+EMAIL_LEASE_SECONDS = 120
+SMTP_TIMEOUT_SECONDS = 30
+# bodies carry verification and password-reset links
+LOG_BODIES = os.getenv("ENV", "production") == "development"
+# reuse an idle connection without a NOOP probe if it was used this recently
+SMTP_IDLE_CHECK_SECONDS = 30
 
-def send_email(to: str, subject: str, body: str) -> bool:
-    """Send email via SMTP if configured, otherwise return False."""
-    if not SMTP_HOST or not SMTP_USER or not SMTP_PASS:
-        print(f"[DEV] Email not configured. To: {to} Subject: {subject}\n{body}")
-        return False
 
+def smtp_configured() -> bool:
+    return bool(SMTP_HOST and SMTP_USER and SMTP_PASS)
+
+
+def _log_unsent(prefix: str, to: str, subject: str, body: str):
+    if LOG_BODIES:
+        logger.info("%s To: %s Subject: %s\n%s", prefix, to, subject, body)
+    else:
+        logger.info("%s To: %s Subject: %s", prefix, to, subject)
+
+
+def _build_message(to: str, subject: str, body: str) -> EmailMessage:
     msg = EmailMessage()
     msg["From"] = FROM_EMAIL
     msg["To"] = to
     msg["Subject"] = subject
     msg.set_content(body)
+    return msg
+
+
+class SMTPPool:
+    """Small pool of long-lived, authenticated SMTP connections."""
 
-    try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
+    def __init__(self, size: int):
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS)
+        if SMTP_STARTTLS:
             server.starttls()
+        if SMTP_USER:
             server.login(SMTP_USER, SMTP_PASS)
-            server.send_message(msg)
-        return True
-    except Exception as e:
-        print(f"[DEV] Failed to send email: {e}")
-        print(f"[DEV] Fallback: To: {to} Subject: {subject}\n{body}")
+        return server
+
+    def acquire(self) -> smtplib.SMTP:
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used < SMTP_IDLE_CHECK_SECONDS:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._close(server)
+
+    def release(self, server: smtplib.SMTP, broken: bool = False):
+        if broken or self._idle.qsize() >= self.size:
+            self._close(server)
+        else:
+            self._idle.put((server, time.monotonic()))
+
+    def _close(self, server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def close_all(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(server)
+
+
+smtp_pool = SMTPPool(EMAIL_WORKERS)
+
+
+def enqueue_email(db: Session, to: str, subject: str, body: str) -> bool:
+    """Add a message to the outbox in the caller's transaction.
+
+    The message is delivered by the outbox workers once the transaction
+    commits. Returns False (and logs the message; the body only with
+    ENV=development) when SMTP is not configured, so callers can keep their
+    dev fallbacks.
+    """
+    if not smtp_configured():
+        _log_unsent("Email not configured.", to, subject, body)
         return False
+    db.add(models.EmailOutbox(to_address=to, subject=subject, body=body))
+    db.info["email_enqueued"] = True
+    return True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(db):
+    if db.info.pop("email_enqueued", False):
+        outbox.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(db):
+    db.info.pop("email_enqueued", None)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), 3600))
+
+
+class OutboxWorker:
+    """Background threads that drain the email outbox over pooled SMTP connections.
+
+    Messages are leased with ``locked_until`` (and ``FOR UPDATE SKIP LOCKED`` on
+    Postgres) so several replicas can drain the same table. Failed sends are
+    retried with exponential backoff; after EMAIL_MAX_ATTEMPTS they are marked
+    dead and stay in the table as a dead-letter list.
+    """
+
+    def __init__(self, workers: int, session_factory=SessionLocal):
+        self.workers = workers
+        self.session_factory = session_factory
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self.sent = 0
+        self.failed = 0
+        self.dead = 0
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"email-outbox-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        smtp_pool.close_all()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # clear before draining so a wake-up during the batch is not lost
+            self._wake.clear()
+            try:
+                busy = self.drain_once()
+            except Exception as e:
+                logger.warning("Email outbox worker error: %s", e)
+                busy = False
+            if not busy:
+                self._wake.wait(EMAIL_POLL_SECONDS)
+
+    def _claim(self, db: Session) -> list:
+        now = datetime.utcnow()
+        Outbox = models.EmailOutbox
+        free = or_(Outbox.locked_until.is_(None), Outbox.locked_until < now)
+        candidates = (
+            db.query(Outbox.id, Outbox.to_address, Outbox.subject, Outbox.body, Outbox.attempts)
+            .filter(Outbox.status == models.EmailStatus.pending, Outbox.next_attempt_at <= now, free)
+            .order_by(Outbox.next_attempt_at)
+            .limit(EMAIL_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        lease = now + timedelta(seconds=EMAIL_LEASE_SECONDS)
+        claimed = []
+        for row in candidates:
+            # conditional update so two workers never lease the same message
+            n = db.query(Outbox).filter(Outbox.id == row.id, free).update({Outbox.locked_until: lease}, synchronize_session=False)
+            if n:
+                claimed.append(row)
+        db.commit()
+        return claimed
+
+    def drain_once(self) -> bool:
+        """Send one batch. Returns True if a full batch was claimed and sent through."""
+        Outbox = models.EmailOutbox
+        db = self.session_factory()
+        try:
+            rows = self._claim(db)
+            if not rows:
+                return False
+            # stop while the lease still holds: past it another worker may
+            # claim the same rows and send them again
+            deadline = time.monotonic() + EMAIL_LEASE_SECONDS - 2 * SMTP_TIMEOUT_SECONDS
+            sent, done = [], 0
+            server = None
+            for row in rows:
+                if time.monotonic() > deadline:
+                    break
+                t0 = time.perf_counter()
+                connected = server is not None
+                try:
+                    if server is None:
+                        server = smtp_pool.acquire()
+                        connected = True
+                    server.send_message(_build_message(row.to_address, row.subject, row.body))
+                except Exception as e:
+                    metrics.email_sent("failed", time.perf_counter() - t0)
+                    if server is not None:
+                        smtp_pool.release(server, broken=True)
+                        server = None
+                    self._failed(db, row, e)
+                    done += 1
+                    if not connected:
+                        break  # relay unreachable: don't wait out a connect timeout per message
+                    continue
+                metrics.email_sent("sent", time.perf_counter() - t0)
+                sent.append(row.id)
+                done += 1
+            if server is not None:
+                smtp_pool.release(server)
+            if sent:
+                db.query(Outbox).filter(Outbox.id.in_(sent)).update(
+                    {Outbox.status: models.EmailStatus.sent, Outbox.sent_at: datetime.utcnow(), Outbox.locked_until: None},
+                    synchronize_session=False,
+                )
+                self.sent += len(sent)
+            unsent = [row.id for row in rows[done:]]
+            if unsent:
+                # not attempted: hand them back without using up an attempt
+                db.query(Outbox).filter(Outbox.id.in_(unsent)).update({Outbox.locked_until: None}, synchronize_session=False)
+            db.commit()
+            return len(rows) == EMAIL_BATCH_SIZE and not unsent
+        finally:
+            db.close()
+
+    def _failed(self, db: Session, row, error: Exception):
+        Outbox = models.EmailOutbox
+        attempts = row.attempts + 1
+        values = {Outbox.attempts: attempts, Outbox.last_error: str(error)[:1000], Outbox.locked_until: None}
+        self.failed += 1
+        if attempts >= EMAIL_MAX_ATTEMPTS:
+            values[Outbox.status] = models.EmailStatus.dead
+            self.dead += 1
+            logger.warning("Email to %s moved to dead letters after %d attempts: %s", row.to_address, attempts, error)
+            _log_unsent("Fallback:", row.to_address, row.subject, row.body)
+        else:
+            values[Outbox.next_attempt_at] = datetime.utcnow() + retry_delay(attempts)
+            logger.warning("Email to %s failed (attempt %d), retrying: %s", row.to_address, attempts, error)
+        db.query(Outbox).filter(Outbox.id == row.id).update(values, synchronize_session=False)
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "failed": self.failed, "dead": self.dead}
+
+
+outbox = OutboxWorker(EMAIL_WORKERS)
@@ -0,0 +1,225 @@
+"""Asymmetric access-token signing keys (EdDSA / ES256) with kid-based rotation.
+
+Keys are PEM private keys in JWT_KEYS_DIR named ``<kid>.pem``; the kid
+starts with the key's creation time (``20261018T120000-3fa2c1``). Every key
+in the directory is published at ``/.well-known/jwks.json``. The signing key
+is the newest one that has been published for at least
+JWT_KEY_ACTIVATION_SECONDS, so downstream JWKS caches already hold it when
+the first token signed with it arrives. JWT_ACTIVE_KID pins a key instead.
+
+Rotation:
+
+    python -m app.keyring generate   # new key; published now, signing after the activation delay
+    python -m app.keyring list
+    python -m app.keyring prune      # delete keys retired for longer than JWT_KEY_RETIRE_SECONDS
+
+Keep retired keys until every token they signed has expired (trial tokens
+live 24h). Replicas rescan the directory every JWT_KEYS_RELOAD_SECONDS.
+
+Without JWT_KEYS_DIR tokens stay HS256 with JWT_SECRET and the JWKS is empty.
+"""
+import os
+import json
+import time
+import hashlib
+import secrets
+import argparse
+import threading
+from datetime import datetime, timezone
+import jwt
+from jwt.algorithms import OKPAlgorithm, ECAlgorithm
+from jwt.utils import base64url_encode
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, ec
+
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")
+JWT_KEY_ALG = os.getenv("JWT_KEY_ALG", "EdDSA")
+JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", "300"))
+# publish-before-use window; at least as long as downstream JWKS caches
+JWT_KEY_ACTIVATION_SECONDS = float(os.getenv("JWT_KEY_ACTIVATION_SECONDS", str(JWKS_MAX_AGE * 2)))
+# keep a key this long after its successor took over (longest token lifetime + margin)
+JWT_KEY_RETIRE_SECONDS = float(os.getenv("JWT_KEY_RETIRE_SECONDS", str(2 * 24 * 3600)))
+JWT_KEYS_RELOAD_SECONDS = float(os.getenv("JWT_KEYS_RELOAD_SECONDS", "60"))
+
+_KID_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def new_kid(now: float | None = None) -> str:
+    created = datetime.fromtimestamp(now if now is not None else time.time(), timezone.utc)
+    return f"{created.strftime(_KID_TIME_FORMAT)}-{secrets.token_hex(3)}"
+
+
+def kid_created_at(kid: str) -> float:
+    """Creation time encoded in the kid; 0 for kids not made by new_kid (active at once)."""
+    try:
+        return datetime.strptime(kid.split("-", 1)[0], _KID_TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def generate_private_key(alg: str):
+    if alg == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if alg == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    raise ValueError(f"unsupported key algorithm {alg!r} (use EdDSA or ES256)")
+
+
+class SigningKey:
+    __slots__ = ("kid", "alg", "private_key", "public_key", "created_at", "jwk")
+
+    def __init__(self, kid: str, private_key):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.created_at = kid_created_at(kid)
+        if isinstance(private_key, ed25519.Ed25519PrivateKey):
+            self.alg = "EdDSA"
+            jwk = json.loads(OKPAlgorithm.to_jwk(self.public_key))
+        elif isinstance(private_key, ec.EllipticCurvePrivateKey) and private_key.curve.name == "secp256r1":
+            self.alg = "ES256"
+            # RFC 7518: coordinates are the full 32 bytes; PyJWT 2.8 drops
+            # leading zero bytes, which strict verifiers reject
+            numbers = self.public_key.public_numbers()
+            jwk = json.loads(ECAlgorithm.to_jwk(self.public_key))
+            jwk.update(x=base64url_encode(numbers.x.to_bytes(32, "big")).decode(),
+                       y=base64url_encode(numbers.y.to_bytes(32, "big")).decode())
+        else:
+            raise ValueError(f"key {kid}: only Ed25519 and P-256 keys are supported")
+        jwk.update(kid=kid, alg=self.alg, use="sig")
+        self.jwk = jwk
+
+    @classmethod
+    def from_pem(cls, kid: str, pem: bytes) -> "SigningKey":
+        return cls(kid, serialization.load_pem_private_key(pem, password=None))
+
+    def to_pem(self) -> bytes:
+        return self.private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+
+
+class Keyring:
+    """The set of published keys, the current signing key and the JWKS document."""
+
+    def __init__(self, keys_dir: str | None = None, keys=(), active_kid: str | None = None,
+                 activation_seconds: float = JWT_KEY_ACTIVATION_SECONDS, reload_seconds: float = JWT_KEYS_RELOAD_SECONDS):
+        self.keys_dir = keys_dir
+        self.active_kid = active_kid
+        self.activation_seconds = activation_seconds
+        self.reload_seconds = reload_seconds
+        self.keys = {k.kid: k for k in keys}
+        self._lock = threading.Lock()
+        self._next_reload = 0.0
+        self._last_forced = 0.0
+        self.jwks_json = b'{"keys":[]}'
+        self.etag = ""
+        if keys_dir:
+            self.reload()
+        else:
+            self._publish()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.keys)
+
+    def reload(self):
+        """Rescan keys_dir: parse new key files, drop deleted ones."""
+        with self._lock:
+            self._next_reload = time.monotonic() + self.reload_seconds
+            try:
+                names = {n[:-4] for n in os.listdir(self.keys_dir) if n.endswith(".pem")}
+            except FileNotFoundError:
+                names = set()
+            keys = {kid: key for kid, key in self.keys.items() if kid in names}
+            for kid in names - keys.keys():
+                with open(os.path.join(self.keys_dir, f"{kid}.pem"), "rb") as f:
+                    keys[kid] = SigningKey.from_pem(kid, f.read())
+            self.keys = keys
+            self._publish()
+
+    def maybe_reload(self):
+        if self.keys_dir and time.monotonic() >= self._next_reload:
+            self.reload()
+
+    def _publish(self):
+        body = json.dumps({"keys": [k.jwk for k in sorted(self.keys.values(), key=lambda k: k.kid)]}, separators=(",", ":")).encode()
+        self.jwks_json = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    def signing_key(self, now: float | None = None) -> SigningKey | None:
+        self.maybe_reload()
+        keys = self.keys
+        if not keys:
+            return None
+        if self.active_kid and self.active_kid in keys:
+            return keys[self.active_kid]
+        now = now if now is not None else time.time()
+        ready = [k for k in keys.values() if k.created_at + self.activation_seconds <= now]
+        if ready:
+            return max(ready, key=lambda k: k.created_at)
+        # first key ever (or only fresh keys): nothing to overlap with yet
+        return min(keys.values(), key=lambda k: k.created_at)
+
+    def sign(self, payload: dict) -> str:
+        key = self.signing_key()
+        return jwt.encode(payload, key.private_key, algorithm=key.alg, headers={"kid": key.kid})
+
+    def verify(self, token: str, **kwargs) -> dict:
+        """Decode with the published key named by the token's kid; raises jwt.InvalidTokenError."""
+        self.maybe_reload()
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self.keys.get(kid)
+        if key is None and self.keys_dir and time.monotonic() - self._last_forced > 5:
+            # another replica may already sign with a key we have not loaded yet
+            self._last_forced = time.monotonic()
+            self.reload()
+            key = self.keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        return jwt.decode(token, key.public_key, algorithms=[key.alg], **kwargs)
+
+    def retired(self, now: float | None = None, retire_seconds: float = JWT_KEY_RETIRE_SECONDS) -> list:
+        """Keys whose successor has been signing for longer than ``retire_seconds``."""
+        now = now if now is not None else time.time()
+        ordered = sorted(self.keys.values(), key=lambda k: k.created_at)
+        out = []
+        for older, newer in zip(ordered, ordered[1:]):
+            if newer.created_at + self.activation_seconds + retire_seconds <= now and older.kid != self.active_kid:
+                out.append(older)
+        return out
+
+
+ring = Keyring(JWT_KEYS_DIR, active_kid=JWT_ACTIVE_KID)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage JWT signing keys in JWT_KEYS_DIR.")
+    parser.add_argument("command", choices=["generate", "list", "prune"])
+    parser.add_argument("--dir", default=JWT_KEYS_DIR)
+    parser.add_argument("--alg", default=JWT_KEY_ALG, choices=["EdDSA", "ES256"])
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error("set JWT_KEYS_DIR or pass --dir")
+    os.makedirs(args.dir, exist_ok=True)
+    keyring = Keyring(args.dir, active_kid=JWT_ACTIVE_KID)
+    if args.command == "generate":
+        key = SigningKey(new_kid(), generate_private_key(args.alg))
+        path = os.path.join(args.dir, f"{key.kid}.pem")
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key.to_pem())
+        print(f"Generated {key.alg} key {key.kid}; it signs tokens after {keyring.activation_seconds:.0f}s")
+    elif args.command == "list":
+        current = keyring.signing_key()
+        for key in sorted(keyring.keys.values(), key=lambda k: k.created_at):
+            print(f"{key.kid}  {key.alg}{'  (signing)' if key is current else ''}")
+    else:
+        for key in keyring.retired():
+            os.remove(os.path.join(args.dir, f"{key.kid}.pem"))
+            print(f"Removed {key.kid}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import logging
+import contextvars
+from datetime import datetime, timezone
+
+# LOG_FORMAT=json (default) writes one JSON object per line; LOG_FORMAT=text is
+# easier to read locally.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+# set per request by middleware.RequestContextMiddleware
+request_id = contextvars.ContextVar("request_id", default=None)
+
+# attributes every LogRecord has; anything else was passed via ``extra=``
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            out["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
+
+def configure():
+    """Attach the handler to the ``app`` logger tree (idempotent)."""
+    root = logging.getLogger("app")
+    if getattr(root, "_configured", False):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.addFilter(_RequestIdFilter())
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    # uvicorn configures the root logger; keep our lines from being printed twice
+    root.propagate = False
+    root._configured = True
+
+
+configure()
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
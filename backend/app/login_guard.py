@@ -0,0 +1,375 @@
+"""Sign-in brute-force defence that runs before any password hashing.
+
+Failed sign-ins are counted per account (the lower-cased email, whether or
+not it exists) and per client subnet (/24 for IPv4, /64 for IPv6), in
+memory or on Redis while it is reachable. ``check()`` is called before the
+user lookup. It never locks anyone out: past a threshold the attempt has to
+carry a solved proof-of-work challenge (``X-Login-Proof``), and the
+challenge gets harder as failures pile up.
+
+- account: from LOGIN_CHALLENGE_AFTER failures a solution costs the client
+  about 2**LOGIN_POW_BITS SHA-256 hashes, one bit more every three
+  failures. From LOGIN_HARDEN_AFTER failures every further one doubles the
+  work, up to 2**LOGIN_POW_MAX_BITS.
+- subnet: from LOGIN_SUBNET_CHALLENGE_AFTER failures new attempts need the
+  base challenge, never more. A subnet can be a NAT, a cloud range or, behind
+  a proxy that does not forward client addresses, every client at once.
+
+Checking a solution costs us one hash. Each challenge is bound to the
+account, expires after LOGIN_POW_TTL_SECONDS and is accepted once per
+worker. Failures are only counted for attempts that got past ``check()``,
+so every bit an attacker adds to an account's challenge costs them twice
+the work of the last one, while the owner still signs in with the right
+password after solving a single challenge.
+
+Failures are forgotten after LOGIN_FAILURE_WINDOW_SECONDS without new ones,
+and a successful sign-in clears the account's count.
+
+Emails that do not exist are kept in a negative cache for
+LOGIN_NEGATIVE_CACHE_SECONDS, so repeated guesses skip the database. They
+answer after ``equalize()``, which sleeps for about as long as a real Argon2
+verification takes, so response times do not reveal which accounts exist
+and no CPU is spent. This cache is per worker: an email signed up on
+another worker can be reported as unknown for up to the TTL.
+"""
+import os
+import time
+import hmac
+import random
+import asyncio
+import hashlib
+import secrets
+import ipaddress
+import threading
+from collections import OrderedDict
+from . import rate_limiter, utils
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+LOGIN_GUARD_ENABLED = os.getenv("LOGIN_GUARD_ENABLED", "1") == "1"
+LOGIN_CHALLENGE_AFTER = int(os.getenv("LOGIN_CHALLENGE_AFTER", "3"))
+LOGIN_HARDEN_AFTER = int(os.getenv("LOGIN_HARDEN_AFTER", "10"))
+LOGIN_SUBNET_CHALLENGE_AFTER = int(os.getenv("LOGIN_SUBNET_CHALLENGE_AFTER", "20"))
+LOGIN_FAILURE_WINDOW_SECONDS = int(os.getenv("LOGIN_FAILURE_WINDOW_SECONDS", "3600"))
+LOGIN_POW_BITS = int(os.getenv("LOGIN_POW_BITS", "16"))
+LOGIN_POW_MAX_BITS = int(os.getenv("LOGIN_POW_MAX_BITS", "20"))
+LOGIN_POW_TTL_SECONDS = int(os.getenv("LOGIN_POW_TTL_SECONDS", "120"))
+LOGIN_NEGATIVE_CACHE_SECONDS = float(os.getenv("LOGIN_NEGATIVE_CACHE_SECONDS", "60"))
+LOGIN_NEGATIVE_CACHE_SIZE = int(os.getenv("LOGIN_NEGATIVE_CACHE_SIZE", "100000"))
+LOGIN_GUARD_MAX_KEYS = int(os.getenv("LOGIN_GUARD_MAX_KEYS", "200000"))
+
+# challenge MAC key, derived so it is never the raw token-hash secret
+_POW_KEY = hmac.new(utils.TOKEN_HASH_SECRET, b"login-pow", hashlib.sha256).digest()
+
+
+def pow_bits(account_failures: int, subnet_failures: int = 0) -> int:
+    """Difficulty of the challenge the next attempt needs; 0 for none."""
+    if account_failures >= LOGIN_CHALLENGE_AFTER:
+        ramp = (min(account_failures, LOGIN_HARDEN_AFTER) - LOGIN_CHALLENGE_AFTER) // 3
+        return min(LOGIN_POW_BITS + ramp + max(account_failures - LOGIN_HARDEN_AFTER, 0), max(LOGIN_POW_MAX_BITS, LOGIN_POW_BITS))
+    if subnet_failures >= LOGIN_SUBNET_CHALLENGE_AFTER:
+        return LOGIN_POW_BITS
+    return 0
+
+
+def subnet(ip: str | None) -> str:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip or "unknown"
+    prefix = 24 if addr.version == 4 else 64
+    return str(ipaddress.ip_network(f"{addr}/{prefix}", strict=False))
+
+
+class _Failures:
+    __slots__ = ("count", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.last = 0.0
+
+
+class InMemoryTracker:
+    """Failure counts for at most ``max_keys`` keys, least recently failed evicted first."""
+
+    def __init__(self, window: float = LOGIN_FAILURE_WINDOW_SECONDS, max_keys: int = LOGIN_GUARD_MAX_KEYS):
+        self.window = window
+        self.max_keys = max_keys
+        self.data = OrderedDict()
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def status(self, keys, now: float | None = None) -> list:
+        """Failures within the window for each of ``keys``."""
+        now = now if now is not None else time.time()
+        out = []
+        with self._lock:
+            for key in keys:
+                f = self.data.get(key)
+                out.append(0 if f is None or now - f.last > self.window else f.count)
+        return out
+
+    def fail(self, keys, now: float | None = None):
+        """Count a failure for each of ``keys``."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            for key in keys:
+                f = self.data.get(key)
+                if f is None:
+                    f = self.data[key] = _Failures()
+                    if len(self.data) > self.max_keys:
+                        self.data.popitem(last=False)
+                        self.evictions += 1
+                else:
+                    self.data.move_to_end(key)
+                    if now - f.last > self.window:
+                        f.count = 0
+                f.count += 1
+                f.last = now
+
+    def clear(self, key: str):
+        with self._lock:
+            self.data.pop(key, None)
+
+
+# KEYS: tracker keys; ARGV: window. Returns nothing.
+FAIL_LUA = """
+for i = 1, #KEYS do
+    redis.call('HINCRBY', KEYS[i], 'n', 1)
+    redis.call('EXPIRE', KEYS[i], ARGV[1])
+end
+return 0
+"""
+
+# KEYS: tracker keys. Returns the failure count per key.
+STATUS_LUA = """
+local out = {}
+for i = 1, #KEYS do
+    out[i] = tonumber(redis.call('HGET', KEYS[i], 'n')) or 0
+end
+return out
+"""
+
+
+class RedisTracker:
+    """Same interface as InMemoryTracker; counts shared by all workers."""
+
+    def __init__(self, client, window: float = LOGIN_FAILURE_WINDOW_SECONDS, prefix: str = "lg"):
+        self.client = client
+        self.window = window
+        self.prefix = prefix
+        # register_script reloads the script after a Redis restart
+        self._fail = client.register_script(FAIL_LUA)
+        self._status = client.register_script(STATUS_LUA)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def status(self, keys, now: float | None = None) -> list:
+        return [int(n) for n in self._status(keys=[self._key(k) for k in keys])]
+
+    def fail(self, keys, now: float | None = None):
+        self._fail(keys=[self._key(k) for k in keys], args=[int(self.window)])
+
+    def clear(self, key: str):
+        self.client.delete(self._key(key))
+
+
+class NegativeCache:
+    """Emails known not to exist, each for ``ttl`` seconds."""
+
+    def __init__(self, ttl: float = LOGIN_NEGATIVE_CACHE_SECONDS, max_size: int = LOGIN_NEGATIVE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def add(self, email: str):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self.data[email.lower()] = time.monotonic() + self.ttl
+            self.data.move_to_end(email.lower())
+            if len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def __contains__(self, email: str) -> bool:
+        key = email.lower()
+        with self._lock:
+            expires = self.data.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self.data[key]
+                return False
+            self.hits += 1
+            return True
+
+    def discard(self, email: str):
+        with self._lock:
+            self.data.pop(email.lower(), None)
+
+
+class ProofOfWork:
+    """Stateless hashcash-style challenges: ``<expires>.<bits>.<nonce>.<mac>``.
+
+    A proof is ``<challenge>:<counter>`` where sha256 of that string starts
+    with ``bits`` zero bits. The mac binds the challenge to one account.
+    """
+
+    def __init__(self, key: bytes = _POW_KEY, ttl: int = LOGIN_POW_TTL_SECONDS, max_used: int = 100000):
+        self.key = key
+        self.ttl = ttl
+        self.max_used = max_used
+        self._used = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _mac(self, body: str, account: str) -> str:
+        return hmac.new(self.key, f"{body}|{account}".encode(), hashlib.sha256).hexdigest()[:32]
+
+    def issue(self, account: str, bits: int, now: float | None = None) -> str:
+        expires = int((now if now is not None else time.time()) + self.ttl)
+        body = f"{expires}.{bits}.{secrets.token_hex(8)}"
+        return f"{body}.{self._mac(body, account)}"
+
+    def check(self, proof: str | None, account: str, min_bits: int, now: float | None = None) -> bool:
+        if not proof:
+            return False
+        challenge, _, counter = proof.rpartition(":")
+        parts = challenge.split(".")
+        if len(parts) != 4 or not counter or len(counter) > 32:
+            return False
+        expires, bits, _, mac = parts
+        body = challenge[: -len(mac) - 1]
+        try:
+            expires, bits = int(expires), int(bits)
+        except ValueError:
+            return False
+        now = now if now is not None else time.time()
+        if bits < min_bits or expires < now or not hmac.compare_digest(mac, self._mac(body, account)):
+            return False
+        if leading_zero_bits(hashlib.sha256(proof.encode()).digest()) < bits:
+            return False
+        with self._lock:
+            if challenge in self._used:
+                return False
+            self._used[challenge] = expires
+            # challenges are issued in expiry order, so the oldest entries expire first
+            while self._used and (len(self._used) > self.max_used or next(iter(self._used.values())) < now):
+                self._used.popitem(last=False)
+        return True
+
+
+def leading_zero_bits(digest: bytes) -> int:
+    n = 0
+    for byte in digest:
+        if byte:
+            return n + 8 - byte.bit_length()
+        n += 8
+    return n
+
+
+def solve(challenge: str) -> str:
+    """Reference solver (the frontend does the same in JavaScript)."""
+    bits = int(challenge.split(".")[1])
+    counter = 0
+    while True:
+        proof = f"{challenge}:{counter}"
+        if leading_zero_bits(hashlib.sha256(proof.encode()).digest()) >= bits:
+            return proof
+        counter += 1
+
+
+class Verdict:
+    __slots__ = ("action", "challenge")
+
+    def __init__(self, action: str, challenge: str | None = None):
+        self.action = action  # allow | challenge
+        self.challenge = challenge
+
+
+_ALLOW = Verdict("allow")
+
+
+class LoginGuard:
+    def __init__(self, tracker, pow: ProofOfWork | None = None, unknown: NegativeCache | None = None):
+        self.tracker = tracker
+        self.pow = pow or ProofOfWork()
+        self.unknown = unknown or NegativeCache()
+        self.counts = {"allowed": 0, "challenged": 0, "proofs_accepted": 0, "failures": 0, "errors": 0}
+        # running estimate of one Argon2 verification, used by equalize()
+        self.verify_seconds = 0.1
+
+    @property
+    def remote(self) -> bool:
+        """True when tracker calls are Redis round trips (run them off the event loop)."""
+        return isinstance(self.tracker, RedisTracker)
+
+    def _keys(self, email: str, ip: str | None):
+        return f"acct:{email.lower()}", f"net:{subnet(ip)}"
+
+    def check(self, email: str, ip: str | None, proof: str | None = None) -> Verdict:
+        try:
+            acct_n, net_n = self.tracker.status(self._keys(email, ip))
+        except Exception as e:
+            # like the rate limiter: fail open; the password pool still bounds CPU
+            logger.warning("Login guard unavailable, allowing attempt: %s", e)
+            self.counts["errors"] += 1
+            return _ALLOW
+        bits = pow_bits(acct_n, net_n)
+        if not bits:
+            self.counts["allowed"] += 1
+            return _ALLOW
+        account = email.lower()
+        if self.pow.check(proof, account, bits):
+            self.counts["proofs_accepted"] += 1
+            return _ALLOW
+        self.counts["challenged"] += 1
+        return Verdict("challenge", challenge=self.pow.issue(account, bits))
+
+    def failed(self, email: str, ip: str | None):
+        account_key, net_key = self._keys(email, ip)
+        self.counts["failures"] += 1
+        try:
+            self.tracker.fail([account_key, net_key])
+        except Exception as e:
+            logger.warning("Login guard could not record a failure: %s", e)
+            self.counts["errors"] += 1
+
+    def succeeded(self, email: str):
+        try:
+            self.tracker.clear(self._keys(email, None)[0])
+        except Exception as e:
+            logger.warning("Login guard could not clear failures: %s", e)
+            self.counts["errors"] += 1
+
+    def observe_verify(self, seconds: float):
+        self.verify_seconds += 0.1 * (seconds - self.verify_seconds)
+
+    async def equalize(self):
+        """Wait about as long as a password verification, without using CPU."""
+        await asyncio.sleep(self.verify_seconds * random.uniform(0.9, 1.1))
+
+    def stats(self) -> dict:
+        out = dict(self.counts)
+        out["unknown_email_hits"] = self.unknown.hits
+        out["unknown_emails_cached"] = len(self.unknown.data)
+        out["verify_estimate_seconds"] = self.verify_seconds
+        if isinstance(self.tracker, InMemoryTracker):
+            out["tracked_keys"] = len(self.tracker.data)
+            out["evictions"] = self.tracker.evictions
+        return out
+
+
+_memory_tracker = InMemoryTracker()
+guard = LoginGuard(_memory_tracker)
+
+
+def _switch_tracker(client):
+    # shared counts while Redis is up, this worker's own while it is down
+    guard.tracker = RedisTracker(client) if client else _memory_tracker
+
+
+rate_limiter.health.on_change(_switch_tracker)
@@ -1,14 +1,24 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 import os
-from .database import engine, Base
-from . import models
+from starlette.concurrency import run_in_threadpool
+from . import models, emailer, retention, metrics, activity, keyring, database, rate_limiter, schema, revocation
+from .middleware import RequestContextMiddleware, SecurityHeadersMiddleware, RateLimitMiddleware, ReadYourWritesMiddleware
 from .auth import router as auth_router
+from .log import get_logger
+
+logger = get_logger(__name__)
 
 app = FastAPI(title="Auth Prototype")
 
 frontend_origins = [os.getenv("FRONTEND_URL", "http://localhost:9005")]
 
+# add_middleware wraps what was added before, so requests pass through these
+# bottom-up: request context, security headers, CORS, then rate limiting (inside
+# CORS so 429s still carry CORS headers); replica routing state innermost
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     # Allow only the configured frontend origin when credentials are included.
@@ -16,28 +26,69 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # pagination cursor for GET /api/auth/sessions; sign-in challenge and back-off
+    expose_headers=["X-Next-Cursor", "X-Login-Challenge", "Retry-After"],
 )
 
+app.add_middleware(SecurityHeadersMiddleware)
+
 app.include_router(auth_router)
 
 @app.on_event("startup")
-def startup():
-    Base.metadata.create_all(bind=engine)
+async def startup():
+    # nothing here waits on Redis: it connects in the background and the
+    # limiters switch over when it answers
+    rate_limiter.health.start()
+    await run_in_threadpool(schema.check)
+    try:
+        # load revocations before serving so no revoked token slips through a fresh worker
+        await run_in_threadpool(revocation.denylist.load)
+    except Exception as e:
+        logger.warning("Loading token revocations failed, retrying in the background: %s", e)
+    revocation.denylist.start()
+    if emailer.smtp_configured():
+        emailer.outbox.start()
+    if activity.ACTIVITY_ENABLED:
+        activity.buffer.start()
+    database.replicas.start()
+    if retention.RETENTION_ENABLED:
+        app.state.retention_task = asyncio.create_task(retention.run_forever())
+
+@app.on_event("shutdown")
+async def shutdown():
+    task = getattr(app.state, "retention_task", None)
+    if task:
+        task.cancel()
+    emailer.outbox.stop()
+    activity.buffer.stop()
+    database.replicas.stop()
+    revocation.denylist.stop()
+    rate_limiter.health.stop()
 
 @app.get("/")
 def root():
     return {"status": "ok"}
 
 
-@app.middleware("http")
-async def security_headers_middleware(request, call_next):
-    response = await call_next(request)
-    # HSTS - in production only
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["Referrer-Policy"] = "no-referrer"
-    response.headers["Permissions-Policy"] = "geolocation=()"
-    # minimal CSP - tune for your app
-    response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'"
-    return response
+@app.get("/.well-known/jwks.json", include_in_schema=False)
+async def jwks(request: Request):
+    # prebuilt bytes; downstream verifiers cache for max-age and revalidate by ETag
+    ring = keyring.ring
+    ring.maybe_reload()
+    headers = {"Cache-Control": f"public, max-age={keyring.JWKS_MAX_AGE}", "ETag": ring.etag}
+    if request.headers.get("if-none-match") == ring.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(ring.jwks_json, media_type="application/json", headers=headers)
+
+
+if metrics.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        # async so the threadpool gauges are read from the event loop
+        body, content_type = metrics.render()
+        return Response(body, media_type=content_type)
+
+
+if metrics.METRICS_ENABLED:
+    # added last so it wraps every other middleware and sees their latency
+    app.add_middleware(RequestContextMiddleware)
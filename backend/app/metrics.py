@@ -0,0 +1,196 @@
+"""Prometheus metrics and per-request stage timings.
+
+Everything is recorded in-process with prometheus_client and exposed at
+``/metrics``:
+
+- ``http_request_duration_seconds{method,route,status}``: recorded by
+  middleware.RequestContextMiddleware. ``route`` is the route template, so
+  path parameters do not create new series.
+- ``auth_stage_duration_seconds{stage}``: Argon2 hash/verify and queue wait,
+  JWT sign/verify, rate-limit checks.
+- ``db_query_duration_seconds{operation}``: every statement, via cursor
+  events on the engine.
+- ``rate_limit_decisions_total{backend,decision}`` and
+  ``email_send_duration_seconds{result}``.
+- Gauges read at scrape time: threadpool, password pool, DB pool and replicas, principal
+  cache, email outbox, session activity buffer, sign-in guard, token denylist,
+  refresh grace cache and retention stats.
+
+Stage timings are also added to the current request's totals, so slow
+requests can be logged with a breakdown (see LOG_SLOW_REQUEST_MS).
+
+When uvicorn/gunicorn runs several worker processes, set
+PROMETHEUS_MULTIPROC_DIR so ``/metrics`` aggregates across them. The
+scrape-time gauges then cover only the worker that served the scrape.
+"""
+import os
+import time
+import contextvars
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+_FAST_BUCKETS = (.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+_REQUEST_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"], buckets=_REQUEST_BUCKETS)
+STAGE_LATENCY = Histogram("auth_stage_duration_seconds", "Time spent in one stage of request handling", ["stage"], buckets=_FAST_BUCKETS)
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Database statement latency", ["operation"], buckets=_FAST_BUCKETS)
+RATE_LIMIT_DECISIONS = Counter("rate_limit_decisions", "Rate limiter decisions; error means Redis failed and the request was allowed", ["backend", "decision"])
+EMAIL_SEND_LATENCY = Histogram("email_send_duration_seconds", "SMTP send latency", ["result"], buckets=_REQUEST_BUCKETS)
+
+# per-request stage totals in seconds, set by the request middleware
+request_stages = contextvars.ContextVar("request_stages", default=None)
+
+# resolve label children once; .labels() costs a lock and a dict lookup
+_stage_children = {}
+_db_children = {op: DB_QUERY_LATENCY.labels(op) for op in ("select", "insert", "update", "delete", "other")}
+
+
+def observe_stage(stage: str, seconds: float):
+    child = _stage_children.get(stage)
+    if child is None:
+        child = _stage_children[stage] = STAGE_LATENCY.labels(stage)
+    child.observe(seconds)
+    stages = request_stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+class timer:
+    """``with metrics.timer("jwt_sign"): ...`` records the block as a stage."""
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.stage, time.perf_counter() - self.t0)
+        return False
+
+
+def rate_limit_decision(backend: str, decision: str, seconds: float):
+    RATE_LIMIT_DECISIONS.labels(backend, decision).inc()
+    observe_stage("rate_limit", seconds)
+
+
+def email_sent(result: str, seconds: float):
+    EMAIL_SEND_LATENCY.labels(result).observe(seconds)
+
+
+def instrument_engine(sync_engine):
+    """Time every statement executed on ``sync_engine``."""
+    if not METRICS_ENABLED:
+        return
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_t0 = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        t0 = getattr(context, "_metrics_t0", None)
+        if t0 is None:
+            return
+        elapsed = time.perf_counter() - t0
+        op = statement[:6].lower()
+        (_db_children.get(op) or _db_children["other"]).observe(elapsed)
+        stages = request_stages.get()
+        if stages is not None:
+            stages["db"] = stages.get("db", 0.0) + elapsed
+
+
+def _threadpool_stats():
+    # Starlette's run_in_threadpool shares anyio's default limiter; only
+    # readable from the event loop thread
+    try:
+        from anyio import to_thread
+
+        limiter = to_thread.current_default_thread_limiter()
+        s = limiter.statistics()
+    except Exception:
+        return None
+    return {"busy": s.borrowed_tokens, "capacity": limiter.total_tokens, "waiting": s.tasks_waiting}
+
+
+class _StatsCollector:
+    """Exports the stats() dicts the app already keeps, read at scrape time."""
+
+    def describe(self):
+        # keeps the registry from calling collect() at import time
+        return []
+
+    def collect(self):
+        from . import password_pool, principal_cache, database, emailer, retention, rate_limiter, activity, login_guard, revocation, refresh_grace
+
+        def gauges(prefix, doc, values, counters=()):
+            for key, value in values.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                family = CounterMetricFamily if key in counters else GaugeMetricFamily
+                yield family(name, f"{doc}: {key}", value=value)
+
+        tp = _threadpool_stats()
+        if tp:
+            yield from gauges("threadpool", "Starlette threadpool", tp)
+        yield from gauges("password_pool", "Argon2 hashing pool", password_pool.pool.stats(), counters=("rejected",))
+        yield from gauges("db_pool", "Database connection pool", database.pool_stats(),
+                          counters=("checkouts", "overflow_checkouts", "invalidated"))
+        if database.replicas.replicas:
+            yield from gauges("db_replicas", "Read replicas", database.replicas.stats(),
+                              counters=("replica_reads", "primary_reads", "errors"))
+        yield from gauges("principal_cache", "Principal cache", principal_cache.cache.stats(),
+                          counters=("hits", "redis_hits", "misses", "invalidations"))
+        yield from gauges("email_outbox", "Email outbox", emailer.outbox.stats(), counters=("sent", "failed", "dead"))
+        yield from gauges("session_activity", "Session activity buffer", activity.buffer.stats(),
+                          counters=("recorded", "dropped", "flushes", "rows_written"))
+        yield from gauges("login_guard", "Sign-in brute-force guard", login_guard.guard.stats(),
+                          counters=("allowed", "challenged", "proofs_accepted", "failures", "errors",
+                                    "unknown_email_hits", "evictions"))
+        yield from gauges("token_revocation", "Access-token denylist", revocation.denylist.stats(),
+                          counters=("checks", "revoked", "filter_hits", "false_positives", "syncs", "errors"))
+        yield from gauges("refresh_grace", "Concurrent refresh grace cache", refresh_grace.cache.stats(),
+                          counters=("stored", "hits", "misses", "reuse_detected"))
+        yield from gauges("retention", "Retention sweeper",
+                          {"runs": retention.stats["runs"], "last_duration_seconds": retention.stats["last_duration_seconds"]},
+                          counters=("runs",))
+        rows = CounterMetricFamily("retention_rows_deleted", "Rows deleted by the retention sweeper", labels=["table"])
+        for table, n in retention.stats["rows_deleted"].items():
+            rows.add_metric([table], n)
+        yield rows
+        health = rate_limiter.health
+        if health.url:
+            yield from gauges("redis", "Redis connection", {"up": int(health.state == "up"), "transitions": health.transitions},
+                              counters=("transitions",))
+        evictions = CounterMetricFamily("rate_limit_evictions", "Keys evicted from in-memory limiters", labels=["limiter"])
+        for name in ("ip_limiter", "auth_limiter"):
+            lim = getattr(rate_limiter, name)
+            if hasattr(lim, "evictions"):
+                evictions.add_metric([name], lim.evictions)
+        yield evictions
+
+
+_stats_collector = _StatsCollector()
+if METRICS_ENABLED:
+    REGISTRY.register(_stats_collector)
+
+
+def render() -> tuple:
+    """Return (body, content_type) for the /metrics endpoint."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_stats_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
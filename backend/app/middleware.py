@@ -0,0 +1,179 @@
+import os
+import re
+import time
+import uuid
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from . import metrics, rate_limiter, database
+from .log import get_logger, request_id
+
+logger = get_logger(__name__)
+
+# requests slower than this are logged with their per-stage breakdown
+LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", "1000"))
+
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestContextMiddleware:
+    """Pure ASGI middleware: request IDs, per-route latency and slow-request logs.
+
+    Takes ``X-Request-ID`` from the client when it looks sane, otherwise makes
+    one, and echoes it on the response. Latency is labelled with the matched
+    route template (``/api/auth/sessions``), or ``unmatched`` for 404s, so
+    scanners cannot create unbounded series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            # rejected by RateLimitMiddleware before routing
+            if (scope["method"], scope["path"]) in rate_limiter.ROUTE_LIMITS:
+                return scope["path"]
+            return "unmatched"
+        path = self._routes.get(endpoint)
+        if path is None:
+            router = scope.get("router")
+            for route in getattr(router, "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            else:
+                path = "unmatched"
+            self._routes[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        rid = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                rid = value.decode("latin-1")
+                break
+        if not rid or not _VALID_REQUEST_ID.match(rid):
+            rid = uuid.uuid4().hex
+        rid_token = request_id.set(rid)
+        stages = {}
+        stages_token = metrics.request_stages.set(stages)
+        status = 500
+        raw_rid = rid.encode()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", ())) + [(b"x-request-id", raw_rid)]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            route = self._route(scope)
+            metrics.HTTP_LATENCY.labels(scope["method"], route, str(status)).observe(elapsed)
+            if elapsed * 1000 >= LOG_SLOW_REQUEST_MS:
+                logger.warning("Slow request", extra={
+                    "method": scope["method"], "route": route, "status": status,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "stages_ms": {k: round(v * 1000, 2) for k, v in stages.items()},
+                })
+            metrics.request_stages.reset(stages_token)
+            request_id.reset(rid_token)
+
+
+SECURITY_HEADERS = [
+    # HSTS - in production only
+    ("Strict-Transport-Security", "max-age=31536000; includeSubDomains"),
+    ("X-Frame-Options", "DENY"),
+    ("X-Content-Type-Options", "nosniff"),
+    ("Referrer-Policy", "no-referrer"),
+    ("Permissions-Policy", "geolocation=()"),
+    # minimal CSP - tune for your app
+    ("Content-Security-Policy", "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'"),
+]
+
+
+class SecurityHeadersMiddleware:
+    """Appends SECURITY_HEADERS, encoded once, to every HTTP response."""
+
+    def __init__(self, app, headers=SECURITY_HEADERS):
+        self.app = app
+        self.raw_headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        raw_headers = self.raw_headers
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + raw_headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+_TOO_MANY_REQUESTS = JSONResponse({"detail": "Too many requests"}, status_code=429)
+
+
+class RateLimitMiddleware:
+    """Applies rate_limiter.ROUTE_LIMITS before routing, so rejected requests
+    never have their body read, parsed or validated."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (scope["method"], scope["path"]) in rate_limiter.ROUTE_LIMITS:
+            client = scope.get("client")
+            ip = client[0] if client else "unknown"
+            if rate_limiter.redis_client:
+                # network round trip; keep it off the event loop
+                allowed = await run_in_threadpool(rate_limiter.check_route, scope["method"], scope["path"], ip)
+            else:
+                allowed = rate_limiter.check_route(scope["method"], scope["path"], ip)
+            if not allowed:
+                return await _TOO_MANY_REQUESTS(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+_STICKY_COOKIE = b"db_primary="
+
+
+class ReadYourWritesMiddleware:
+    """Read-your-writes for read replicas across a request chain.
+
+    Gives each request a database.RouteState. When a request commits on the
+    primary, the response sets a short-lived ``db_primary`` cookie, and the
+    client's requests carrying it read from the primary for
+    DB_STICKY_SECONDS, until the replicas have caught up. Does nothing when
+    no replicas are configured.
+    """
+
+    def __init__(self, app, sticky_seconds: int = database.DB_STICKY_SECONDS):
+        self.app = app
+        self.set_cookie = (b"set-cookie", b"db_primary=1; Max-Age=%d; Path=/; HttpOnly; SameSite=Lax" % sticky_seconds)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not database.replicas.replicas:
+            return await self.app(scope, receive, send)
+        sticky = any(k == b"cookie" and _STICKY_COOKIE in v for k, v in scope["headers"])
+        state = database.RouteState(sticky)
+        token = database.route_state.set(state)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state.wrote:
+                message["headers"] = list(message.get("headers", ())) + [self.set_cookie]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            database.route_state.reset(token)
@@ -1,7 +1,7 @@
 import enum
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Boolean, DateTime, Enum, ForeignKey, Text
+from sqlalchemy import Column, String, Boolean, DateTime, Enum, ForeignKey, Text, CHAR, Index, Integer
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -27,14 +27,36 @@ class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
-    token_hash = Column(Text, nullable=False)
+    # hex HMAC-SHA256 from utils.hash_token, always 64 chars
+    token_hash = Column(CHAR(64), nullable=False)
+    # user agent; last_* are written behind by app.activity
     device_info = Column(Text, nullable=True)
     expires_at = Column(DateTime, nullable=False)
     revoked = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime, nullable=True)
+    last_ip = Column(String(45), nullable=True)
+    # rotation lineage: every token since one sign-in shares family_id (the
+    # first token's id; NULL on rows from before families, whose family is
+    # their own id). rotated_at/replaced_by are set when refresh rotates it.
+    family_id = Column(String(36), nullable=True)
+    rotated_at = Column(DateTime, nullable=True)
+    replaced_by = Column(String(36), nullable=True)
 
     user = relationship("User", back_populates="refresh_tokens")
 
+    __table_args__ = (
+        Index("ix_refresh_tokens_token_hash", "token_hash", unique=True),
+        Index("ix_refresh_tokens_user_id_revoked", "user_id", "revoked"),
+        # keyset pagination of /sessions
+        Index("ix_refresh_tokens_user_id_created_at_id", "user_id", "created_at", "id"),
+        # retention sweeps
+        Index("ix_refresh_tokens_expires_at", "expires_at"),
+        Index("ix_refresh_tokens_revoked_created_at", "revoked", "created_at"),
+        # revoking a family on reuse
+        Index("ix_refresh_tokens_family_id", "family_id"),
+    )
+
 class TokenType(enum.Enum):
     email_verification = "email_verification"
     password_reset = "password_reset"
@@ -45,8 +67,58 @@ class OneTimeToken(Base):
     __tablename__ = "one_time_tokens"
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
-    token_hash = Column(Text, nullable=False)
+    token_hash = Column(CHAR(64), nullable=False)
     type = Column(Enum(TokenType), nullable=False)
     expires_at = Column(DateTime, nullable=False)
     used = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_one_time_tokens_token_hash", "token_hash", unique=True),
+        Index("ix_one_time_tokens_token_hash_type", "token_hash", "type"),
+        Index("ix_one_time_tokens_expires_at", "expires_at"),
+    )
+
+class EmailStatus(enum.Enum):
+    pending = "pending"
+    sent = "sent"
+    dead = "dead"
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    to_address = Column(String, nullable=False)
+    subject = Column(Text, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(Enum(EmailStatus), nullable=False, default=EmailStatus.pending)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # set while a worker holds the message; expired leases are picked up again
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+class TokenRevocation(Base):
+    """A revoked access token (kind "jti"), session (kind "sid", every access
+    token carrying it) or user cutoff (kind "user": tokens issued before
+    valid_after). Read by app.revocation; kept until expires_at, when no token
+    it could match is valid any more."""
+    __tablename__ = "token_revocations"
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = Column(String(8), nullable=False)
+    value = Column(String(64), nullable=False)
+    valid_after = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # workers poll for new rows and confirm filter hits by value
+        Index("ix_token_revocations_created_at", "created_at"),
+        Index("ix_token_revocations_value", "value"),
+        Index("ix_token_revocations_expires_at", "expires_at"),
+    )
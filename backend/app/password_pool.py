@@ -0,0 +1,91 @@
+import os
+import asyncio
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from . import utils, metrics
+
+# Argon2 runs in C and releases the GIL, so a dedicated thread pool gives real
+# parallelism without competing with Starlette's shared threadpool.
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_POOL_MAX_PENDING = int(os.getenv("PASSWORD_POOL_MAX_PENDING", str(PASSWORD_POOL_WORKERS * 8)))
+# upper bound for Argon2 memory held by running hashes, in KiB
+PASSWORD_POOL_MEMORY_KIB = int(os.getenv("PASSWORD_POOL_MEMORY_MB", "512")) * 1024
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing pool cannot accept more work."""
+
+
+class PasswordPool:
+    def __init__(self, workers: int, max_pending: int, memory_budget_kib: int):
+        cost = utils.ph.memory_cost
+        # never run more hashes at once than the memory budget allows
+        self.workers = max(1, min(workers, memory_budget_kib // cost))
+        self.max_pending = max_pending
+        self.memory_budget_kib = memory_budget_kib
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="argon2")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.memory_in_use_kib = 0
+        self.rejected = 0
+
+    def _admit(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordPoolBusy()
+            self.pending += 1
+
+    def _done(self, _fut):
+        with self._lock:
+            self.pending -= 1
+
+    def _run(self, stage, queued_at, fn, *args):
+        cost = utils.ph.memory_cost
+        with self._lock:
+            self.running += 1
+            self.memory_in_use_kib += cost
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.memory_in_use_kib -= cost
+            if stage:
+                metrics.observe_stage("argon2_queue", start - queued_at)
+                metrics.observe_stage(stage, time.perf_counter() - start)
+
+    async def submit(self, fn, *args, stage: str | None = None):
+        self._admit()
+        # carry the request context so timings land in the request's stage totals
+        ctx = contextvars.copy_context()
+        fut = self._executor.submit(ctx.run, self._run, stage, time.perf_counter(), fn, *args)
+        # release the slot when the work finishes, even if the awaiting request is cancelled
+        fut.add_done_callback(self._done)
+        return await asyncio.wrap_future(fut)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "running": self.running,
+                "queued": self.pending - self.running,
+                "memory_in_use_kib": self.memory_in_use_kib,
+                "rejected": self.rejected,
+            }
+
+
+pool = PasswordPool(PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_PENDING, PASSWORD_POOL_MEMORY_KIB)
+
+
+async def hash_password(password: str) -> str:
+    return await pool.submit(utils.hash_password, password, stage="argon2_hash")
+
+
+async def verify_password(hash: str, password: str) -> bool:
+    return await pool.submit(utils.verify_password, hash, password, stage="argon2_verify")
@@ -0,0 +1,110 @@
+"""Argon2id cost profiles.
+
+ARGON2_PROFILE picks the parameters new password hashes are made with:
+
+- ``test``: minimal cost, for the test suite and CI only.
+- ``standard`` (default): time_cost=3, memory 64 MiB, parallelism 2.
+- ``strong``: time_cost=4, memory 128 MiB, parallelism 2.
+
+ARGON2_TIME_COST, ARGON2_MEMORY_KIB and ARGON2_PARALLELISM override single
+values of the chosen profile. ``calibrate`` measures this machine and prints
+the overrides that reach a target verification time:
+
+    python -m app.password_profiles calibrate --target-ms 250 --max-memory-mb 128
+    python -m app.password_profiles show
+
+Every hash records its own parameters, so changing the profile never
+invalidates existing hashes. After a successful sign-in, a hash made with
+weaker parameters is upgraded in the background (see auth.signin); lowering
+the parameters never re-hashes stored passwords down. ARGON2_PROFILE=test
+refuses to start with ENV=production.
+"""
+import os
+import time
+import argparse
+from argon2 import PasswordHasher, Type
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+PROFILES = {
+    "test": {"time_cost": 1, "memory_cost": 64, "parallelism": 1},
+    "standard": {"time_cost": 3, "memory_cost": 65536, "parallelism": 2},
+    "strong": {"time_cost": 4, "memory_cost": 131072, "parallelism": 2},
+}
+
+ARGON2_PROFILE = os.getenv("ARGON2_PROFILE", "standard")
+if ARGON2_PROFILE == "test" and os.getenv("ENV", "production") == "production":
+    # new passwords would be stored at test strength
+    raise RuntimeError("ARGON2_PROFILE=test is for tests only; refusing to run with ENV=production")
+
+
+def profile_parameters(name: str = ARGON2_PROFILE) -> dict:
+    if name not in PROFILES:
+        raise ValueError(f"unknown ARGON2_PROFILE {name!r} (choose from {', '.join(PROFILES)})")
+    params = dict(PROFILES[name])
+    for key, var in (("time_cost", "ARGON2_TIME_COST"), ("memory_cost", "ARGON2_MEMORY_KIB"), ("parallelism", "ARGON2_PARALLELISM")):
+        if os.getenv(var):
+            params[key] = int(os.getenv(var))
+    return params
+
+
+def make_hasher(params: dict | None = None) -> PasswordHasher:
+    return PasswordHasher(type=Type.ID, **(params or profile_parameters()))
+
+
+def measure_ms(params: dict, rounds: int = 3) -> float:
+    """Best-of-``rounds`` verification time for ``params``, in milliseconds."""
+    hasher = make_hasher(params)
+    encoded = hasher.hash("calibration password")
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        hasher.verify(encoded, "calibration password")
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def calibrate(target_ms: float, max_memory_kib: int, parallelism: int = 2, min_memory_kib: int = 19456,
+              max_time_cost: int = 10, measure=measure_ms) -> dict:
+    """Strongest parameters whose verification stays within ``target_ms``.
+
+    Memory is the costlier resource for an attacker, so it is maximised
+    first: start at ``max_memory_kib`` with time_cost=1 and halve the memory
+    until one pass fits (not below ``min_memory_kib``, the OWASP minimum).
+    Then raise time_cost while the target still holds.
+    """
+    params = {"time_cost": 1, "memory_cost": max_memory_kib, "parallelism": parallelism}
+    while params["memory_cost"] // 2 >= min_memory_kib and measure(params) > target_ms:
+        params["memory_cost"] //= 2
+    while params["time_cost"] < max_time_cost:
+        candidate = dict(params, time_cost=params["time_cost"] + 1)
+        if measure(candidate) > target_ms:
+            break
+        params = candidate
+    return params
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Argon2 cost profiles.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cal = sub.add_parser("calibrate", help="pick parameters for a target verification time on this machine")
+    cal.add_argument("--target-ms", type=float, default=250)
+    cal.add_argument("--max-memory-mb", type=int, default=128)
+    cal.add_argument("--parallelism", type=int, default=2)
+    sub.add_parser("show", help="print the active parameters and their cost here")
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        params = profile_parameters()
+        print(f"ARGON2_PROFILE={ARGON2_PROFILE}: {params} -> {measure_ms(params):.0f} ms per verification")
+        return
+    params = calibrate(args.target_ms, args.max_memory_mb * 1024, args.parallelism)
+    print(f"# {measure_ms(params):.0f} ms per verification (target {args.target_ms:.0f} ms)")
+    print(f"ARGON2_TIME_COST={params['time_cost']}")
+    print(f"ARGON2_MEMORY_KIB={params['memory_cost']}")
+    print(f"ARGON2_PARALLELISM={params['parallelism']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from . import models, rate_limiter
+
+# Upper bound on how long a suspended/deleted user can keep using an access
+# token on a worker that did not see the change itself.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_REDIS = os.getenv("PRINCIPAL_CACHE_REDIS", "1") == "1"
+
+
+class Principal:
+    """The subset of a User that authenticated handlers need."""
+    __slots__ = ("id", "email", "email_verified", "status")
+
+    def __init__(self, id: str, email: str, email_verified: bool, status: models.UserStatus):
+        self.id = id
+        self.email = email
+        self.email_verified = email_verified
+        self.status = status
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(user.id, user.email, bool(user.email_verified), user.status or models.UserStatus.active)
+
+    def dumps(self) -> str:
+        return json.dumps([self.id, self.email, self.email_verified, self.status.value])
+
+    @classmethod
+    def loads(cls, raw) -> "Principal":
+        id, email, verified, status = json.loads(raw)
+        return cls(id, email, verified, models.UserStatus(status))
+
+
+def _keys(user_id: str):
+    # entry and invalidation version share a hash tag, so one Redis Cluster slot
+    return f"principal:{{{user_id}}}", f"principal:{{{user_id}}}:v"
+
+
+# Store the entry only if no invalidation bumped the user's version since the
+# caller's lookup, so a principal loaded before a suspension is not put back
+# after the invalidation deleted it.
+# KEYS: entry, version; ARGV: value, ttl, version seen at lookup ('' for none).
+PUT_IF_CURRENT_LUA = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[3] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+
+class PrincipalCache:
+    def __init__(self, ttl: float, maxsize: int, use_redis: bool = True):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.use_redis = use_redis
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _redis(self):
+        return rate_limiter.redis_client if self.use_redis else None
+
+    def get_local(self, user_id: str):
+        """In-process lookup only; never waits on Redis."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry and entry[0] > now:
+                self._data.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+        return None
+
+    def lookup(self, user_id: str):
+        """Return (principal or None, ticket); pass the ticket to put() after loading on a miss."""
+        principal = self.get_local(user_id)
+        if principal is not None:
+            return principal, None
+        with self._lock:
+            generation = self.invalidations
+        version = None
+        r = self._redis()
+        if r:
+            try:
+                raw, version = r.mget(_keys(user_id))
+                version = version.decode() if version else ""
+            except Exception:
+                raw, version = None, None
+            if raw:
+                principal = Principal.loads(raw)
+                self._store(principal)
+                with self._lock:
+                    self.redis_hits += 1
+                return principal, None
+        with self._lock:
+            self.misses += 1
+        return None, (generation, version)
+
+    def get(self, user_id: str):
+        return self.lookup(user_id)[0]
+
+    def _store(self, principal: Principal, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.invalidations:
+                return
+            self._data[principal.id] = (time.monotonic() + self.ttl, principal)
+            self._data.move_to_end(principal.id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def put(self, principal: Principal, ticket=None):
+        """Cache ``principal``; with the ticket from the lookup() that missed,
+        skip it if the user was invalidated while it was being loaded."""
+        generation, version = ticket or (None, "")
+        with self._lock:
+            if generation is not None and generation != self.invalidations:
+                return
+        r = self._redis()
+        if r and version is not None:
+            try:
+                key, version_key = _keys(principal.id)
+                if ticket is None:
+                    r.set(key, principal.dumps(), ex=max(1, int(self.ttl)))
+                elif not r.eval(PUT_IF_CURRENT_LUA, 2, key, version_key, principal.dumps(), max(1, int(self.ttl)), version):
+                    # invalidated on another worker since the lookup
+                    return
+            except Exception:
+                pass
+        self._store(principal, generation)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._data.pop(user_id, None)
+            self.invalidations += 1
+        r = self._redis()
+        if r:
+            key, version_key = _keys(user_id)
+            try:
+                pipe = r.pipeline()
+                pipe.delete(key)
+                pipe.incr(version_key)
+                # outlives any load still in flight, which must see the bump
+                pipe.expire(version_key, max(1, int(self.ttl)) * 10)
+                pipe.execute()
+            except Exception:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+cache = PrincipalCache(PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_REDIS)
+
+
+# Any ORM change to a user's status or password drops the cached principal once
+# the transaction commits, so suspension/deletion/password reset take effect on
+# this worker immediately and on others within PRINCIPAL_CACHE_TTL.
+_WATCHED = ("status", "password_hash", "email", "email_verified")
+
+
+def invalidate_on_commit(db: Session, user_id: str):
+    """Drop the cached principal once ``db`` commits; for bulk UPDATEs that bypass ORM events."""
+    db.info.setdefault("principal_invalidate", set()).add(user_id)
+
+
+def _mark_dirty(target: models.User):
+    db = object_session(target)
+    if db is not None:
+        invalidate_on_commit(db, target.id)
+
+
+@event.listens_for(models.User, "after_update")
+def _user_updated(mapper, connection, target):
+    state = target._sa_instance_state
+    if any(state.attrs[name].history.has_changes() for name in _WATCHED):
+        _mark_dirty(target)
+
+
+@event.listens_for(models.User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    _mark_dirty(target)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(db):
+    for uid in db.info.pop("principal_invalidate", ()):
+        cache.invalidate(uid)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(db):
+    db.info.pop("principal_invalidate", None)
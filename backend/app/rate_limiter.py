@@ -1,73 +1,362 @@
 import os
 import time
-from collections import deque, defaultdict
+import threading
+from collections import OrderedDict
+from . import metrics
+from .log import get_logger
+
+logger = get_logger(__name__)
 
 REDIS_URL = os.getenv("REDIS_URL")
 
+# Tight socket timeouts and a bounded, blocking pool keep a slow or partitioned
+# Redis from pinning request threads; the limiter fails open on timeout.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.25"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "0.5"))
+# health check interval while up; reconnect back-off while down doubles up to the max
+REDIS_HEALTH_SECONDS = float(os.getenv("REDIS_HEALTH_SECONDS", "5"))
+REDIS_RETRY_MAX_SECONDS = float(os.getenv("REDIS_RETRY_MAX_SECONDS", "30"))
+
+# Set while Redis is reachable, None otherwise; owned by ``health``.
 redis_client = None
-if REDIS_URL:
-    try:
-        from redis import Redis
-        from urllib.parse import urlparse
 
-        redis_client = Redis.from_url(REDIS_URL)
-        # test connection
-        redis_client.ping()
-    except Exception as e:
-        print(f"[WARN] Redis unavailable: {e}")
-        redis_client = None
+
+def _make_client(url: str):
+    from redis import Redis, BlockingConnectionPool
+
+    pool = BlockingConnectionPool.from_url(
+        url,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+        health_check_interval=30,
+    )
+    return Redis(connection_pool=pool)
+
+
+class RedisHealth:
+    """Connects to Redis in the background and tracks whether it is usable.
+
+    States: ``disabled`` (no REDIS_URL), ``connecting`` (not checked yet),
+    ``up`` and ``down``. Nothing touches the network at import. ``start()``
+    runs a thread that pings every REDIS_HEALTH_SECONDS while up and retries
+    with exponential back-off while down. A failed Redis call elsewhere
+    (``report_error``) triggers a check at once. On every up/down transition
+    ``redis_client`` is set or cleared and the ``on_change`` listeners are
+    called with it, so the limiters, the login guard and the principal cache
+    move between Redis and in-process state at runtime. Counts kept in
+    memory are not carried over.
+    """
+
+    def __init__(self, url: str | None, check_seconds: float = REDIS_HEALTH_SECONDS, retry_max: float = REDIS_RETRY_MAX_SECONDS):
+        self.url = url
+        self.check_seconds = check_seconds
+        self.retry_max = retry_max
+        self.state = "connecting" if url else "disabled"
+        self.client = None
+        self.transitions = 0
+        self._listeners = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def on_change(self, fn):
+        self._listeners.append(fn)
+
+    def _set(self, state: str):
+        global redis_client
+        if state == self.state:
+            return
+        previous, self.state = self.state, state
+        self.transitions += 1
+        redis_client = self.client if state == "up" else None
+        if state == "up" or previous == "up":
+            logger.info("Redis is %s", state)
+        for fn in self._listeners:
+            try:
+                fn(redis_client)
+            except Exception:
+                logger.exception("Redis state listener failed")
+
+    def check(self) -> bool:
+        """Ping Redis once and update the state. Blocks for at most the socket timeout."""
+        if not self.url:
+            return False
+        if self.client is None:
+            self.client = _make_client(self.url)
+        try:
+            self.client.ping()
+        except Exception as e:
+            if self.state != "down":
+                logger.warning("Redis unavailable: %s", e)
+            self._set("down")
+            return False
+        self._set("up")
+        return True
+
+    def report_error(self):
+        self._wake.set()
+
+    def start(self):
+        if not self.url or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="redis-health", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        backoff = 0.5
+        while not self._stop.is_set():
+            if self.check():
+                backoff, wait = 0.5, self.check_seconds
+            else:
+                wait, backoff = backoff, min(backoff * 2, self.retry_max)
+            self._wake.wait(wait)
+            self._wake.clear()
+
+
+health = RedisHealth(REDIS_URL)
+
+
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Without Redis, share limiter state between the worker processes on a host
+# through this memory-mapped file (see shared_limiter); unset keeps it per process.
+RATE_LIMIT_SHM_PATH = os.getenv("RATE_LIMIT_SHM_PATH")
+RATE_LIMIT_SHM_SLOTS = int(os.getenv("RATE_LIMIT_SHM_SLOTS", str(2 * RATE_LIMIT_MAX_KEYS)))
+
+
+class _Window:
+    __slots__ = ("win", "cur", "prev")
+
+    def __init__(self, win: int):
+        self.win = win
+        self.cur = 0
+        self.prev = 0
 
 
 class InMemoryLimiter:
-    def __init__(self, calls: int, per_seconds: int):
+    """Sliding-window counter (same approximation as the Redis script) with
+    O(1) state per key and at most ``max_keys`` keys, evicting the least
+    recently used. Safe to call from Starlette's worker threads."""
+
+    def __init__(self, calls: int, per_seconds: int, max_keys: int = RATE_LIMIT_MAX_KEYS):
         self.calls = calls
         self.per = per_seconds
-        self.data = defaultdict(lambda: deque())
+        self.max_keys = max_keys
+        self.data = OrderedDict()
+        self.evictions = 0
+        self._lock = threading.Lock()
 
-    def allow(self, key: str) -> bool:
+    def allow(self, key: str, consume: bool = True) -> bool:
+        """Count a request for ``key`` if it fits; ``consume=False`` only checks."""
         now = time.time()
-        dq = self.data[key]
-        while dq and dq[0] <= now - self.per:
-            dq.popleft()
-        if len(dq) < self.calls:
-            dq.append(now)
+        win = int(now // self.per)
+        with self._lock:
+            w = self.data.get(key)
+            if w is None:
+                if not consume:
+                    return self.calls >= 1
+                w = self.data[key] = _Window(win)
+                if len(self.data) > self.max_keys:
+                    self.data.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self.data.move_to_end(key)
+                if w.win != win:
+                    w.prev = w.cur if w.win == win - 1 else 0
+                    w.cur = 0
+                    w.win = win
+            weight = 1 - (now - win * self.per) / self.per
+            if w.prev * weight + w.cur + 1 > self.calls:
+                return False
+            if consume:
+                w.cur += 1
             return True
-        return False
+
+
+# Sliding-window counter: the previous fixed window's count is weighted by how
+# much of it still overlaps the sliding window. Each limited key is one hash
+# (win, cur, prev), like InMemoryLimiter's _Window, so the script touches only
+# the keys passed in KEYS, as Redis Cluster requires. The part of a limited
+# value before the first "|" (the client IP) is the key's hash tag, so the
+# keys checked together for one client share a slot.
+# Every key is checked before any is incremented, so a denial on one key does
+# not consume quota on the others. Uses the server clock so replicas with
+# skewed clocks agree on windows.
+# KEYS: limiter keys; ARGV: calls, per_seconds for each key.
+# Returns 0 when allowed, otherwise the 1-based index of the first denying key.
+SLIDING_WINDOW_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local counts = {}
+for i = 1, #KEYS do
+    local calls = tonumber(ARGV[2 * i - 1])
+    local per = tonumber(ARGV[2 * i])
+    local win = math.floor(now / per)
+    local v = redis.call('HMGET', KEYS[i], 'win', 'cur', 'prev')
+    local cur, prev = tonumber(v[2]) or 0, tonumber(v[3]) or 0
+    if tonumber(v[1]) ~= win then
+        if tonumber(v[1]) ~= win - 1 then
+            cur = 0
+        end
+        prev, cur = cur, 0
+    end
+    local weight = 1 - (now - win * per) / per
+    if prev * weight + cur + 1 > calls then
+        return i
+    end
+    counts[i] = {win, cur + 1, prev, per * 2}
+end
+for i = 1, #KEYS do
+    local n = counts[i]
+    redis.call('HSET', KEYS[i], 'win', n[1], 'cur', n[2], 'prev', n[3])
+    redis.call('EXPIRE', KEYS[i], n[4])
+end
+return 0
+"""
+
+_script_sha = None
+
+
+def _eval_sliding_window(checks) -> int:
+    """Run the sliding-window script for [(key, calls, per_seconds), ...] in one round trip."""
+    global _script_sha
+    from redis.exceptions import NoScriptError
+
+    client = redis_client
+    keys = [k for k, _, _ in checks]
+    argv = [v for _, calls, per in checks for v in (calls, per)]
+    if _script_sha is None:
+        _script_sha = client.script_load(SLIDING_WINDOW_LUA)
+    try:
+        return int(client.evalsha(_script_sha, len(keys), *keys, *argv))
+    except NoScriptError:
+        # script cache flushed (restart/failover): load again and retry once
+        _script_sha = client.script_load(SLIDING_WINDOW_LUA)
+        return int(client.evalsha(_script_sha, len(keys), *keys, *argv))
 
 
 class RedisLimiter:
-    def __init__(self, calls: int, per_seconds: int):
+    def __init__(self, calls: int, per_seconds: int, name: str = "default"):
         self.calls = calls
         self.per = per_seconds
+        self.name = name
+
+    def check(self, key: str):
+        tag, sep, rest = key.partition("|")
+        return (f"rlw:{{{tag}}}{sep}{rest}:{self.name}", self.calls, self.per)
 
     def allow(self, key: str) -> bool:
-        if not redis_client:
-            return True
-        k = f"rl:{key}"
+        return allow_all([(self, key)])
+
+
+def _parse_limit(value: str):
+    calls, per = value.split("/")
+    return int(calls), int(per)
+
+
+# "<calls>/<seconds>"
+IP_LIMIT = _parse_limit(os.getenv("RATE_LIMIT_IP", "100/60"))
+AUTH_LIMIT = _parse_limit(os.getenv("RATE_LIMIT_AUTH", "10/60"))
+
+
+
+def _local_limiters():
+    """The limiters used while Redis is not: shared between workers when RATE_LIMIT_SHM_PATH is set."""
+    if RATE_LIMIT_SHM_PATH:
         try:
-            current = redis_client.incr(k)
-            if current == 1:
-                redis_client.expire(k, self.per)
-            return current <= self.calls
-        except Exception:
+            from .shared_limiter import SharedTable, SharedMemoryLimiter
+
+            table = SharedTable(RATE_LIMIT_SHM_PATH, RATE_LIMIT_SHM_SLOTS)
+            return SharedMemoryLimiter(*IP_LIMIT, table, name="ip"), SharedMemoryLimiter(*AUTH_LIMIT, table, name="auth")
+        except (ImportError, OSError) as e:
+            logger.warning("Shared-memory rate limiter unavailable, limiting per worker: %s", e)
+    return InMemoryLimiter(*IP_LIMIT), InMemoryLimiter(*AUTH_LIMIT)
+
+
+# Both backends exist from the start; health switches between them.
+_memory_limiters = _local_limiters()
+_redis_limiters = (RedisLimiter(*IP_LIMIT, name="ip"), RedisLimiter(*AUTH_LIMIT, name="auth"))
+ip_limiter, auth_limiter = _memory_limiters
+
+
+def _switch_limiters(client):
+    global ip_limiter, auth_limiter
+    old, new = (_memory_limiters, _redis_limiters) if client else (_redis_limiters, _memory_limiters)
+    # limiters replaced at runtime (tests, benchmarks) are left alone
+    if ip_limiter is old[0]:
+        ip_limiter = new[0]
+    if auth_limiter is old[1]:
+        auth_limiter = new[1]
+
+
+health.on_change(_switch_limiters)
+
+
+def _decide(checks, remote) -> str:
+    local = [(lim, key) for lim, key in checks if not isinstance(lim, RedisLimiter)]
+    # all or nothing, like the Redis script: a key that would deny stops the
+    # request before any other key's quota is used
+    if not all(lim.allow(key, consume=False) for lim, key in local):
+        return "deny"
+    decision = "allow"
+    if remote:
+        try:
+            if _eval_sliding_window(remote):
+                return "deny"
+        except Exception as e:
             # if Redis fails, be permissive (fail open) but log
-            print("[WARN] Redis rate limiter failed, allowing request")
-            return True
+            logger.warning("Redis rate limiter failed, allowing request: %s", e)
+            health.report_error()
+            decision = "error"
+    for lim, key in local:
+        # a concurrent request can still take the last slot between the check and here
+        if not lim.allow(key):
+            return "deny"
+    return decision
+
+
+def allow_all(checks) -> bool:
+    """Check several (limiter, key) pairs; Redis-backed ones share one round trip."""
+    t0 = time.perf_counter()
+    remote = [lim.check(key) for lim, key in checks if isinstance(lim, RedisLimiter)] if redis_client else []
+    decision = _decide(checks, remote)
+    metrics.rate_limit_decision("redis" if remote else "memory", decision, time.perf_counter() - t0)
+    return decision != "deny"
+
 
+# Per-route limits, applied by middleware.RateLimitMiddleware before routing
+# and body parsing: (method, path) -> names of the module-level limiters to
+# check against the client IP. Looked up by name at call time so a limiter can
+# be swapped out at runtime. Routes with a per-account limit need the parsed
+# request body and check both limits in the handler (check_ip_and_account).
+ROUTE_LIMITS = {
+    ("POST", "/api/auth/signup"): ("ip_limiter",),
+    ("POST", "/api/auth/signin"): ("ip_limiter",),
+    ("POST", "/api/auth/trial"): ("ip_limiter",),
+}
 
-# choose backend limiter
-if redis_client:
-    ip_limiter = RedisLimiter(100, 60)
-    auth_limiter = RedisLimiter(10, 60)
-else:
-    ip_limiter = InMemoryLimiter(100, 60)
-    auth_limiter = InMemoryLimiter(10, 60)
 
+def check_route(method: str, path: str, client_ip: str) -> bool:
+    names = ROUTE_LIMITS.get((method, path))
+    if not names:
+        return True
+    return allow_all([(globals()[name], client_ip) for name in names])
 
-def check_ip(request) -> bool:
-    ip = request.client.host if request and request.client else 'unknown'
-    return ip_limiter.allow(ip)
 
+def check_ip_and_account(client_ip: str, account: str) -> bool:
+    """The IP limit and the per IP+account limit, all or nothing in one round trip.
 
-def check_key(key: str) -> bool:
-    return auth_limiter.allow(key)
+    Keying the account limit by IP too means one client cannot use up the
+    account's quota for everyone else.
+    """
+    return allow_all([(ip_limiter, client_ip), (auth_limiter, f"{client_ip}|{account}")])
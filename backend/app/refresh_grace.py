@@ -0,0 +1,123 @@
+"""Successors of just-rotated refresh tokens, for concurrent refreshes.
+
+Several tabs refreshing with the same cookie at once race to rotate it; one
+wins. For REFRESH_GRACE_SECONDS after the rotation, the losers get the
+winner's successor from this cache instead of a 401, so every tab ends up
+on the same new token.
+
+Entries are keyed by the parent token's hash and sealed with AES-GCM under
+a key derived from the parent token itself, so only a client presenting the
+parent can read the successor. If the successor was itself rotated within
+the window, the newest token in the chain is returned. Entries live in
+process and, while Redis is up, in Redis too, so a loser on another worker
+finds them.
+"""
+import os
+import json
+import math
+import time
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
+from . import rate_limiter, utils
+
+REFRESH_GRACE_SECONDS = float(os.getenv("REFRESH_GRACE_SECONDS", "10"))
+REFRESH_GRACE_SIZE = int(os.getenv("REFRESH_GRACE_SIZE", "10000"))
+
+
+def _seal(parent: str, value) -> bytes:
+    key = hashlib.sha256(b"refresh-grace\0" + parent.encode()).digest()
+    nonce = secrets.token_bytes(12)
+    return nonce + AESGCM(key).encrypt(nonce, json.dumps(value).encode(), None)
+
+
+def _open(parent: str, sealed: bytes):
+    key = hashlib.sha256(b"refresh-grace\0" + parent.encode()).digest()
+    try:
+        return json.loads(AESGCM(key).decrypt(sealed[:12], sealed[12:], None))
+    except (InvalidTag, ValueError):
+        return None
+
+
+class GraceCache:
+    def __init__(self, seconds: float, maxsize: int):
+        self.seconds = seconds
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.hits = 0
+        self.misses = 0
+        self.reuse_detected = 0
+
+    def put(self, parent_hash: str, parent: str, successor):
+        """Remember ``successor`` (user id, session id, refresh token) for the parent token."""
+        sealed = _seal(parent, successor)
+        with self._lock:
+            self._data[parent_hash] = (time.monotonic() + self.seconds, sealed)
+            self._data.move_to_end(parent_hash)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            self.stored += 1
+        r = rate_limiter.redis_client
+        if r:
+            try:
+                r.set(f"rgrace:{parent_hash}", sealed, ex=max(1, math.ceil(self.seconds)))
+            except Exception:
+                pass
+
+    def _lookup(self, parent_hash: str, parent: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(parent_hash)
+        sealed = entry[1] if entry and entry[0] > now else None
+        r = rate_limiter.redis_client
+        if sealed is None and r:
+            try:
+                sealed = r.get(f"rgrace:{parent_hash}")
+            except Exception:
+                sealed = None
+        return _open(parent, sealed) if sealed else None
+
+    def get(self, parent_hash: str, parent: str, max_hops: int = 5):
+        successor = self._lookup(parent_hash, parent)
+        # a tab that already refreshed again within the window rotated the
+        # successor too: follow to the newest so this client is not left on a
+        # rotated token (which would later look like reuse)
+        for _ in range(max_hops):
+            newer = successor and self._lookup(utils.hash_token(successor[2]), successor[2])
+            if not newer:
+                break
+            successor = newer
+        with self._lock:
+            if successor:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return successor
+
+    def discard(self, parent_hash: str):
+        with self._lock:
+            self._data.pop(parent_hash, None)
+        r = rate_limiter.redis_client
+        if r:
+            try:
+                r.delete(f"rgrace:{parent_hash}")
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "stored": self.stored,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reuse_detected": self.reuse_detected,
+            }
+
+
+cache = GraceCache(REFRESH_GRACE_SECONDS, REFRESH_GRACE_SIZE)
@@ -0,0 +1,212 @@
+"""Retention sweeper for token and outbox tables.
+
+Deletes expired/revoked refresh tokens, expired one-time tokens, expired
+access-token revocations and old outbox rows in small batches (one short
+transaction per batch) so the sweep never holds long locks. Runs in-app as a background task (see main.py) or
+standalone:
+
+    python -m app.retention sweep        # one sweep, then exit
+    python -m app.retention partitions   # Postgres: create/drop refresh_tokens partitions
+
+Only one replica sweeps at a time: on Postgres the sweeper must win a
+session-level ``pg_try_advisory_lock``.
+
+Partitioning (optional, Postgres): if ``refresh_tokens`` has been converted
+to a table partitioned by range on ``created_at`` with monthly partitions
+named ``refresh_tokens_pYYYYMM``, the ``partitions`` command creates
+upcoming partitions and drops whole partitions once every row in them is
+past retention. This is much cheaper than deleting row by row. Converting the
+table is a manual step. Postgres requires the primary key and unique indexes of a
+partitioned table to include ``created_at``.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, text, or_, and_, exists, func
+from sqlalchemy.orm import aliased
+from starlette.concurrency import run_in_threadpool
+from . import models
+from .database import direct_engine
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "1") == "1"
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+# pause between batches so the sweep yields to request traffic
+RETENTION_PAUSE_SECONDS = float(os.getenv("RETENTION_PAUSE_SECONDS", "0.05"))
+# keep rows a little past expiry/revocation for auditing and reuse detection
+RETENTION_GRACE_HOURS = float(os.getenv("RETENTION_GRACE_HOURS", "24"))
+RETENTION_REVOKED_DAYS = float(os.getenv("RETENTION_REVOKED_DAYS", "7"))
+RETENTION_EMAIL_DAYS = float(os.getenv("RETENTION_EMAIL_DAYS", "7"))
+RETENTION_DEAD_EMAIL_DAYS = float(os.getenv("RETENTION_DEAD_EMAIL_DAYS", "30"))
+RETENTION_PARTITION_MONTHS_AHEAD = 2
+
+# arbitrary constant shared by all replicas
+ADVISORY_LOCK_KEY = 0x6E70_7377  # "npsw"
+
+stats = {"runs": 0, "skipped_not_leader": 0, "last_run_at": None, "last_duration_seconds": 0.0, "rows_deleted": {}}
+
+
+def _targets(now: datetime):
+    grace = now - timedelta(hours=RETENTION_GRACE_HOURS)
+    RT, OTT, Outbox, TR = models.RefreshToken, models.OneTimeToken, models.EmailOutbox, models.TokenRevocation
+    # a replayed rotated token is how reuse is detected: keep revoked rows while
+    # any token of their family is still live
+    member, family = aliased(RT), func.coalesce(RT.family_id, RT.id)
+    family_live = exists().where(or_(member.family_id == family, member.id == family),
+                                 member.revoked == False, member.expires_at > now)
+    return [
+        ("refresh_tokens", RT, or_(
+            RT.expires_at < grace,
+            and_(RT.revoked == True, RT.created_at < now - timedelta(days=RETENTION_REVOKED_DAYS), ~family_live),
+        )),
+        ("one_time_tokens", OTT, OTT.expires_at < grace),
+        # past expires_at no token a revocation could match is still valid
+        ("token_revocations", TR, TR.expires_at < now),
+        ("email_outbox", Outbox, or_(
+            and_(Outbox.status == models.EmailStatus.sent, Outbox.created_at < now - timedelta(days=RETENTION_EMAIL_DAYS)),
+            and_(Outbox.status == models.EmailStatus.dead, Outbox.created_at < now - timedelta(days=RETENTION_DEAD_EMAIL_DAYS)),
+        )),
+    ]
+
+
+def _delete_batches(conn, model, condition, batch_size: int, pause: float) -> int:
+    deleted = 0
+    while True:
+        with conn.begin():
+            ids = conn.execute(select(model.id).where(condition).limit(batch_size)).scalars().all()
+            if ids:
+                conn.execute(delete(model).where(model.id.in_(ids)))
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def _acquire_leader(conn) -> bool:
+    if conn.dialect.name != "postgresql":
+        return True
+    with conn.begin():
+        return bool(conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": ADVISORY_LOCK_KEY}).scalar())
+
+
+def _release_leader(conn):
+    if conn.dialect.name == "postgresql":
+        with conn.begin():
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_LOCK_KEY})
+
+
+def sweep(bind=None, batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_PAUSE_SECONDS, now: datetime | None = None) -> dict:
+    """Run one retention pass. Returns rows deleted per table, or None if another replica holds the lock."""
+    bind = bind or direct_engine
+    now = now or datetime.utcnow()
+    t0 = time.perf_counter()
+    with bind.connect() as conn:
+        if not _acquire_leader(conn):
+            stats["skipped_not_leader"] += 1
+            return None
+        try:
+            result = {name: _delete_batches(conn, model, cond, batch_size, pause) for name, model, cond in _targets(now)}
+        finally:
+            _release_leader(conn)
+    stats["runs"] += 1
+    stats["last_run_at"] = now.isoformat()
+    stats["last_duration_seconds"] = time.perf_counter() - t0
+    for name, n in result.items():
+        stats["rows_deleted"][name] = stats["rows_deleted"].get(name, 0) + n
+    return result
+
+
+def _is_partitioned(conn) -> bool:
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'refresh_tokens'"
+    )).scalar())
+
+
+def _month_start(d: datetime, offset: int = 0) -> datetime:
+    m = d.year * 12 + d.month - 1 + offset
+    return datetime(m // 12, m % 12 + 1, 1)
+
+
+def maintain_partitions(bind=None, now: datetime | None = None) -> dict:
+    """Create upcoming monthly refresh_tokens partitions and drop fully expired ones (Postgres only)."""
+    bind = bind or direct_engine
+    now = now or datetime.utcnow()
+    out = {"created": [], "dropped": []}
+    if bind.dialect.name != "postgresql":
+        return out
+    with bind.connect() as conn:
+        with conn.begin():
+            partitioned = _is_partitioned(conn)
+        if not partitioned or not _acquire_leader(conn):
+            return out
+        try:
+            with conn.begin():
+                existing = set(conn.execute(text(
+                    "SELECT child.relname FROM pg_inherits i "
+                    "JOIN pg_class parent ON parent.oid = i.inhparent "
+                    "JOIN pg_class child ON child.oid = i.inhrelid "
+                    "WHERE parent.relname = 'refresh_tokens'"
+                )).scalars())
+                for offset in range(RETENTION_PARTITION_MONTHS_AHEAD + 1):
+                    lo, hi = _month_start(now, offset), _month_start(now, offset + 1)
+                    name = f"refresh_tokens_p{lo:%Y%m}"
+                    if name not in existing:
+                        conn.execute(text(
+                            f"CREATE TABLE {name} PARTITION OF refresh_tokens "
+                            f"FOR VALUES FROM ('{lo:%Y-%m-%d}') TO ('{hi:%Y-%m-%d}')"
+                        ))
+                        out["created"].append(name)
+                # a partition can go once its newest token has expired and left the grace window
+                max_age = timedelta(days=14) + timedelta(hours=RETENTION_GRACE_HOURS)
+                for name in sorted(existing):
+                    suffix = name.rsplit("_p", 1)[-1]
+                    if not suffix.isdigit() or len(suffix) != 6:
+                        continue
+                    upper = _month_start(datetime(int(suffix[:4]), int(suffix[4:]), 1), 1)
+                    if upper + max_age < now:
+                        conn.execute(text(f"DROP TABLE {name}"))
+                        out["dropped"].append(name)
+        finally:
+            _release_leader(conn)
+    return out
+
+
+async def run_forever():
+    """Background loop started by the app; sweeps every RETENTION_INTERVAL_SECONDS."""
+    while True:
+        # jitter so replicas started together do not all contend for the lock
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS * random.uniform(0.9, 1.1))
+        try:
+            await run_in_threadpool(maintain_partitions)
+            result = await run_in_threadpool(sweep)
+            if result:
+                logger.info("Retention sweep deleted %s in %.2fs", result, stats["last_duration_seconds"])
+        except Exception as e:
+            logger.warning("Retention sweep failed: %s", e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delete expired token and outbox rows.")
+    parser.add_argument("command", nargs="?", default="sweep", choices=["sweep", "partitions"])
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=RETENTION_PAUSE_SECONDS)
+    args = parser.parse_args(argv)
+    if args.command == "partitions":
+        print(maintain_partitions())
+        return
+    result = sweep(batch_size=args.batch_size, pause=args.pause)
+    if result is None:
+        print("Another replica holds the retention lock; nothing done.")
+    else:
+        print(f"Deleted {result} in {stats['last_duration_seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
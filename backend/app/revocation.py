@@ -0,0 +1,334 @@
+"""Access-token revocation without a per-request query.
+
+Access tokens carry a ``jti`` and, from sign-in and refresh, their session
+id ``sid``. Revoking writes a ``token_revocations`` row in the same
+transaction as the change it belongs to:
+
+- ``revoke_session``: every access token of one session (revoke, logout).
+- ``revoke_user``: every token issued to a user until now; tokens whose
+  ``iat`` is before the user's ``tokens_valid_after`` are rejected
+  (revoke-all, password reset, suspension and deletion).
+- ``revoke_token``: one token by ``jti``.
+
+Each worker keeps a Denylist in memory: a Bloom filter over every unexpired
+revoked jti/sid, an exact set of the most recent ones and a map of user
+cutoffs. ``check`` answers from memory. A filter hit that is not in the
+exact set (an older revocation or a false positive, REVOCATION_FP_RATE of
+clean tokens) is confirmed with one indexed query, and false positives are
+remembered so the same token does not query again.
+
+The revoking worker applies its revocations when the transaction commits.
+Others pick them up by polling the table every REVOCATION_POLL_SECONDS, so
+that is how long a revoked token can still pass on another worker. The
+filter is rebuilt every REVOCATION_REBUILD_SECONDS to shed expired entries;
+rows are deleted by the retention sweeper.
+"""
+import os
+import math
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session, object_session
+from . import models
+from .database import engine
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+REVOCATION_POLL_SECONDS = float(os.getenv("REVOCATION_POLL_SECONDS", "2"))
+REVOCATION_REBUILD_SECONDS = float(os.getenv("REVOCATION_REBUILD_SECONDS", "3600"))
+# longest access-token lifetime (trial tokens: 24h); revocations are kept this long
+REVOCATION_TTL_SECONDS = float(os.getenv("REVOCATION_TTL_SECONDS", str(24 * 3600)))
+REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", "1000000"))
+REVOCATION_FP_RATE = float(os.getenv("REVOCATION_FP_RATE", "0.001"))
+REVOCATION_EXACT_SIZE = int(os.getenv("REVOCATION_EXACT_SIZE", "10000"))
+# re-read rows this far behind the last poll: commit order and clocks differ between workers
+POLL_OVERLAP_SECONDS = 30
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter for ``capacity`` items at ``fp_rate`` (double hashing over one blake2b digest)."""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, item: str):
+        bits = self.bits
+        for p in self._positions(item):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        # most lookups are misses: stop at the first clear bit
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        bits, size = self.bits, self.size
+        for i in range(self.hashes):
+            p = (h1 + i * h2) % size
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+
+def _epoch(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def token_ids(payload: dict):
+    """Denylist keys a decoded access token can be revoked under."""
+    ids = []
+    if payload.get("jti"):
+        ids.append(f"jti:{payload['jti']}")
+    if payload.get("sid"):
+        ids.append(f"sid:{payload['sid']}")
+    return ids
+
+
+class Denylist:
+    def __init__(self, capacity: int = REVOCATION_FILTER_CAPACITY, fp_rate: float = REVOCATION_FP_RATE,
+                 exact_size: int = REVOCATION_EXACT_SIZE, poll_seconds: float = REVOCATION_POLL_SECONDS,
+                 rebuild_seconds: float = REVOCATION_REBUILD_SECONDS, cleared_size: int = REVOCATION_EXACT_SIZE, bind=None):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.exact_size = exact_size
+        self.cleared_size = cleared_size
+        self.poll_seconds = poll_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.bind = bind or engine
+        self.filter = BloomFilter(capacity, fp_rate)
+        self._exact = OrderedDict()  # newest revoked ids -> expiry epoch
+        self._cleared = OrderedDict()  # filter hits the database said are not revoked
+        self._valid_after = {}  # user id -> (cutoff epoch, expiry epoch)
+        self._lock = threading.Lock()
+        self._since = None
+        self._built_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self.checks = 0
+        self.revoked = 0
+        self.filter_hits = 0
+        self.false_positives = 0
+        self.syncs = 0
+        self.errors = 0
+
+    # -- applying revocations ------------------------------------------------
+
+    def _apply(self, kind: str, value: str, valid_after: float | None, expires_at: float):
+        """Add one revocation; call with the lock held."""
+        if kind == "user":
+            current = self._valid_after.get(value)
+            if current is None or current[0] < valid_after:
+                self._valid_after[value] = (valid_after, expires_at)
+            return
+        key = f"{kind}:{value}"
+        if key not in self._exact:
+            self.filter.add(key)
+        self._exact[key] = expires_at
+        self._exact.move_to_end(key)
+        while len(self._exact) > self.exact_size:
+            self._exact.popitem(last=False)
+        self._cleared.pop(key, None)
+
+    def apply(self, rows):
+        """Add (kind, value, valid_after, expires_at) rows, datetimes in naive UTC."""
+        with self._lock:
+            for kind, value, valid_after, expires_at in rows:
+                self._apply(kind, value, _epoch(valid_after) if valid_after else None, _epoch(expires_at))
+
+    # -- checking tokens -----------------------------------------------------
+
+    def check(self, payload: dict):
+        """(revoked, unsure): ``unsure`` lists ids the filter matched that need ``confirm``."""
+        now = time.time()
+        unsure = []
+        with self._lock:
+            self.checks += 1
+            cutoff = self._valid_after.get(payload.get("sub"))
+            if cutoff and cutoff[1] > now and payload.get("iat", 0) < cutoff[0]:
+                self.revoked += 1
+                return True, []
+            for key in token_ids(payload):
+                expires = self._exact.get(key)
+                if expires is not None and expires > now:
+                    self.revoked += 1
+                    return True, []
+                if key in self.filter and key not in self._cleared:
+                    unsure.append(key)
+            if unsure:
+                self.filter_hits += 1
+        return False, unsure
+
+    def confirm(self, db: Session, keys) -> bool:
+        """Look filter hits up in the table; remembers the ones that were false positives."""
+        values = [k.split(":", 1)[1] for k in keys]
+        TR = models.TokenRevocation
+        rows = db.execute(
+            select(TR.kind, TR.value, TR.valid_after, TR.expires_at)
+            .where(TR.value.in_(values), TR.kind != "user", TR.expires_at > datetime.utcnow())
+        ).all()
+        found = {f"{r.kind}:{r.value}" for r in rows}
+        with self._lock:
+            for r in rows:
+                self._apply(r.kind, r.value, None, _epoch(r.expires_at))
+            if any(k in found for k in keys):
+                self.revoked += 1
+                return True
+            self.false_positives += 1
+            for k in keys:
+                self._cleared[k] = True
+            while len(self._cleared) > self.cleared_size:
+                self._cleared.popitem(last=False)
+        return False
+
+    # -- syncing from the table ----------------------------------------------
+
+    def _rows(self, condition):
+        TR = models.TokenRevocation
+        with self.bind.connect() as conn:
+            return conn.execute(
+                select(TR.kind, TR.value, TR.valid_after, TR.expires_at).where(condition).order_by(TR.created_at)
+            ).all()
+
+    def load(self):
+        """Rebuild everything from the unexpired rows; the old state keeps answering meanwhile."""
+        started = datetime.utcnow()
+        rows = self._rows(models.TokenRevocation.expires_at > started)
+        fresh = Denylist(max(self.capacity, 2 * len(rows)), self.fp_rate, self.exact_size, bind=self.bind)
+        fresh.apply((r.kind, r.value, r.valid_after, r.expires_at) for r in rows)
+        now = time.time()
+        with self._lock:
+            # keep what this worker applied itself while the query ran
+            for key, expires in self._exact.items():
+                if expires > now and key not in fresh._exact:
+                    fresh._apply(*key.split(":", 1), None, expires)
+            for uid, cutoff in self._valid_after.items():
+                if cutoff[1] > now:
+                    fresh._apply("user", uid, *cutoff)
+            self.filter, self._exact, self._valid_after = fresh.filter, fresh._exact, fresh._valid_after
+            self._cleared.clear()
+            self._since = started
+            self._built_at = time.monotonic()
+            self.syncs += 1
+
+    def sync(self):
+        """Apply rows written since the last sync (by any worker); rebuilds when due."""
+        if self._since is None or time.monotonic() - self._built_at >= self.rebuild_seconds:
+            self.load()
+            return
+        started = datetime.utcnow()
+        TR = models.TokenRevocation
+        rows = self._rows(TR.created_at >= self._since - timedelta(seconds=POLL_OVERLAP_SECONDS))
+        self.apply((r.kind, r.value, r.valid_after, r.expires_at) for r in rows)
+        now = time.time()
+        with self._lock:
+            self._valid_after = {uid: c for uid, c in self._valid_after.items() if c[1] > now}
+            self._since = started
+            self.syncs += 1
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="revocation-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Revocation sync failed: %s", e)
+            self._stop.wait(self.poll_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "filter_items": self.filter.count,
+                "filter_bytes": self.filter.nbytes,
+                "exact": len(self._exact),
+                "users": len(self._valid_after),
+                "checks": self.checks,
+                "revoked": self.revoked,
+                "filter_hits": self.filter_hits,
+                "false_positives": self.false_positives,
+                "syncs": self.syncs,
+                "errors": self.errors,
+            }
+
+
+denylist = Denylist()
+
+
+# -- recording revocations ---------------------------------------------------
+
+def _record(db: Session, kind: str, value: str, valid_after: datetime | None = None, expires_at: datetime | None = None,
+            connection=None):
+    now = datetime.utcnow()
+    row = {"kind": kind, "value": value, "valid_after": valid_after,
+           "expires_at": expires_at or now + timedelta(seconds=REVOCATION_TTL_SECONDS)}
+    stmt = insert(models.TokenRevocation).values(created_at=now, **row)
+    # inside a flush (ORM events) the statement must go through the flushing connection
+    (connection or db).execute(stmt)
+    db.info.setdefault("revocations", []).append(row)
+
+
+def revoke_token(db: Session, jti: str, expires_at: datetime):
+    _record(db, "jti", jti, expires_at=expires_at)
+
+
+def revoke_session(db: Session, session_id: str):
+    _record(db, "sid", session_id)
+
+
+def revoke_user(db: Session, user_id: str, at: datetime | None = None, connection=None):
+    _record(db, "user", user_id, valid_after=at or datetime.utcnow(), connection=connection)
+
+
+@event.listens_for(models.User, "after_update")
+def _user_updated(mapper, connection, target):
+    # suspension, deletion and password changes end every outstanding token
+    state = target._sa_instance_state
+    status = state.attrs.status.history
+    locked = status.has_changes() and target.status in (models.UserStatus.suspended, models.UserStatus.deleted)
+    db = object_session(target)
+    if db is not None and (locked or state.attrs.password_hash.history.has_changes()):
+        revoke_user(db, target.id, connection=connection)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(db):
+    rows = db.info.pop("revocations", None)
+    if rows:
+        denylist.apply((r["kind"], r["value"], r["valid_after"], r["expires_at"]) for r in rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(db):
+    db.info.pop("revocations", None)
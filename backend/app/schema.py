@@ -0,0 +1,95 @@
+"""Startup check that the database schema is at the Alembic head.
+
+Replaces ``Base.metadata.create_all`` on worker start, which reflected every
+table each time a worker booted. The check costs one query: the revisions in
+``alembic_version`` are compared with the heads of ``migrations/versions``.
+The heads are read from the revision files with a regex rather than through
+Alembic, so workers do not pay Alembic's import time on boot.
+
+SCHEMA_CHECK selects what happens when the schema is behind:
+
+- ``strict`` (default): refuse to start. Run ``alembic upgrade head`` first.
+- ``warn``: log an error and start anyway.
+- ``upgrade``: run ``alembic upgrade head`` (single-process development only).
+- ``off``: skip the check.
+"""
+import os
+import re
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from .database import direct_engine
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "strict")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VERSIONS_DIR = os.path.join(BACKEND_DIR, "migrations", "versions")
+
+_REVISION = re.compile(r"^revision\s*=\s*['\"]([^'\"]+)['\"]", re.M)
+_DOWN_REVISION = re.compile(r"^down_revision\s*=\s*(.+)$", re.M)
+_QUOTED = re.compile(r"['\"]([^'\"]+)['\"]")
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def head_revisions(versions_dir: str = VERSIONS_DIR) -> set:
+    """Revisions that no other revision revises (usually exactly one)."""
+    revisions, parents = set(), set()
+    for name in os.listdir(versions_dir):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(versions_dir, name)) as f:
+            source = f.read()
+        rev = _REVISION.search(source)
+        if not rev:
+            continue
+        revisions.add(rev.group(1))
+        down = _DOWN_REVISION.search(source)
+        if down:
+            # None, "0005" or a tuple of revisions for merges
+            parents.update(_QUOTED.findall(down.group(1)))
+    return revisions - parents
+
+
+def current_revisions(bind) -> set:
+    with bind.connect() as conn:
+        try:
+            return {row[0] for row in conn.execute(text("SELECT version_num FROM alembic_version"))}
+        except (OperationalError, ProgrammingError):
+            return set()  # never migrated
+
+
+def upgrade(bind):
+    from alembic import command
+    from alembic.config import Config
+
+    # no ini file: its logging config would replace the app's handlers
+    config = Config()
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    with bind.begin() as conn:
+        config.attributes["connection"] = conn
+        command.upgrade(config, "head")
+
+
+def check(bind=None, mode: str = SCHEMA_CHECK) -> bool:
+    """True when the schema is at head; otherwise acts according to ``mode``."""
+    if mode == "off":
+        return True
+    bind = bind or direct_engine
+    heads, current = head_revisions(), current_revisions(bind)
+    if current == heads:
+        return True
+    if mode == "upgrade":
+        logger.info("Upgrading schema from %s to %s", sorted(current) or "empty", sorted(heads))
+        upgrade(bind)
+        return True
+    message = (f"Database schema is at {sorted(current) or 'no revision'}, migrations head is {sorted(heads)}; "
+               "run `alembic upgrade head`")
+    if mode == "warn":
+        logger.error(message)
+        return False
+    raise SchemaOutOfDate(message)
@@ -1,3 +1,4 @@
+import enum
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 
@@ -32,6 +33,14 @@ class SessionInfo(BaseModel):
     expires_at: Optional[str]
     revoked: bool
     created_at: Optional[str]
+    last_seen_at: Optional[str] = None
+    last_ip: Optional[str] = None
+
+class SessionStatus(str, enum.Enum):
+    active = "active"
+    revoked = "revoked"
+    expired = "expired"
+    all = "all"
 
 class RevokeSessionRequest(BaseModel):
     session_id: str
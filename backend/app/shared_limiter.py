@@ -0,0 +1,172 @@
+"""Rate limiter state shared by all worker processes on a host, without Redis.
+
+Several uvicorn/gunicorn workers each running an InMemoryLimiter multiply the
+limit by the number of workers. SharedMemoryLimiter keeps the same
+sliding-window counters in a fixed-size hash table in a memory-mapped file
+(RATE_LIMIT_SHM_PATH, e.g. ``/dev/shm/next-planner-ratelimit``) that every
+worker maps, so they all count against one limit.
+
+Layout: a 64-byte header, then ``slots`` records of 24 bytes (key hash,
+window, current count, previous count, last use). Slots are grouped into
+buckets of WAYS; a key lives in the bucket its hash names, and a full bucket
+evicts its least recently used slot, so memory is fixed at creation. Each
+update holds a stripe lock: a thread lock (fcntl record locks do not exclude
+threads of one process) plus an fcntl lock on one byte of the file per
+stripe (released by the kernel if a worker dies holding it).
+
+The file outlives the workers, so counts survive a worker restart. Its size
+is read from the header when it already exists; to change
+RATE_LIMIT_SHM_SLOTS, remove the file while the workers are stopped.
+"""
+import os
+import mmap
+import time
+import struct
+import hashlib
+import threading
+
+MAGIC = b"NPRL"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")  # magic, version, slots, ways
+HEADER_SIZE = 64
+SLOT = struct.Struct("<QIIII")  # key hash, window, cur, prev, last use (epoch seconds)
+WAYS = 8
+STRIPES = 256
+
+
+class SharedTable:
+    """The mapped file: bucket lookup and striped locking; callers do the counting."""
+
+    def __init__(self, path: str, slots: int, stripes: int = STRIPES):
+        import fcntl
+
+        self._fcntl = fcntl
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # byte 0 serialises initialisation between workers starting together
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, 0)
+            try:
+                slots = self._init(fd, max(WAYS, slots - slots % WAYS))
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, 0)
+            self.map = mmap.mmap(fd, HEADER_SIZE + slots * SLOT.size)
+        except BaseException:
+            os.close(fd)
+            raise
+        self.fd = fd
+        self.slots = slots
+        self.buckets = slots // WAYS
+        self.stripes = min(stripes, self.buckets)
+        self._locks = [threading.Lock() for _ in range(self.stripes)]
+
+    @staticmethod
+    def _init(fd: int, slots: int) -> int:
+        head = os.pread(fd, HEADER.size, 0)
+        if len(head) == HEADER.size:
+            magic, version, existing, ways = HEADER.unpack(head)
+            if magic == MAGIC and version == VERSION and ways == WAYS and existing:
+                # other workers may have it mapped already: adopt its size
+                return existing
+        os.ftruncate(fd, 0)
+        os.ftruncate(fd, HEADER_SIZE + slots * SLOT.size)
+        os.pwrite(fd, HEADER.pack(MAGIC, VERSION, slots, WAYS), 0)
+        return slots
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+    def bucket(self, key_hash: int) -> int:
+        return key_hash % self.buckets
+
+    def lock(self, bucket: int):
+        return _StripeLock(self, bucket % self.stripes)
+
+    def find(self, bucket: int, key_hash: int):
+        """Offset of ``key_hash``'s slot in ``bucket`` and whether it was already there.
+
+        A missing key gets an empty slot, or else the bucket's least recently
+        used one (the caller resets it). Call with the bucket's stripe locked.
+        """
+        base = HEADER_SIZE + bucket * WAYS * SLOT.size
+        victim, victim_seen = base, None
+        unpack = SLOT.unpack_from
+        for i in range(WAYS):
+            off = base + i * SLOT.size
+            h, _, _, _, seen = unpack(self.map, off)
+            if h == key_hash:
+                return off, True
+            if h == 0:
+                return off, False
+            if victim_seen is None or seen < victim_seen:
+                victim, victim_seen = off, seen
+        return victim, False
+
+
+class _StripeLock:
+    __slots__ = ("table", "stripe")
+
+    def __init__(self, table: SharedTable, stripe: int):
+        self.table = table
+        self.stripe = stripe
+
+    def __enter__(self):
+        t = self.table
+        t._locks[self.stripe].acquire()
+        try:
+            t._fcntl.lockf(t.fd, t._fcntl.LOCK_EX, 1, 1 + self.stripe)
+        except BaseException:
+            t._locks[self.stripe].release()
+            raise
+
+    def __exit__(self, *exc):
+        t = self.table
+        try:
+            t._fcntl.lockf(t.fd, t._fcntl.LOCK_UN, 1, 1 + self.stripe)
+        finally:
+            t._locks[self.stripe].release()
+
+
+def key_hash(name: str, key: str) -> int:
+    h = int.from_bytes(hashlib.blake2b(f"{name}\0{key}".encode(), digest_size=8).digest(), "little")
+    return h or 1  # 0 marks an empty slot
+
+
+class SharedMemoryLimiter:
+    """Sliding-window counter (same approximation as InMemoryLimiter and the
+    Redis script) kept in a SharedTable, so every worker on the host shares
+    it. ``name`` keeps limiters sharing one table apart."""
+
+    def __init__(self, calls: int, per_seconds: int, table: SharedTable, name: str = "default"):
+        self.calls = calls
+        self.per = per_seconds
+        self.table = table
+        self.name = name
+        self.evictions = 0  # this worker's only
+
+    def allow(self, key: str, consume: bool = True) -> bool:
+        """Count a request for ``key`` if it fits; ``consume=False`` only checks."""
+        now = time.time()
+        win = int(now // self.per)
+        h = key_hash(self.name, key)
+        table = self.table
+        bucket = table.bucket(h)
+        with table.lock(bucket):
+            off, found = table.find(bucket, h)
+            if found:
+                _, w_win, cur, prev, _ = SLOT.unpack_from(table.map, off)
+                if w_win != win:
+                    prev = cur if w_win == win - 1 else 0
+                    cur = 0
+            elif not consume:
+                return self.calls >= 1
+            else:
+                if SLOT.unpack_from(table.map, off)[0]:
+                    self.evictions += 1
+                cur = prev = 0
+            weight = 1 - (now - win * self.per) / self.per
+            allowed = prev * weight + cur + 1 <= self.calls
+            if consume:
+                SLOT.pack_into(table.map, off, h, win, cur + allowed, prev, int(now))
+            return allowed
@@ -1,15 +1,23 @@
 import os
+import math
 import hashlib
 import hmac
 import secrets
-from datetime import datetime, timedelta
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
+from datetime import datetime, timedelta, timezone
+from argon2 import extract_parameters
+from argon2.exceptions import VerifyMismatchError, InvalidHash
 import jwt
+from . import keyring, password_profiles
 
-ph = PasswordHasher(time_cost=3, memory_cost=65536, parallelism=2)
+# parameters come from ARGON2_PROFILE (see password_profiles)
+ph = password_profiles.make_hasher()
 JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret")
 JWT_ALG = "HS256"
+# HMAC key for stored token hashes; defaults to JWT_SECRET so existing hashes stay valid
+TOKEN_HASH_SECRET = os.getenv("TOKEN_HASH_SECRET", JWT_SECRET).encode()
+# once signing keys are configured, HS256 tokens are only accepted while migrating
+JWT_ALLOW_HS256 = os.getenv("JWT_ALLOW_HS256", "0") == "1"
+JWT_ISSUER = os.getenv("JWT_ISSUER")
 
 def hash_password(password: str) -> str:
     return ph.hash(password)
@@ -20,19 +28,45 @@ def verify_password(hash: str, password: str) -> bool:
     except VerifyMismatchError:
         return False
 
+def needs_rehash(hash: str) -> bool:
+    """True when ``hash`` was made with weaker parameters than the active profile's.
+
+    A profile with lower costs (a mistaken override, calibrating on a slow
+    host) only applies to new passwords; stored hashes are never made weaker.
+    """
+    try:
+        if not ph.check_needs_rehash(hash):
+            return False
+        old = extract_parameters(hash)
+    except InvalidHash:
+        return False
+    return ph.time_cost >= old.time_cost and ph.memory_cost >= old.memory_cost
+
 def random_token(nbytes: int = 32) -> str:
     return secrets.token_urlsafe(nbytes)
 
 def hash_token(token: str) -> str:
     # use HMAC-SHA256 with a server secret for token hashing
-    return hmac.new(JWT_SECRET.encode(), token.encode(), hashlib.sha256).hexdigest()
+    return hmac.new(TOKEN_HASH_SECRET, token.encode(), hashlib.sha256).hexdigest()
 
 def create_access_token(sub: str, expires_minutes: int = 10, extra_claims: dict | None = None) -> str:
     now = datetime.utcnow()
-    payload = {"sub": sub, "exp": now + timedelta(minutes=expires_minutes), "iat": now}
+    # jti lets a single token be revoked; iat keeps milliseconds (RFC 7519 allows
+    # fractional NumericDates) so a token issued just after a revoke-all passes;
+    # truncated, never rounded up past a cutoff it was issued before
+    payload = {"sub": sub, "exp": now + timedelta(minutes=expires_minutes),
+               "iat": math.floor(now.replace(tzinfo=timezone.utc).timestamp() * 1000) / 1000, "jti": secrets.token_urlsafe(12)}
+    if JWT_ISSUER:
+        payload["iss"] = JWT_ISSUER
     if extra_claims:
         payload.update(extra_claims)
+    ring = keyring.ring
+    if ring.enabled:
+        return ring.sign(payload)
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
 def decode_access_token(token: str) -> dict:
-    return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
+    ring = keyring.ring
+    if ring.enabled and not (JWT_ALLOW_HS256 and jwt.get_unverified_header(token).get("alg") == JWT_ALG):
+        return ring.verify(token, issuer=JWT_ISSUER)
+    return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG], issuer=JWT_ISSUER)
@@ -0,0 +1,102 @@
+"""Local access-token verification for other services.
+
+Depends only on PyJWT with the ``crypto`` extra, so it can be copied into
+another service as is:
+
+    from verifier import TokenVerifier
+
+    verifier = TokenVerifier("https://auth.example.com/.well-known/jwks.json", issuer="next-planner")
+    claims = verifier.verify(token)   # raises jwt.InvalidTokenError
+
+The JWKS is fetched once and each key is parsed once, then cached in
+process, so verifying a token makes no network calls. The document is
+refetched after ``cache_seconds`` (default: the endpoint's Cache-Control
+max-age), or when a token names an unknown kid, at most once per
+``min_refresh_seconds``. If a refetch fails the cached keys stay in use.
+Pass ``jwks=`` (a dict) instead of a URL to verify fully offline.
+"""
+import json
+import re
+import time
+import threading
+import urllib.request
+import jwt
+
+# JWK "alg" values this verifier accepts; never HS256 (no shared secrets)
+ALGORITHMS = ("EdDSA", "ES256")
+
+
+class TokenVerifier:
+    def __init__(self, jwks_url: str | None = None, jwks: dict | None = None, issuer: str | None = None,
+                 audience: str | None = None, leeway: float = 0, cache_seconds: float | None = None,
+                 min_refresh_seconds: float = 30, timeout: float = 2):
+        if not jwks_url and jwks is None:
+            raise ValueError("pass jwks_url or jwks")
+        self.jwks_url = jwks_url
+        self.issuer = issuer
+        self.audience = audience
+        self.leeway = leeway
+        self.cache_seconds = cache_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self.timeout = timeout
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._expires = float("inf")
+        self._last_fetch = float("-inf")
+        if jwks is not None:
+            self._load(jwks)
+
+    def _load(self, jwks: dict):
+        keys = {}
+        for jwk in jwks.get("keys", ()):
+            if jwk.get("use", "sig") != "sig" or jwk.get("alg") not in ALGORITHMS or not jwk.get("kid"):
+                continue
+            keys[jwk["kid"]] = (jwt.PyJWK(jwk).key, jwk["alg"])
+        self._keys = keys
+
+    def _fetch(self):
+        self._last_fetch = time.monotonic()
+        with urllib.request.urlopen(self.jwks_url, timeout=self.timeout) as resp:
+            body = json.loads(resp.read())
+            max_age = re.search(r"max-age=(\d+)", resp.headers.get("Cache-Control", ""))
+        self._load(body)
+        ttl = self.cache_seconds if self.cache_seconds is not None else int(max_age.group(1)) if max_age else 300
+        self._expires = time.monotonic() + ttl
+
+    def _refresh(self, force: bool):
+        if not self.jwks_url:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if force and now - self._last_fetch < self.min_refresh_seconds:
+                return
+            if not force and now < self._expires:
+                return  # another thread refreshed while we waited
+            try:
+                self._fetch()
+            except Exception:
+                if not self._keys:
+                    raise
+                # keep verifying with the cached keys; retry after the back-off
+                self._expires = now + self.min_refresh_seconds
+
+    def key_for(self, kid: str):
+        if time.monotonic() >= self._expires:
+            self._refresh(force=False)
+        entry = self._keys.get(kid)
+        if entry is None:
+            self._refresh(force=True)
+            entry = self._keys.get(kid)
+        if entry is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        return entry
+
+    def verify(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if self.jwks_url and not self._keys:
+            self._refresh(force=True)
+        key, alg = self.key_for(kid)
+        return jwt.decode(
+            token, key, algorithms=[alg], issuer=self.issuer, audience=self.audience, leeway=self.leeway,
+            options={"require": ["exp", "sub"], "verify_aud": self.audience is not None},
+        )
@@ -0,0 +1 @@
+"""Benchmarks for the auth backend. Run from ``backend/`` with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,57 @@
+"""Access-token sign/verify cost: HS256 against EdDSA and ES256.
+
+    python -m benchmarks.bench_jwt --tokens 5000
+
+Verification is measured three ways: with the cached key objects the
+keyring and TokenVerifier keep, through ``TokenVerifier`` (kid lookup plus
+claim checks), and re-parsing the PEM / JWK on every call, which is what a
+verifier without a key cache pays.
+"""
+import argparse
+import time
+import jwt
+from app import keyring
+from app.verifier import TokenVerifier
+
+
+def per_call_us(fn, n: int) -> float:
+    for _ in range(min(n, 200)):
+        fn()
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter_ns() - t0) / n / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=5000)
+    args = parser.parse_args()
+    n = args.tokens
+    payload = {"sub": "00000000-0000-0000-0000-000000000000", "exp": int(time.time()) + 600, "sid": "bench"}
+
+    secret = "bench-secret"
+    hs = jwt.encode(payload, secret, algorithm="HS256")
+    print(f"{'':8}{'sign':>10}{'verify':>10}{'verifier':>10}{'re-parse':>10}  (us/token)")
+    print(f"{'HS256':8}{per_call_us(lambda: jwt.encode(payload, secret, algorithm='HS256'), n):10.1f}"
+          f"{per_call_us(lambda: jwt.decode(hs, secret, algorithms=['HS256']), n):10.1f}{'-':>10}{'-':>10}")
+
+    for alg in ("EdDSA", "ES256"):
+        key = keyring.SigningKey(keyring.new_kid(0), keyring.generate_private_key(alg))
+        ring = keyring.Keyring(keys=[key])
+        token = ring.sign(payload)
+        verifier = TokenVerifier(jwks={"keys": [key.jwk]})
+        pem = key.to_pem()
+
+        def reparse():
+            public_key = keyring.SigningKey.from_pem(key.kid, pem).public_key
+            return jwt.decode(token, public_key, algorithms=[alg])
+
+        print(f"{alg:8}{per_call_us(lambda: ring.sign(payload), n):10.1f}"
+              f"{per_call_us(lambda: ring.verify(token), n):10.1f}"
+              f"{per_call_us(lambda: verifier.verify(token), n):10.1f}"
+              f"{per_call_us(reparse, n):10.1f}")
+
+
+if __name__ == "__main__":
+    main()
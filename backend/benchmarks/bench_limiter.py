@@ -0,0 +1,53 @@
+"""In-process rate limiter throughput and memory under a flood of distinct keys.
+
+    python -m benchmarks.bench_limiter --keys 5000000 --max-keys 100000
+
+Each check uses a new key (spoofed-IP flood), then a hot-key phase repeats a
+small key set. Reports ns/check and process RSS growth.
+"""
+import argparse
+import resource
+import time
+from app.rate_limiter import InMemoryLimiter
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(limiter, keys) -> float:
+    allow = limiter.allow
+    t0 = time.perf_counter_ns()
+    for k in keys:
+        allow(k)
+    return (time.perf_counter_ns() - t0) / len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=2_000_000, help="distinct keys in the flood phase")
+    parser.add_argument("--max-keys", type=int, default=100_000, help="limiter key cap")
+    parser.add_argument("--batch", type=int, default=500_000)
+    args = parser.parse_args()
+
+    limiter = InMemoryLimiter(100, 60, max_keys=args.max_keys)
+    base = rss_mb()
+    print(f"{'keys seen':>10} {'tracked':>9} {'ns/check':>9} {'rss +MB':>8}")
+    for lo in range(0, args.keys, args.batch):
+        keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}:{i}" for i in range(lo, min(args.keys, lo + args.batch))]
+        ns = run(limiter, keys)
+        print(f"{lo + len(keys):>10} {len(limiter.data):>9} {ns:>9.0f} {rss_mb() - base:>8.1f}")
+
+    hot = [f"hot-{i % 1000}" for i in range(args.batch)]
+    print(f"hot keys: {run(limiter, hot):.0f} ns/check, evictions={limiter.evictions}")
+
+
+if __name__ == "__main__":
+    main()
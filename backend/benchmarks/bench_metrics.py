@@ -0,0 +1,58 @@
+"""Overhead of the metrics layer on the request path.
+
+    python -m benchmarks.bench_metrics --requests 20000 --queries 20000
+
+Compares a trivial ASGI app with and without RequestContextMiddleware (no
+network, so the difference is the middleware alone), in-memory SQLite
+``SELECT 1`` with and without the cursor-event timers, and the cost of one
+stage observation.
+"""
+import argparse
+import time
+from sqlalchemy import create_engine, text
+from app import metrics
+from app.middleware import RequestContextMiddleware
+from .common import asgi_ns
+
+
+async def _plain_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def query_ns(engine, n: int) -> float:
+    with engine.connect() as conn:
+        stmt = text("SELECT 1")
+        for _ in range(200):
+            conn.execute(stmt)
+        t0 = time.perf_counter_ns()
+        for _ in range(n):
+            conn.execute(stmt)
+        return (time.perf_counter_ns() - t0) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    args = parser.parse_args()
+
+    bare = asgi_ns(_plain_app, args.requests)
+    wrapped = asgi_ns(RequestContextMiddleware(_plain_app), args.requests)
+    print(f"request middleware: {bare / 1000:.1f} -> {wrapped / 1000:.1f} us/request (+{(wrapped - bare) / 1000:.1f} us)")
+
+    plain_engine = create_engine("sqlite://")
+    timed_engine = create_engine("sqlite://")
+    metrics.instrument_engine(timed_engine)
+    plain, timed = query_ns(plain_engine, args.queries), query_ns(timed_engine, args.queries)
+    print(f"query timers:       {plain / 1000:.1f} -> {timed / 1000:.1f} us/query (+{(timed - plain) / 1000:.1f} us)")
+
+    n = args.requests * 5
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        metrics.observe_stage("bench", 0.001)
+    print(f"observe_stage:      {(time.perf_counter_ns() - t0) / n:.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Rate limiter throughput with several worker processes: in-process, shared memory and Redis.
+
+    python -m benchmarks.bench_shared_limiter --procs 4 --checks 50000
+
+Each process runs ``--checks`` allow() calls (a hot key set, like a burst
+from a few clients) against its backend; ops/s is the total over the wall
+time of all processes. Redis runs only when REDIS_URL is reachable.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from .load import BACKEND
+
+_WORKER = """
+import sys, time
+backend, path, checks = sys.argv[1], sys.argv[2], int(sys.argv[3])
+from app import rate_limiter
+if backend == "memory":
+    limiter = rate_limiter.InMemoryLimiter(10**9, 60)
+elif backend == "shm":
+    from app.shared_limiter import SharedTable, SharedMemoryLimiter
+    limiter = SharedMemoryLimiter(10**9, 60, SharedTable(path, 200000), name="bench")
+else:
+    rate_limiter.health.check()
+    limiter = rate_limiter.RedisLimiter(10**9, 60, name="bench")
+keys = [f"10.0.0.{i % 256}" for i in range(checks)]
+sys.stdout.write("ready\\n"); sys.stdout.flush()
+sys.stdin.readline()
+t0 = time.perf_counter()
+for k in keys:
+    limiter.allow(k)
+print(time.perf_counter() - t0)
+"""
+
+
+def run(backend: str, procs: int, checks: int, path: str) -> dict:
+    workers = [subprocess.Popen([sys.executable, "-c", _WORKER, backend, path, str(checks)], cwd=BACKEND,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) for _ in range(procs)]
+    for w in workers:
+        w.stdout.readline()
+    t0 = time.perf_counter()
+    for w in workers:
+        w.stdin.write("go\n")
+        w.stdin.flush()
+    per_proc = [float(w.communicate()[0]) for w in workers]
+    wall = time.perf_counter() - t0
+    return {"ops_s": procs * checks / wall, "us_per_check": 1e6 * max(per_proc) / checks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--checks", type=int, default=50_000, help="allow() calls per process")
+    args = parser.parse_args()
+
+    from app import rate_limiter
+
+    backends = ["memory", "shm"] + (["redis"] if rate_limiter.health.check() else [])
+    print(f"{'backend':<8} {'ops/s':>10} {'us/check':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            r = run(backend, args.procs, args.checks, os.path.join(tmp, "rl"))
+            print(f"{backend:<8} {r['ops_s']:>10.0f} {r['us_per_check']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Worker import time and cold start, for scaling workers up under load.
+
+    python -m benchmarks.bench_startup --runs 5
+
+``import``: seconds to ``import app.main`` in a fresh interpreter.
+``cold_start``: seconds from launching uvicorn to the first 200 from ``/``,
+against a migrated scratch SQLite database. REDIS_URL points at a
+blackholed address by default, so a Redis outage that delays boot shows up
+here (pass ``--redis-url ""`` to run without Redis). Results are compared
+with a JSON baseline like the other gated benchmarks.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from .common import check_baseline
+from .load import BACKEND, HERE, _free_port
+
+_IMPORT = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def import_seconds(env: dict) -> float:
+    out = subprocess.run([sys.executable, "-c", _IMPORT], cwd=BACKEND, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def cold_start_seconds(env: dict, timeout: float = 60) -> float:
+    import httpx
+
+    port = _free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=BACKEND, env=env, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - t0 < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/", timeout=0.5).status_code == 200:
+                    return time.perf_counter() - t0
+            except httpx.HTTPError:
+                pass
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            time.sleep(0.01)
+        raise RuntimeError("uvicorn did not become ready")
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def summarize(samples) -> dict:
+    return {"median_s": round(statistics.median(samples), 3), "max_s": round(max(samples), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--redis-url", default="redis://10.255.255.1:6379/0")
+    parser.add_argument("--baseline", default=os.path.join(HERE, "baseline_startup.json"))
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    url = f"sqlite:///{tmp.name}"
+    env = dict(os.environ, DATABASE_URL=url, REDIS_URL=args.redis_url, ENV="development", RETENTION_ENABLED="0", SMTP_HOST="")
+    os.environ.update(DATABASE_URL=url)
+    from sqlalchemy import create_engine
+    from app import schema
+
+    engine = create_engine(url)
+    schema.upgrade(engine)
+    engine.dispose()
+    try:
+        results = {
+            "import": summarize([import_seconds(env) for _ in range(args.runs)]),
+            "cold_start": summarize([cold_start_seconds(env) for _ in range(args.runs)]),
+        }
+    finally:
+        os.unlink(tmp.name)
+    sys.exit(check_baseline(results, args.baseline, args.threshold, args.update_baseline))
+
+
+if __name__ == "__main__":
+    main()
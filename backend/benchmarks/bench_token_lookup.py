@@ -0,0 +1,92 @@
+"""Refresh-token lookup latency as the refresh_tokens table grows.
+
+    python -m benchmarks.bench_token_lookup
+    python -m benchmarks.bench_token_lookup --sizes 10000,100000 --drop-indexes
+
+Rows are bulk-inserted into a scratch database (SQLite by default, or
+``--database-url`` for Postgres), then the same ``token_hash == h`` query
+the /refresh handler uses is timed against random existing tokens.
+``--drop-indexes`` shows the pre-index full-scan behaviour for comparison.
+The default sizes go to 10M rows, which takes about 10 minutes on SQLite.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+from app import models, utils
+from app.database import Base
+
+
+def fill(engine, start: int, stop: int, user_id: str, chunk: int = 50_000):
+    expires = datetime.utcnow() + timedelta(days=14)
+    table = models.RefreshToken.__table__
+    with engine.begin() as conn:
+        for lo in range(start, stop, chunk):
+            rows = [
+                {"id": str(uuid.uuid4()), "user_id": user_id, "token_hash": utils.hash_token(str(i)), "expires_at": expires, "revoked": False}
+                for i in range(lo, min(stop, lo + chunk))
+            ]
+            conn.execute(insert(table), rows)
+
+
+def time_lookups(engine, size: int, samples: int) -> list:
+    hashes = [utils.hash_token(str(random.randrange(size))) for _ in range(samples)]
+    out = []
+    with Session(engine) as db:
+        for h in hashes:
+            t0 = time.perf_counter_ns()
+            rt = db.query(models.RefreshToken).filter(models.RefreshToken.token_hash == h).first()
+            out.append(time.perf_counter_ns() - t0)
+            assert rt is not None
+            db.expunge_all()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000,10000000", help="comma separated table sizes")
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--database-url", help="scratch database; defaults to a temporary SQLite file")
+    parser.add_argument("--drop-indexes", action="store_true", help="benchmark without the token_hash indexes")
+    args = parser.parse_args()
+
+    tmp = None
+    url = args.database_url
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite:///{tmp.name}"
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    if args.drop_indexes:
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX ix_refresh_tokens_token_hash"))
+
+    user_id = str(uuid.uuid4())
+    with engine.begin() as conn:
+        conn.execute(insert(models.User.__table__), [{"id": user_id, "email": "bench@example.com"}])
+
+    print(f"{'rows':>10} {'p50 us':>10} {'p99 us':>10} {'fill s':>8}")
+    filled = 0
+    for size in sorted(int(s) for s in args.sizes.split(",")):
+        t0 = time.perf_counter()
+        fill(engine, filled, size, user_id)
+        filled = size
+        fill_s = time.perf_counter() - t0
+        samples = time_lookups(engine, size, args.samples)
+        q = statistics.quantiles(samples, n=100)
+        print(f"{size:>10} {q[49] / 1000:>10.1f} {q[98] / 1000:>10.1f} {fill_s:>8.1f}")
+
+    engine.dispose()
+    if tmp:
+        os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Shared helpers: latency summaries, JSON baselines with regression checks
+and in-process ASGI timing."""
+import asyncio
+import json
+import os
+import statistics
+import time
+
+# metrics where a larger value is better; everything else is a latency
+HIGHER_IS_BETTER = ("rps", "ops_per_s")
+
+
+def summarize_ns(samples) -> dict:
+    """p50/p99 in microseconds and throughput for a list of per-op nanosecond timings."""
+    q = statistics.quantiles(samples, n=100) if len(samples) > 1 else [samples[0]] * 99
+    return {
+        "p50_us": round(q[49] / 1000, 3),
+        "p99_us": round(q[98] / 1000, 3),
+        "ops_per_s": round(1e9 / statistics.fmean(samples), 1),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return human-readable regressions of ``results`` against ``baseline``."""
+    failures = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key, value in metrics.items():
+            ref = base.get(key)
+            if not isinstance(value, (int, float)) or not ref:
+                continue
+            if key in HIGHER_IS_BETTER:
+                if value < ref * (1 - threshold):
+                    failures.append(f"{name}.{key}: {value} < {ref} (-{(1 - value / ref):.0%})")
+            elif value > ref * (1 + threshold):
+                failures.append(f"{name}.{key}: {value} > {ref} (+{(value / ref - 1):.0%})")
+    return failures
+
+
+def check_baseline(results: dict, path: str, threshold: float, update: bool = False) -> int:
+    """Print results, compare with the baseline at ``path`` and return a process exit code.
+
+    ``update`` writes the current results as the new baseline. A missing
+    baseline is an error, so a gate without one cannot pass silently.
+    """
+    for name, metrics in results.items():
+        print(f"{name:<28} " + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+    if update:
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"baseline written to {path}")
+        return 0
+    if not os.path.exists(path):
+        print(f"no baseline at {path}; record one with --update-baseline")
+        return 2
+    with open(path) as f:
+        baseline = json.load(f)
+    failures = compare(results, baseline, threshold)
+    for line in failures:
+        print(f"REGRESSION {line}")
+    if failures:
+        return 1
+    print(f"no regressions beyond {threshold:.0%} of {path}")
+    return 0
+
+
+def asgi_ns(app, n: int, method: str = "GET", path: str = "/", body: bytes = b"", headers=()) -> float:
+    """Mean ns per request for ``app`` called directly, without a server or socket."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"content-length", str(len(body)).encode()), *headers],
+        "client": ("10.0.0.1", 50000), "server": ("bench", 80),
+    }
+
+    request = {"type": "http.request", "body": body, "more_body": False}
+    never = asyncio.Event()
+
+    def receiver():
+        # like a server: the body once, then block until the client disconnects
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                await never.wait()
+            sent = True
+            return request
+
+        return receive
+
+    async def send(message):
+        pass
+
+    async def run():
+        for _ in range(min(n, 200)):
+            await app(dict(scope), receiver(), send)
+        t0 = time.perf_counter_ns()
+        for _ in range(n):
+            await app(dict(scope), receiver(), send)
+        return (time.perf_counter_ns() - t0) / n
+
+    return asyncio.run(run())
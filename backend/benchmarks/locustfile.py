@@ -0,0 +1,53 @@
+"""Locust version of the load mix for interactive runs and distributed load.
+
+    pip install -r requirements_bench.txt
+    LOAD_EMAILS=a@example.com,b@example.com locust -f benchmarks/locustfile.py --host http://localhost:8000
+
+Users listed in LOAD_EMAILS must exist, be verified and use LOAD_PASSWORD.
+Weights match ``MIX`` in benchmarks/load.py. For CI gating use
+``python -m benchmarks.load``, which seeds its own database and compares
+against a baseline.
+"""
+import os
+import random
+import uuid
+from locust import HttpUser, task, between
+
+EMAILS = [e for e in os.getenv("LOAD_EMAILS", "").split(",") if e]
+PASSWORD = os.getenv("LOAD_PASSWORD", "load-test-password")
+
+
+class AuthUser(HttpUser):
+    wait_time = between(0, 0.05)
+
+    def on_start(self):
+        self.email = random.choice(EMAILS) if EMAILS else None
+        self.access = None
+        self.signin()
+
+    @task(5)
+    def signup(self):
+        self.client.post("/api/auth/signup", json={"email": f"new-{uuid.uuid4().hex}@example.com", "password": PASSWORD})
+
+    @task(10)
+    def signin(self):
+        if not self.email:
+            return
+        r = self.client.post("/api/auth/signin", json={"email": self.email, "password": PASSWORD})
+        if r.status_code == 200:
+            self.access = r.json()["access_token"]
+
+    @task(25)
+    def refresh(self):
+        csrf = self.client.cookies.get("csrf_token")
+        if not csrf:
+            return self.signin()
+        r = self.client.post("/api/auth/refresh", headers={"x-csrf": csrf})
+        if r.status_code == 200:
+            self.access = r.json()["access_token"]
+
+    @task(60)
+    def sessions(self):
+        if not self.access:
+            return self.signin()
+        self.client.get("/api/auth/sessions", headers={"Authorization": f"Bearer {self.access}"})
@@ -0,0 +1,81 @@
+"""Micro-benchmarks for the auth hot path.
+
+    python -m benchmarks.micro                         # compare with benchmarks/baseline_micro.json
+    python -m benchmarks.micro --update-baseline       # record a new baseline
+    python -m benchmarks.micro --only limiter          # substring filter
+
+Covers utils.hash_token, access-token sign/verify, Argon2 hash/verify and
+the in-process, shared-memory and Redis limiters (Redis only when REDIS_URL
+is reachable). Exits non-zero when p50/p99 or ops/s regress past
+``--threshold``.
+"""
+import argparse
+import os
+import time
+import tempfile
+from app import utils, rate_limiter
+from app.shared_limiter import SharedTable, SharedMemoryLimiter
+from .common import summarize_ns, check_baseline
+
+HERE = os.path.dirname(__file__)
+
+
+def measure(fn, iterations: int, batch: int = 1) -> dict:
+    """Time ``fn`` in batches; each sample is the mean ns/op of one batch."""
+    for _ in range(min(iterations, 50)):
+        fn()
+    samples = []
+    for _ in range(max(1, iterations // batch)):
+        t0 = time.perf_counter_ns()
+        for _ in range(batch):
+            fn()
+        samples.append((time.perf_counter_ns() - t0) / batch)
+    return summarize_ns(samples)
+
+
+def cases(quick: bool):
+    token = utils.random_token()
+    access = utils.create_access_token("00000000-0000-0000-0000-000000000000", expires_minutes=15)
+    pwd_hash = utils.hash_password("correct horse battery staple")
+    n_fast = 2_000 if quick else 20_000
+    n_argon = 5 if quick else 30
+    mem = rate_limiter.InMemoryLimiter(10**9, 60)
+    counter = iter(range(10**12))
+    yield "hash_token", lambda: utils.hash_token(token), n_fast, 10
+    yield "create_access_token", lambda: utils.create_access_token("00000000-0000-0000-0000-000000000000", expires_minutes=15), n_fast, 10
+    yield "decode_access_token", lambda: utils.decode_access_token(access), n_fast, 10
+    yield "argon2_hash", lambda: utils.hash_password("correct horse battery staple"), n_argon, 1
+    yield "argon2_verify", lambda: utils.verify_password(pwd_hash, "correct horse battery staple"), n_argon, 1
+    yield "limiter_memory_hot", lambda: mem.allow("10.0.0.1"), n_fast, 10
+    yield "limiter_memory_distinct", lambda: mem.allow(f"k{next(counter)}"), n_fast, 10
+    shm_dir = tempfile.mkdtemp()
+    shm = SharedMemoryLimiter(10**9, 60, SharedTable(os.path.join(shm_dir, "rl"), 200_000))
+    yield "limiter_shm_hot", lambda: shm.allow("10.0.0.1"), n_fast, 10
+    yield "limiter_shm_distinct", lambda: shm.allow(f"k{next(counter)}"), n_fast, 10
+    # Redis connects lazily; one blocking check decides whether to run these
+    if rate_limiter.health.check():
+        red = rate_limiter.RedisLimiter(10**9, 60, name="bench")
+        ip = rate_limiter.RedisLimiter(10**9, 60, name="bench-ip")
+        yield "limiter_redis", lambda: red.allow("10.0.0.1"), n_fast // 10, 1
+        yield "limiter_redis_two_keys", lambda: rate_limiter.allow_all([(ip, "10.0.0.1"), (red, "a@example.com")]), n_fast // 10, 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=os.path.join(HERE, "baseline_micro.json"))
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--only", help="run cases whose name contains this string")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations (smoke run)")
+    args = parser.parse_args()
+
+    results = {}
+    for name, fn, iterations, batch in cases(args.quick):
+        if args.only and args.only not in name:
+            continue
+        results[name] = measure(fn, iterations, batch)
+    raise SystemExit(check_baseline(results, args.baseline, args.threshold, args.update_baseline))
+
+
+if __name__ == "__main__":
+    main()
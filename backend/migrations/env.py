@@ -0,0 +1,38 @@
+from logging.config import fileConfig
+from alembic import context
+from app.database import Base, direct_engine
+from app import models  # noqa: F401 - register tables on Base.metadata
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    context.configure(url=str(direct_engine.url), target_metadata=target_metadata, literal_binds=True, render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def _run(connection):
+    context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # app.schema.upgrade passes its own connection
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run(connection)
+        return
+    with direct_engine.connect() as connection:
+        _run(connection)
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
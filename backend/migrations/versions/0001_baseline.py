@@ -0,0 +1,62 @@
+"""baseline schema (what Base.metadata.create_all produced before migrations)
+
+Databases created by the old startup hook should be marked with
+``alembic stamp 0001`` before running ``alembic upgrade head``.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+user_status = sa.Enum("active", "suspended", "deleted", name="userstatus")
+token_type = sa.Enum("email_verification", "password_reset", "email_change", "trial_access", name="tokentype")
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("email_verified", sa.Boolean()),
+        sa.Column("password_hash", sa.Text()),
+        sa.Column("status", user_status),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+    op.create_table(
+        "refresh_tokens",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("user_id", sa.String(36), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("token_hash", sa.Text(), nullable=False),
+        sa.Column("device_info", sa.Text()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("revoked", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_table(
+        "one_time_tokens",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("user_id", sa.String(36), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("token_hash", sa.Text(), nullable=False),
+        sa.Column("type", token_type, nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("used", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+
+
+def downgrade():
+    op.drop_table("one_time_tokens")
+    op.drop_table("refresh_tokens")
+    op.drop_index("ix_users_email", table_name="users")
+    op.drop_table("users")
+    user_status.drop(op.get_bind(), checkfirst=True)
+    token_type.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,35 @@
+"""fixed-width token hashes with unique and composite indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("refresh_tokens") as batch:
+        batch.alter_column("token_hash", existing_type=sa.Text(), type_=sa.CHAR(64), existing_nullable=False, postgresql_using="token_hash::char(64)")
+        batch.create_index("ix_refresh_tokens_token_hash", ["token_hash"], unique=True)
+        batch.create_index("ix_refresh_tokens_user_id_revoked", ["user_id", "revoked"])
+    with op.batch_alter_table("one_time_tokens") as batch:
+        batch.alter_column("token_hash", existing_type=sa.Text(), type_=sa.CHAR(64), existing_nullable=False, postgresql_using="token_hash::char(64)")
+        batch.create_index("ix_one_time_tokens_token_hash", ["token_hash"], unique=True)
+        batch.create_index("ix_one_time_tokens_token_hash_type", ["token_hash", "type"])
+
+
+def downgrade():
+    with op.batch_alter_table("one_time_tokens") as batch:
+        batch.drop_index("ix_one_time_tokens_token_hash_type")
+        batch.drop_index("ix_one_time_tokens_token_hash")
+        batch.alter_column("token_hash", existing_type=sa.CHAR(64), type_=sa.Text(), existing_nullable=False)
+    with op.batch_alter_table("refresh_tokens") as batch:
+        batch.drop_index("ix_refresh_tokens_user_id_revoked")
+        batch.drop_index("ix_refresh_tokens_token_hash")
+        batch.alter_column("token_hash", existing_type=sa.CHAR(64), type_=sa.Text(), existing_nullable=False)
@@ -0,0 +1,39 @@
+"""email outbox table
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+email_status = sa.Enum("pending", "sent", "dead", name="emailstatus")
+
+
+def upgrade():
+    op.create_table(
+        "email_outbox",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("to_address", sa.String(), nullable=False),
+        sa.Column("subject", sa.Text(), nullable=False),
+        sa.Column("body", sa.Text(), nullable=False),
+        sa.Column("status", email_status, nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+        sa.Column("locked_until", sa.DateTime()),
+        sa.Column("last_error", sa.Text()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("sent_at", sa.DateTime()),
+    )
+    op.create_index("ix_email_outbox_status_next_attempt_at", "email_outbox", ["status", "next_attempt_at"])
+
+
+def downgrade():
+    op.drop_index("ix_email_outbox_status_next_attempt_at", table_name="email_outbox")
+    op.drop_table("email_outbox")
+    email_status.drop(op.get_bind(), checkfirst=True)
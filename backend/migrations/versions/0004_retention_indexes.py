@@ -0,0 +1,24 @@
+"""indexes for the retention sweeper
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_refresh_tokens_expires_at", "refresh_tokens", ["expires_at"])
+    op.create_index("ix_refresh_tokens_revoked_created_at", "refresh_tokens", ["revoked", "created_at"])
+    op.create_index("ix_one_time_tokens_expires_at", "one_time_tokens", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("ix_one_time_tokens_expires_at", table_name="one_time_tokens")
+    op.drop_index("ix_refresh_tokens_revoked_created_at", table_name="refresh_tokens")
+    op.drop_index("ix_refresh_tokens_expires_at", table_name="refresh_tokens")
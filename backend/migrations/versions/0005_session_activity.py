@@ -0,0 +1,25 @@
+"""session activity columns on refresh_tokens
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("refresh_tokens") as batch:
+        batch.add_column(sa.Column("last_seen_at", sa.DateTime(), nullable=True))
+        batch.add_column(sa.Column("last_ip", sa.String(length=45), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("refresh_tokens") as batch:
+        batch.drop_column("last_ip")
+        batch.drop_column("last_seen_at")
@@ -0,0 +1,20 @@
+"""index for keyset pagination of sessions
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_refresh_tokens_user_id_created_at_id", "refresh_tokens", ["user_id", "created_at", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_refresh_tokens_user_id_created_at_id", table_name="refresh_tokens")
@@ -0,0 +1,35 @@
+"""access-token revocations
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "token_revocations",
+        sa.Column("id", sa.String(36), primary_key=True),
+        sa.Column("kind", sa.String(8), nullable=False),
+        sa.Column("value", sa.String(64), nullable=False),
+        sa.Column("valid_after", sa.DateTime()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_token_revocations_created_at", "token_revocations", ["created_at"])
+    op.create_index("ix_token_revocations_value", "token_revocations", ["value"])
+    op.create_index("ix_token_revocations_expires_at", "token_revocations", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("ix_token_revocations_expires_at", table_name="token_revocations")
+    op.drop_index("ix_token_revocations_value", table_name="token_revocations")
+    op.drop_index("ix_token_revocations_created_at", table_name="token_revocations")
+    op.drop_table("token_revocations")
@@ -0,0 +1,29 @@
+"""refresh token families and rotation state
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("refresh_tokens") as batch:
+        batch.add_column(sa.Column("family_id", sa.String(length=36), nullable=True))
+        batch.add_column(sa.Column("rotated_at", sa.DateTime(), nullable=True))
+        batch.add_column(sa.Column("replaced_by", sa.String(length=36), nullable=True))
+    op.create_index("ix_refresh_tokens_family_id", "refresh_tokens", ["family_id"])
+
+
+def downgrade():
+    op.drop_index("ix_refresh_tokens_family_id", table_name="refresh_tokens")
+    with op.batch_alter_table("refresh_tokens") as batch:
+        batch.drop_column("replaced_by")
+        batch.drop_column("rotated_at")
+        batch.drop_column("family_id")
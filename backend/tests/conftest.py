@@ -0,0 +1,75 @@
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+import pytest
+
+# cheap Argon2 parameters for the suite; set before app modules build the hasher.
+# The test profile refuses to run in production, which is the ENV default.
+os.environ.setdefault("ARGON2_PROFILE", "test")
+os.environ.setdefault("ENV", "development")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+PASSWORD = "pw123456"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    from app.database import Base, engine
+    Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture
+def new_client(monkeypatch):
+    """Factory for TestClients with limits out of the way; the limiters are restored after the test."""
+    from fastapi.testclient import TestClient
+    from app import main as app_main, rate_limiter
+    monkeypatch.setattr(rate_limiter, "ip_limiter", rate_limiter.InMemoryLimiter(10000, 60))
+    monkeypatch.setattr(rate_limiter, "auth_limiter", rate_limiter.InMemoryLimiter(10000, 60))
+    return lambda: TestClient(app_main.app)
+
+
+@pytest.fixture
+def client(new_client):
+    return new_client()
+
+
+@pytest.fixture
+def verified_user():
+    """Factory: creates a verified user with PASSWORD, returns (id, email)."""
+    from app import models, utils
+    from app.database import SessionLocal
+
+    def make(prefix: str = "user", password_hash: str | None = None):
+        db = SessionLocal()
+        user = models.User(email=f"{prefix}-{uuid.uuid4().hex[:8]}@example.com", email_verified=True,
+                           password_hash=password_hash or utils.hash_password(PASSWORD))
+        db.add(user)
+        db.commit()
+        uid, email = user.id, user.email
+        db.close()
+        return uid, email
+    return make
+
+
+@pytest.fixture
+def count_queries():
+    """Context manager collecting the SQL statements run on the request engine."""
+    from sqlalchemy import event
+    from app import database
+
+    @contextmanager
+    def count():
+        statements = []
+        target = database.async_engine.sync_engine if database.async_engine else database.engine
+
+        def before(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(target, "before_cursor_execute", before)
+        try:
+            yield statements
+        finally:
+            event.remove(target, "before_cursor_execute", before)
+    return count
@@ -0,0 +1,87 @@
+import sys
+import os
+import uuid
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import models, utils, activity
+from app.database import engine, SessionLocal
+
+
+@pytest.fixture
+def session_row(verified_user):
+    def make():
+        uid, email = verified_user("act")
+        db = SessionLocal()
+        rt = models.RefreshToken(user_id=uid, token_hash=utils.hash_token(uuid.uuid4().hex), expires_at=datetime.utcnow() + timedelta(days=1))
+        db.add(rt)
+        db.commit()
+        sid = rt.id
+        db.close()
+        return sid, email
+    return make
+
+
+def _row(sid):
+    db = SessionLocal()
+    rt = db.get(models.RefreshToken, sid)
+    db.close()
+    return rt
+
+
+def test_buffer_coalesces_and_flushes_in_one_statement(session_row):
+    buf = activity.ActivityBuffer(flush_seconds=60, flush_entries=1000, max_pending=1000, bind=engine)
+    sids = [session_row()[0] for _ in range(3)]
+    t0 = datetime.utcnow()
+    for i in range(100):
+        buf.record(sids[i % 3], "10.0.0.1", "ua/1.0", now=t0 + timedelta(seconds=i))
+    assert buf.stats()["pending"] == 3
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert buf.flush() == 3
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len([s for s in statements if s.lstrip().upper().startswith("UPDATE")]) == 1
+    assert buf.stats()["pending"] == 0
+    assert _row(sids[0]).last_seen_at == t0 + timedelta(seconds=99)
+    assert _row(sids[0]).device_info == "ua/1.0"
+
+    # a flush carrying older activity (another worker) does not move last_seen_at back
+    buf.record(sids[0], "10.0.0.2", "ua/old", now=t0)
+    buf.flush()
+    assert _row(sids[0]).last_seen_at == t0 + timedelta(seconds=99)
+    assert _row(sids[0]).last_ip == "10.0.0.1"
+
+
+def test_buffer_bounds_pending_sessions():
+    buf = activity.ActivityBuffer(flush_seconds=60, flush_entries=1000, max_pending=2, bind=engine)
+    for i in range(5):
+        buf.record(f"s{i}", None, None)
+    buf.record("s0", None, None)  # already tracked sessions are still updated
+    assert buf.stats()["pending"] == 2
+    assert buf.stats()["dropped"] == 3
+
+
+def test_sessions_listing_merges_buffered_activity(client, session_row):
+    _, email = session_row()
+    r = client.post("/api/auth/signin", json={"email": email, "password": "pw123456"}, headers={"User-Agent": "signin-agent"})
+    access = r.json()["access_token"]
+    sid = utils.decode_access_token(access)["sid"]
+    assert _row(sid).device_info == "signin-agent"
+
+    headers = {"Authorization": f"Bearer {access}", "User-Agent": "browser/2.0"}
+    sessions = {s["id"]: s for s in client.get("/api/auth/sessions", headers=headers).json()}
+    # not flushed yet, but the listing already shows the request that made it
+    assert _row(sid).device_info == "signin-agent"
+    assert sessions[sid]["device_info"] == "browser/2.0"
+    assert sessions[sid]["last_ip"] == "testclient"
+    assert sessions[sid]["last_seen_at"] is not None
+
+    activity.buffer.flush()
+    assert _row(sid).device_info == "browser/2.0"
@@ -0,0 +1,60 @@
+import sys
+import os
+import asyncio
+import threading
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import database, models
+from app.database import Base
+
+
+def test_run_db_runs_sync_helpers_on_an_async_session(tmp_path, monkeypatch):
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async_engine = database._create_async_engine(f"sqlite:///{tmp_path / 'async.db'}")
+    monkeypatch.setattr(database, "DB_ASYNC", True)
+
+    def create_user(db, email):
+        db.add(models.User(email=email, password_hash="x"))
+        db.commit()
+        return threading.get_ident()
+
+    def find_user(db, email):
+        return db.query(models.User.email).filter(models.User.email == email).scalar()
+
+    async def run():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)() as db:
+            thread = await database.run_db(db, create_user, "async@example.com")
+            found = await database.run_db(db, find_user, "async@example.com")
+        await async_engine.dispose()
+        return thread, found
+
+    thread, found = asyncio.run(run())
+    # run_sync runs the helper on the event loop's thread, not the threadpool
+    assert thread == threading.get_ident()
+    assert found == "async@example.com"
+
+
+def test_pool_counters_track_checkouts_and_overflow(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "pool_counters", dict.fromkeys(database.pool_counters, 0))
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", pool_size=1, max_overflow=1)
+    database._track_pool(engine)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "async_engine", None)
+    with engine.connect(), engine.connect():
+        stats = database.pool_stats()
+        assert stats["checkedout"] == 2 and stats["overflow"] == 1
+    assert database.pool_counters == {"checkouts": 2, "overflow_checkouts": 1, "invalidated": 0}
+    engine.dispose()
+
+
+def test_pool_stats_are_exported(client):
+    text = client.get("/metrics").text
+    for name in ("db_pool_checkouts_total", "db_pool_overflow_checkouts_total", "db_pool_invalidated_total"):
+        assert name in text
@@ -0,0 +1,129 @@
+import sys
+import os
+import socket
+import uuid
+from datetime import datetime
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import emailer, models
+from app.database import SessionLocal
+
+aiosmtpd = pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+
+class Recorder:
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.rcpt_tos[0])
+        return "250 OK"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    recorder = Recorder()
+    port = _free_port()
+    controller = Controller(
+        recorder, hostname="127.0.0.1", port=port,
+        authenticator=lambda *args: AuthResult(success=True), auth_require_tls=False,
+    )
+    controller.start()
+    # the worker claims any pending row: drop those other tests left behind
+    db = SessionLocal()
+    db.query(models.EmailOutbox).filter(models.EmailOutbox.status == models.EmailStatus.pending).delete()
+    db.commit()
+    db.close()
+    monkeypatch.setattr(emailer, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(emailer, "SMTP_PORT", port)
+    monkeypatch.setattr(emailer, "SMTP_USER", "user")
+    monkeypatch.setattr(emailer, "SMTP_PASS", "pass")
+    monkeypatch.setattr(emailer, "SMTP_STARTTLS", False)
+    yield recorder
+    emailer.smtp_pool.close_all()
+    controller.stop()
+
+
+def _enqueue(n):
+    tag = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    for i in range(n):
+        assert emailer.enqueue_email(db, f"{tag}-{i}@example.com", "hi", "body")
+    db.commit()
+    db.close()
+    return tag
+
+
+def _rows(tag):
+    db = SessionLocal()
+    rows = db.query(models.EmailOutbox).filter(models.EmailOutbox.to_address.like(f"{tag}-%")).all()
+    db.close()
+    return rows
+
+
+def test_outbox_delivers_batch_over_one_connection(smtp):
+    tag = _enqueue(3)
+    worker = emailer.OutboxWorker(1)
+    while worker.drain_once():
+        pass
+    assert sorted(m for m in smtp.messages if m.startswith(tag)) == [f"{tag}-{i}@example.com" for i in range(3)]
+    assert smtp.connections == 1
+    assert all(r.status == models.EmailStatus.sent and r.sent_at for r in _rows(tag))
+
+
+def test_outbox_retries_then_dead_letters(smtp, monkeypatch):
+    monkeypatch.setattr(emailer, "SMTP_PORT", _free_port())
+    monkeypatch.setattr(emailer, "EMAIL_MAX_ATTEMPTS", 2)
+    tag = _enqueue(1)
+    worker = emailer.OutboxWorker(1)
+    worker.drain_once()
+    row = _rows(tag)[0]
+    assert row.status == models.EmailStatus.pending
+    assert row.attempts == 1 and row.next_attempt_at > datetime.utcnow()
+
+    db = SessionLocal()
+    db.query(models.EmailOutbox).filter(models.EmailOutbox.id == row.id).update({"next_attempt_at": datetime.utcnow()})
+    db.commit()
+    db.close()
+    worker.drain_once()
+    row = _rows(tag)[0]
+    assert row.status == models.EmailStatus.dead
+    assert row.attempts == 2 and row.last_error
+
+
+def test_unreachable_relay_stops_the_batch(smtp, monkeypatch):
+    monkeypatch.setattr(emailer, "SMTP_PORT", _free_port())
+    tag = _enqueue(3)
+    worker = emailer.OutboxWorker(1)
+    assert not worker.drain_once()
+    rows = _rows(tag)
+    # one connect failure, the rest handed back without using an attempt
+    assert sorted(r.attempts for r in rows) == [0, 0, 1]
+    assert all(r.locked_until is None for r in rows)
+
+
+def test_unsent_bodies_stay_out_of_logs_outside_development(monkeypatch):
+    lines = []
+    monkeypatch.setattr(emailer.logger, "info", lambda msg, *args: lines.append(msg % args))
+    monkeypatch.setattr(emailer, "SMTP_HOST", None)
+    monkeypatch.setattr(emailer, "LOG_BODIES", False)
+    db = SessionLocal()
+    assert not emailer.enqueue_email(db, "a@example.com", "Reset your password", "https://example.com/reset?token=secret")
+    db.close()
+    assert "Reset your password" in lines[0] and "secret" not in lines[0]
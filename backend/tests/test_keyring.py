@@ -0,0 +1,80 @@
+import sys
+import os
+import time
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import main as app_main
+from app import keyring, utils
+from app.verifier import TokenVerifier
+
+
+@pytest.fixture
+def ring(tmp_path, monkeypatch):
+    """Two published keys: an old one that is signing and a fresh one still inside its activation window."""
+    now = time.time()
+    old = keyring.SigningKey(keyring.new_kid(now - 3600), keyring.generate_private_key("EdDSA"))
+    new = keyring.SigningKey(keyring.new_kid(now), keyring.generate_private_key("ES256"))
+    for key in (old, new):
+        (tmp_path / f"{key.kid}.pem").write_bytes(key.to_pem())
+    r = keyring.Keyring(str(tmp_path), activation_seconds=600)
+    monkeypatch.setattr(keyring, "ring", r)
+    return r, old, new
+
+
+def test_tokens_are_signed_with_the_activated_key(ring):
+    r, old, new = ring
+    token = utils.create_access_token("user-1", extra_claims={"sid": "s1"})
+    header = jwt.get_unverified_header(token)
+    assert header == {"alg": "EdDSA", "kid": old.kid, "typ": "JWT"}
+    assert utils.decode_access_token(token)["sub"] == "user-1"
+
+    # after the activation window the newer key signs; tokens from the old key still verify
+    assert r.signing_key(now=time.time() + 601) is r.keys[new.kid]
+    r.activation_seconds = 0
+    token2 = utils.create_access_token("user-2")
+    assert jwt.get_unverified_header(token2)["kid"] == new.kid
+    assert utils.decode_access_token(token)["sub"] == "user-1"
+    assert utils.decode_access_token(token2)["sub"] == "user-2"
+
+
+def test_legacy_and_forged_tokens_are_rejected(ring, monkeypatch):
+    hs256 = jwt.encode({"sub": "u", "exp": time.time() + 60}, utils.JWT_SECRET, algorithm="HS256")
+    with pytest.raises(jwt.InvalidTokenError):
+        utils.decode_access_token(hs256)
+    monkeypatch.setattr(utils, "JWT_ALLOW_HS256", True)
+    assert utils.decode_access_token(hs256)["sub"] == "u"
+
+    stranger = keyring.SigningKey("20200101T000000-abcdef", keyring.generate_private_key("EdDSA"))
+    forged = jwt.encode({"sub": "u", "exp": time.time() + 60}, stranger.private_key, algorithm="EdDSA", headers={"kid": stranger.kid})
+    with pytest.raises(jwt.InvalidTokenError):
+        utils.decode_access_token(forged)
+
+
+def test_jwks_endpoint_and_offline_verifier(ring):
+    r, old, new = ring
+    client = TestClient(app_main.app)
+    resp = client.get("/.well-known/jwks.json")
+    assert resp.status_code == 200
+    assert resp.headers["cache-control"] == f"public, max-age={keyring.JWKS_MAX_AGE}"
+    jwks = resp.json()
+    assert {k["kid"] for k in jwks["keys"]} == {old.kid, new.kid}
+    assert all("d" not in k for k in jwks["keys"])  # public halves only
+    assert client.get("/.well-known/jwks.json", headers={"If-None-Match": resp.headers["etag"]}).status_code == 304
+
+    verifier = TokenVerifier(jwks=jwks)
+    token = utils.create_access_token("user-3")
+    assert verifier.verify(token)["sub"] == "user-3"
+    hs256 = jwt.encode({"sub": "u", "exp": time.time() + 60}, "guess", algorithm="HS256", headers={"kid": old.kid})
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(hs256)
+
+
+def test_prune_keeps_keys_until_retired(ring):
+    r, old, new = ring
+    assert r.retired(now=time.time()) == []
+    later = time.time() + r.activation_seconds + keyring.JWT_KEY_RETIRE_SECONDS + 1
+    assert [k.kid for k in r.retired(now=later)] == [old.kid]
@@ -0,0 +1,107 @@
+import sys
+import os
+import time
+import uuid
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import login_guard, password_pool
+
+
+@pytest.fixture
+def guard(monkeypatch):
+    monkeypatch.setattr(login_guard, "LOGIN_POW_BITS", 8)
+    monkeypatch.setattr(login_guard, "LOGIN_POW_MAX_BITS", 11)
+    g = login_guard.LoginGuard(login_guard.InMemoryTracker())
+    monkeypatch.setattr(login_guard, "guard", g)
+    return g
+
+
+@pytest.fixture
+def verifications(monkeypatch):
+    calls = []
+    real = password_pool.verify_password
+
+    async def counting(hash, password):
+        calls.append(password)
+        return await real(hash, password)
+    monkeypatch.setattr(password_pool, "verify_password", counting)
+    return calls
+
+
+def _signin(client, email, password, proof=None):
+    headers = {"X-Login-Proof": proof} if proof else {}
+    return client.post("/api/auth/signin", json={"email": email, "password": password}, headers=headers)
+
+
+def test_challenge_after_failures_and_no_hashing_without_proof(guard, verifications, client, verified_user):
+    _, email = verified_user("guard")
+    for _ in range(login_guard.LOGIN_CHALLENGE_AFTER):
+        assert _signin(client, email, "wrong-pw").status_code == 400
+    assert len(verifications) == login_guard.LOGIN_CHALLENGE_AFTER
+
+    r = _signin(client, email, "pw123456")
+    assert r.status_code == 429
+    challenge = r.headers["x-login-challenge"]
+    assert len(verifications) == login_guard.LOGIN_CHALLENGE_AFTER  # turned away before Argon2
+
+    assert _signin(client, email, "pw123456", proof=f"{challenge}:not-a-solution").status_code == 429
+    proof = login_guard.solve(challenge)
+    assert _signin(client, email, "pw123456", proof=proof).status_code == 200
+    # the success cleared the account; a replayed proof is never accepted again
+    assert not guard.pow.check(proof, email.lower(), 8)
+    assert guard.tracker.status([f"acct:{email.lower()}"]) == [0]
+
+
+def test_failures_harden_the_challenge_but_never_lock_the_owner_out(count_queries, guard, verifications, client, verified_user):
+    _, email = verified_user("guard")
+    account = f"acct:{email.lower()}"
+    for _ in range(login_guard.LOGIN_HARDEN_AFTER):
+        guard.tracker.fail([account])
+    with count_queries() as queries:
+        r = _signin(client, email, "pw123456")
+    assert r.status_code == 429
+    assert verifications == []
+    assert not [q for q in queries if "FROM users" in q]
+    bits = int(r.headers["x-login-challenge"].split(".")[1])
+    assert bits == login_guard.pow_bits(login_guard.LOGIN_HARDEN_AFTER) > login_guard.LOGIN_POW_BITS
+
+    # each failure past the threshold doubles the work, up to the cap
+    assert login_guard.pow_bits(login_guard.LOGIN_HARDEN_AFTER + 1) == bits + 1
+    assert login_guard.pow_bits(login_guard.LOGIN_HARDEN_AFTER + 50) == login_guard.LOGIN_POW_MAX_BITS
+    for _ in range(50):
+        guard.tracker.fail([account])
+    challenge = _signin(client, email, "pw123456").headers["x-login-challenge"]
+    assert int(challenge.split(".")[1]) == login_guard.LOGIN_POW_MAX_BITS
+    # the owner, with the right password and a solved challenge, still gets in
+    assert _signin(client, email, "pw123456", proof=login_guard.solve(challenge)).status_code == 200
+
+
+def test_unknown_email_is_cached_and_answered_in_verify_time(count_queries, guard, verifications, client):
+    guard.verify_seconds = 0.05
+    email = f"nobody-{uuid.uuid4().hex[:8]}@example.com"
+    assert _signin(client, email, "whatever1").status_code == 400
+    with count_queries() as queries:
+        t0 = time.perf_counter()
+        assert _signin(client, email, "whatever1").status_code == 400
+        elapsed = time.perf_counter() - t0
+    assert verifications == []
+    assert not [q for q in queries if "FROM users" in q]
+    assert elapsed >= 0.045
+    assert guard.stats()["unknown_email_hits"] == 1
+
+
+def test_subnet_failures_challenge_new_accounts(guard):
+    tracker = guard.tracker
+    for i in range(login_guard.LOGIN_SUBNET_CHALLENGE_AFTER):
+        guard.failed(f"spray{i}@example.com", "203.0.113.7")
+    assert tracker.status(["net:203.0.113.0/24"]) == [login_guard.LOGIN_SUBNET_CHALLENGE_AFTER]
+    assert guard.check("fresh@example.com", "203.0.113.99").action == "challenge"
+    assert guard.check("fresh@example.com", "198.51.100.1").action == "allow"
+    # however many failures a subnet (or a proxy's address) collects: the base challenge, no lock
+    for i in range(500):
+        guard.failed(f"spray{i}@example.com", "203.0.113.7")
+    verdict = guard.check("fresh@example.com", "203.0.113.99")
+    assert verdict.action == "challenge" and int(verdict.challenge.split(".")[1]) == login_guard.LOGIN_POW_BITS
+    assert login_guard.subnet("2001:db8::1") == "2001:db8::/64"
@@ -0,0 +1,59 @@
+import sys
+import os
+import json
+import logging
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import log
+
+
+def _sample(text, name, **labels):
+    want = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    for line in text.splitlines():
+        if line.startswith(f"{name}{{") and all(f'{k}="{v}"' in line for k, v in labels.items()):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{name}{{{want}}} not exported")
+
+
+def test_metrics_cover_signin_stages(client, verified_user):
+    _, email = verified_user("metrics")
+
+    r = client.post("/api/auth/signin", json={"email": email, "password": "pw123456"}, headers={"X-Request-ID": "trace-123"})
+    assert r.status_code == 200
+    assert r.headers["x-request-id"] == "trace-123"
+    # invalid ids are replaced rather than echoed
+    assert client.get("/", headers={"X-Request-ID": "bad id; drop"}).headers["x-request-id"] != "bad id; drop"
+
+    text = client.get("/metrics").text
+    assert _sample(text, "http_request_duration_seconds_count", method="POST", route="/api/auth/signin", status="200") >= 1
+    for stage in ("argon2_verify", "argon2_queue", "jwt_sign", "rate_limit"):
+        assert _sample(text, "auth_stage_duration_seconds_count", stage=stage) >= 1
+    assert _sample(text, "db_query_duration_seconds_count", operation="select") >= 1
+    assert _sample(text, "db_query_duration_seconds_count", operation="insert") >= 1
+    assert _sample(text, "rate_limit_decisions_total", backend="memory", decision="allow") >= 1
+    assert "password_pool_workers" in text
+    assert "db_pool_checkouts_total" in text
+
+
+def test_unmatched_paths_share_one_series(client):
+    for i in range(3):
+        client.get(f"/no-such-page-{i}")
+    text = client.get("/metrics").text
+    assert _sample(text, "http_request_duration_seconds_count", route="unmatched", status="404") >= 3
+    assert "no-such-page" not in text
+
+
+def test_json_log_lines_carry_request_id():
+    record = logging.LogRecord("app.auth", logging.WARNING, __file__, 1, "Redis unavailable: %s", ("timeout",), None)
+    record.route = "/api/auth/signin"
+    token = log.request_id.set("abc123")
+    try:
+        log._RequestIdFilter().filter(record)
+    finally:
+        log.request_id.reset(token)
+    out = json.loads(log.JsonFormatter().format(record))
+    assert out["msg"] == "Redis unavailable: timeout"
+    assert out["level"] == "warning"
+    assert out["request_id"] == "abc123"
+    assert out["route"] == "/api/auth/signin"
@@ -0,0 +1,66 @@
+import sys
+import os
+import time
+import uuid
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import password_pool, database, models, utils
+
+
+def test_pool_rejects_when_queue_full():
+    pool = password_pool.PasswordPool(workers=1, max_pending=2, memory_budget_kib=1024 * 1024)
+
+    async def run():
+        slow = [asyncio.ensure_future(pool.submit(time.sleep, 0.2)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(password_pool.PasswordPoolBusy):
+            await pool.submit(time.sleep, 0)
+        assert pool.stats()["running"] == 1
+        await asyncio.gather(*slow)
+        # slots are released once the work completes
+        await pool.submit(time.sleep, 0)
+
+    asyncio.run(run())
+    assert pool.stats()["pending"] == 0
+    assert pool.stats()["rejected"] == 1
+
+
+def test_pool_caps_workers_by_memory_budget():
+    cost = password_pool.utils.ph.memory_cost
+    pool = password_pool.PasswordPool(workers=8, max_pending=8, memory_budget_kib=cost * 3)
+    assert pool.workers == 3
+
+
+def test_auth_handlers_keep_database_work_off_the_event_loop(client, verified_user):
+    if database.DB_ASYNC:
+        pytest.skip("AsyncSession work runs on the loop by design")
+    on_loop = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        on_loop.append(statement)
+
+    uid, email = verified_user("pool")
+    token = uuid.uuid4().hex
+    db = database.SessionLocal()
+    db.add(models.OneTimeToken(user_id=uid, token_hash=utils.hash_token(token), type=models.TokenType.password_reset,
+                               expires_at=datetime.utcnow() + timedelta(minutes=5)))
+    db.commit()
+    db.close()
+
+    event.listen(database.engine, "before_cursor_execute", before)
+    try:
+        assert client.post("/api/auth/signup", json={"email": f"pool-{uuid.uuid4().hex[:8]}@example.com", "password": "pw123456"}).status_code == 200
+        assert client.post("/api/auth/signin", json={"email": email, "password": "pw123456"}).status_code == 200
+        assert client.post("/api/auth/reset-password", json={"token": token, "new_password": "newpw1234"}).status_code == 200
+    finally:
+        event.remove(database.engine, "before_cursor_execute", before)
+    assert on_loop == []
@@ -0,0 +1,62 @@
+import sys
+import os
+import subprocess
+from argon2 import PasswordHasher, extract_parameters
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import models, utils, password_profiles, auth
+from app.database import SessionLocal
+
+
+def _password_hash(user_id):
+    db = SessionLocal()
+    h = db.get(models.User, user_id).password_hash
+    db.close()
+    return h
+
+
+def test_suite_runs_with_the_test_profile():
+    assert password_profiles.ARGON2_PROFILE == "test"
+    assert extract_parameters(utils.hash_password("pw")).memory_cost == password_profiles.PROFILES["test"]["memory_cost"]
+
+
+def test_signin_upgrades_outdated_hash_in_background(client, verified_user):
+    old_hash = PasswordHasher(time_cost=1, memory_cost=8, parallelism=1).hash("pw123456")
+    assert utils.needs_rehash(old_hash)
+    user_id, email = verified_user("rehash", password_hash=old_hash)
+
+    assert client.post("/api/auth/signin", json={"email": email, "password": "pw123456"}).status_code == 200
+    new_hash = _password_hash(user_id)
+    assert new_hash != old_hash
+    assert not utils.needs_rehash(new_hash)
+    assert utils.verify_password(new_hash, "pw123456")
+
+    # a hash changed in the meantime (password reset) is not overwritten
+    assert not auth._upgrade_password_hash(user_id, old_hash, utils.hash_password("stale"))
+    assert _password_hash(user_id) == new_hash
+
+
+def test_stronger_hashes_are_never_rehashed_down():
+    # the active (test) profile is weaker in time and memory
+    assert not utils.needs_rehash(PasswordHasher(time_cost=2, memory_cost=128, parallelism=1).hash("pw"))
+    assert not utils.needs_rehash(PasswordHasher(time_cost=1, memory_cost=128, parallelism=1).hash("pw"))
+
+
+def test_test_profile_refuses_production():
+    env = dict(os.environ, ARGON2_PROFILE="test", ENV="production")
+    r = subprocess.run([sys.executable, "-c", "import app.password_profiles"], env=env,
+                       cwd=os.path.join(os.path.dirname(__file__), ".."), capture_output=True, text=True)
+    assert r.returncode != 0
+    assert "ARGON2_PROFILE=test" in r.stderr
+
+
+def test_calibrate_prefers_memory_then_time():
+    # fake cost model: 1 ms per MiB per pass
+    measure = lambda p: p["time_cost"] * p["memory_cost"] / 1024
+    params = password_profiles.calibrate(250, max_memory_kib=131072, measure=measure)
+    assert params == {"time_cost": 1, "memory_cost": 131072, "parallelism": 2}
+    params = password_profiles.calibrate(100, max_memory_kib=131072, measure=measure)
+    assert params == {"time_cost": 1, "memory_cost": 65536, "parallelism": 2}
+    params = password_profiles.calibrate(200, max_memory_kib=32768, measure=measure)
+    assert params == {"time_cost": 6, "memory_cost": 32768, "parallelism": 2}
@@ -0,0 +1,83 @@
+import sys
+import os
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import main as app_main
+from app import models, utils, principal_cache, rate_limiter
+from app.database import SessionLocal
+
+
+def _make_user():
+    db = SessionLocal()
+    user = models.User(email=f"pc-{uuid.uuid4().hex[:8]}@example.com", email_verified=True)
+    db.add(user)
+    db.commit()
+    uid = user.id
+    db.close()
+    return uid
+
+
+def test_principal_is_cached_and_invalidated_on_suspend():
+    client = TestClient(app_main.app)
+    uid = _make_user()
+    headers = {"Authorization": f"Bearer {utils.create_access_token(uid)}"}
+
+    before = principal_cache.cache.stats()
+    assert client.get("/api/auth/sessions", headers=headers).status_code == 200
+    assert client.get("/api/auth/sessions", headers=headers).status_code == 200
+    after = principal_cache.cache.stats()
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] + after["redis_hits"] >= before["hits"] + before["redis_hits"] + 1
+
+    db = SessionLocal()
+    db.query(models.User).filter(models.User.id == uid).first().status = models.UserStatus.suspended
+    db.commit()
+    db.close()
+
+    assert client.get("/api/auth/sessions", headers=headers).status_code == 403
+
+
+def test_rolled_back_change_keeps_cache_entry():
+    uid = _make_user()
+    principal_cache.cache.put(principal_cache.Principal(uid, "x@example.com", True, models.UserStatus.active))
+    db = SessionLocal()
+    db.query(models.User).filter(models.User.id == uid).first().status = models.UserStatus.deleted
+    db.flush()
+    db.rollback()
+    db.close()
+    assert principal_cache.cache.get(uid) is not None
+
+
+def _principal(uid):
+    return principal_cache.Principal(uid, "x@example.com", True, models.UserStatus.active)
+
+
+def test_load_invalidated_while_in_flight_is_not_cached():
+    cache = principal_cache.PrincipalCache(30, 100, use_redis=False)
+    uid = uuid.uuid4().hex
+    principal, ticket = cache.lookup(uid)
+    assert principal is None
+    # the user is suspended while this request loads the old row
+    cache.invalidate(uid)
+    cache.put(_principal(uid), ticket)
+    assert cache.get(uid) is None
+    # a load that began after the invalidation is cached
+    _, ticket = cache.lookup(uid)
+    cache.put(_principal(uid), ticket)
+    assert cache.get(uid) is not None
+
+
+def test_stale_put_from_another_worker_is_refused_by_redis():
+    if not rate_limiter.health.check():
+        pytest.skip("REDIS_URL not configured")
+    loading, invalidating = (principal_cache.PrincipalCache(30, 100) for _ in range(2))
+    uid = uuid.uuid4().hex
+    _, ticket = loading.lookup(uid)
+    invalidating.invalidate(uid)
+    loading.put(_principal(uid), ticket)
+    assert loading.get(uid) is None
+    assert principal_cache.PrincipalCache(30, 100).get(uid) is None
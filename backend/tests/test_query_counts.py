@@ -0,0 +1,79 @@
+import sys
+import os
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import models, utils, emailer
+from app.database import SessionLocal
+
+
+def _one_time_token(uid, type):
+    token = uuid.uuid4().hex
+    db = SessionLocal()
+    db.add(models.OneTimeToken(user_id=uid, token_hash=utils.hash_token(token), type=type, expires_at=datetime.utcnow() + timedelta(minutes=5)))
+    db.commit()
+    db.close()
+    return token
+
+
+def test_signup_is_one_lookup_and_one_transaction(count_queries, client):
+    with count_queries() as q:
+        r = client.post("/api/auth/signup", json={"email": f"qc-{uuid.uuid4().hex[:8]}@example.com", "password": "pw123456"})
+    assert r.status_code == 200
+    # email check, INSERT user, INSERT verification token (+ outbox row when SMTP is set)
+    assert len(q) == 3 + emailer.smtp_configured()
+
+
+def test_refresh_rotation_round_trips_and_double_spend(count_queries, client, new_client, verified_user):
+    _, email = verified_user("qc")
+    client.post("/api/auth/signin", json={"email": email, "password": "pw123456"})
+    old_cookie = client.cookies.get("refresh_token")
+    csrf = client.cookies.get("csrf_token")
+    with count_queries() as q:
+        r = client.post("/api/auth/refresh", headers={"x-csrf": csrf})
+    assert r.status_code == 200
+    # conditional UPDATE ... RETURNING, INSERT successor
+    assert len(q) == 2
+
+    # within the grace window a second spend gets the same successor
+    replay = new_client()
+    replay.cookies.set("refresh_token", old_cookie)
+    replay.cookies.set("csrf_token", csrf)
+    again = replay.post("/api/auth/refresh", headers={"x-csrf": csrf})
+    assert again.status_code == 200
+    assert again.cookies.get("refresh_token") == r.cookies.get("refresh_token")
+
+
+def test_one_time_tokens_are_consumed_atomically(count_queries, client, verified_user):
+    uid, _ = verified_user("qc")
+    token = _one_time_token(uid, models.TokenType.email_verification)
+    with count_queries() as q:
+        assert client.post("/api/auth/verify-email", json={"token": token}).status_code == 200
+    # consume token, flag user
+    assert len(q) == 2
+    assert client.post("/api/auth/verify-email", json={"token": token}).status_code == 400
+
+
+def test_reset_password_and_revoke_all_are_set_based(count_queries, client, verified_user):
+    uid, email = verified_user("qc")
+    for _ in range(3):
+        client.post("/api/auth/signin", json={"email": email, "password": "pw123456"})
+    token = _one_time_token(uid, models.TokenType.password_reset)
+    with count_queries() as q:
+        r = client.post("/api/auth/reset-password", json={"token": token, "new_password": "newpw1234"})
+    assert r.status_code == 200
+    # token pre-check, consume token, update password, revoke sessions, record the access-token cutoff
+    assert len(q) == 5
+
+    db = SessionLocal()
+    assert db.query(models.RefreshToken).filter(models.RefreshToken.user_id == uid, models.RefreshToken.revoked == False).count() == 0
+    db.close()
+
+    headers = {"Authorization": f"Bearer {utils.create_access_token(uid)}"}
+    client.get("/api/auth/sessions", headers=headers)  # warm the principal cache
+    with count_queries() as q:
+        assert client.post("/api/auth/sessions/revoke-all", headers=headers).status_code == 200
+    # revoke sessions, record the access-token cutoff
+    assert len(q) == 2
@@ -1,5 +1,8 @@
 import sys
 import os
+import uuid
+import threading
+import pytest
 from fastapi.testclient import TestClient
 
 # ensure project root on sys.path for imports when running under pytest in container
@@ -14,17 +17,18 @@ from app.database import Base, engine
 Base.metadata.create_all(bind=engine)
 
 
-def test_rate_limit_signup():
+def test_rate_limit_signup(monkeypatch):
     client = TestClient(app_main.app)
     # Use in-memory limiter with low threshold for test
-    rate_limiter.ip_limiter = rate_limiter.InMemoryLimiter(2, 60)
+    monkeypatch.setattr(rate_limiter, "ip_limiter", rate_limiter.InMemoryLimiter(2, 60))
+    tag = uuid.uuid4().hex[:8]
     # first two requests allowed
-    r1 = client.post("/api/auth/signup", json={"email": "rl1@example.com", "password": "testpassword123"})
+    r1 = client.post("/api/auth/signup", json={"email": f"rl1-{tag}@example.com", "password": "testpassword123"})
     assert r1.status_code == 200
-    r2 = client.post("/api/auth/signup", json={"email": "rl2@example.com", "password": "testpassword123"})
+    r2 = client.post("/api/auth/signup", json={"email": f"rl2-{tag}@example.com", "password": "testpassword123"})
     assert r2.status_code == 200
     # third should be rate-limited
-    r3 = client.post("/api/auth/signup", json={"email": "rl3@example.com", "password": "testpassword123"})
+    r3 = client.post("/api/auth/signup", json={"email": f"rl3-{tag}@example.com", "password": "testpassword123"})
     assert r3.status_code == 429
 
 
@@ -37,3 +41,115 @@ def test_csrf_protection_logout_and_refresh():
     # refresh without CSRF header should be forbidden
     r2 = client.post("/api/auth/refresh")
     assert r2.status_code == 403
+
+
+def test_redis_limiter_multi_key_is_all_or_nothing():
+    if not rate_limiter.health.check():
+        pytest.skip("REDIS_URL not configured")
+    suffix = uuid.uuid4().hex
+    ip = rate_limiter.RedisLimiter(3, 60, name=f"t-ip-{suffix}")
+    email = rate_limiter.RedisLimiter(2, 60, name=f"t-email-{suffix}")
+    results = [rate_limiter.allow_all([(ip, "1.2.3.4"), (email, "a@example.com")]) for _ in range(3)]
+    assert results == [True, True, False]
+    # the denied call above did not consume the IP quota
+    assert ip.allow("1.2.3.4") is True
+    assert ip.allow("1.2.3.4") is False
+
+
+def test_in_memory_limiter_bounds_keys_and_is_thread_safe():
+    limiter = rate_limiter.InMemoryLimiter(50, 60, max_keys=100)
+    for i in range(1000):
+        limiter.allow(f"10.0.{i // 256}.{i % 256}")
+    assert len(limiter.data) == 100
+    assert limiter.evictions == 900
+
+    allowed = []
+
+    def hammer():
+        allowed.extend(limiter.allow("shared") for _ in range(50))
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert allowed.count(True) == 50
+
+
+def test_rate_limit_rejects_before_body_parsing(monkeypatch):
+    client = TestClient(app_main.app)
+    monkeypatch.setattr(rate_limiter, "ip_limiter", rate_limiter.InMemoryLimiter(0, 60))
+    # a malformed body would be a 422 if it reached validation
+    r = client.post("/api/auth/signin", content=b"not json", headers={"Origin": app_main.frontend_origins[0]})
+    assert r.status_code == 429
+    assert r.json() == {"detail": "Too many requests"}
+    assert r.headers["access-control-allow-origin"] == app_main.frontend_origins[0]
+    assert r.headers["x-frame-options"] == "DENY"
+    # routes without a policy are not limited
+    assert client.post("/api/auth/logout").status_code == 403
+
+
+def test_security_headers_on_every_response():
+    r = TestClient(app_main.app).get("/")
+    assert r.headers["strict-transport-security"] == "max-age=31536000; includeSubDomains"
+    assert r.headers["x-content-type-options"] == "nosniff"
+    assert r.headers["content-security-policy"].startswith("default-src 'self'")
+    assert len(r.headers.get_list("x-frame-options")) == 1
+
+
+def test_denied_multi_key_checks_use_no_quota():
+    wide, narrow = rate_limiter.InMemoryLimiter(5, 60), rate_limiter.InMemoryLimiter(1, 60)
+    assert rate_limiter.allow_all([(wide, "k"), (narrow, "k")])
+    for _ in range(3):
+        assert not rate_limiter.allow_all([(wide, "k"), (narrow, "k")])
+    # only the allowed request counted against the wide limit
+    assert [wide.allow("k") for _ in range(5)] == [True] * 4 + [False]
+
+
+def _client_from(ip):
+    async def app(scope, receive, send):
+        scope["client"] = (ip, 50000)
+        await app_main.app(scope, receive, send)
+    return TestClient(app)
+
+
+def test_forgot_password_limit_is_per_ip_and_account(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "ip_limiter", rate_limiter.InMemoryLimiter(10000, 60))
+    monkeypatch.setattr(rate_limiter, "auth_limiter", rate_limiter.InMemoryLimiter(2, 60))
+    body = {"email": f"victim-{uuid.uuid4().hex[:8]}@example.com"}
+    attacker = _client_from("203.0.113.9")
+    assert [attacker.post("/api/auth/forgot-password", json=body).status_code for _ in range(3)] == [200, 200, 429]
+    # the attacker's requests did not use up the owner's quota
+    assert _client_from("198.51.100.7").post("/api/auth/forgot-password", json=body).status_code == 200
+
+
+def test_signin_has_no_hard_per_account_limit(monkeypatch, verified_user):
+    monkeypatch.setattr(rate_limiter, "ip_limiter", rate_limiter.InMemoryLimiter(10000, 60))
+    monkeypatch.setattr(rate_limiter, "auth_limiter", rate_limiter.InMemoryLimiter(1, 60))
+    _, email = verified_user("rl-signin")
+    flood = _client_from("203.0.113.9")
+    for _ in range(3):
+        flood.post("/api/auth/signin", json={"email": email, "password": "not-it-123"})
+    owner = _client_from("198.51.100.7")
+    r = owner.post("/api/auth/signin", json={"email": email, "password": "pw123456"})
+    assert r.status_code in (200, 429)
+    # at worst the owner is asked for a proof of work, never refused outright
+    assert r.status_code == 200 or "x-login-challenge" in r.headers
+
+
+def test_forgot_password_denied_per_account_uses_no_ip_quota(monkeypatch):
+    ip_limit = rate_limiter.InMemoryLimiter(3, 60)
+    monkeypatch.setattr(rate_limiter, "ip_limiter", ip_limit)
+    monkeypatch.setattr(rate_limiter, "auth_limiter", rate_limiter.InMemoryLimiter(1, 60))
+    client = _client_from("203.0.113.10")
+    body = {"email": f"fp-{uuid.uuid4().hex[:8]}@example.com"}
+    assert [client.post("/api/auth/forgot-password", json=body).status_code for _ in range(3)] == [200, 429, 429]
+    # two of the three IP slots are still free
+    assert [ip_limit.allow("203.0.113.10") for _ in range(3)] == [True, True, False]
+
+
+def test_redis_keys_of_one_client_share_a_hash_tag():
+    ip = rate_limiter.RedisLimiter(1, 60, name="ip").check("10.0.0.1")[0]
+    account = rate_limiter.RedisLimiter(1, 60, name="auth").check("10.0.0.1|forgot:a|b@example.com")[0]
+    assert ip == "rlw:{10.0.0.1}:ip"
+    assert account == "rlw:{10.0.0.1}|forgot:a|b@example.com:auth"
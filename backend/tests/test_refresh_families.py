@@ -0,0 +1,94 @@
+import sys
+import os
+import threading
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import utils, refresh_grace
+
+
+@pytest.fixture
+def signed_in(new_client, verified_user):
+    _, email = verified_user("fam")
+    client = new_client()
+    r = client.post("/api/auth/signin", json={"email": email, "password": "pw123456"})
+    return client, email, r.json()["access_token"]
+
+
+@pytest.fixture
+def tab(new_client):
+    def make(cookies):
+        t = new_client()
+        t.cookies = cookies
+        return t
+    return make
+
+
+def _refresh(client):
+    return client.post("/api/auth/refresh", headers={"x-csrf": client.cookies.get("csrf_token")})
+
+
+def test_concurrent_refreshes_share_one_successor(signed_in, tab):
+    client, _, _ = signed_in
+    cookies = dict(client.cookies)
+    tabs = [tab(cookies) for _ in range(8)]
+    results = [None] * len(tabs)
+
+    def run(i):
+        r = _refresh(tabs[i])
+        results[i] = (r.status_code, r.cookies.get("refresh_token"))
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(tabs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [status for status, _ in results] == [200] * len(tabs)
+    successors = {token for _, token in results}
+    assert len(successors) == 1
+    # and it is a live token
+    assert _refresh(tab(dict(cookies, refresh_token=successors.pop()))).status_code == 200
+
+
+def test_reuse_after_grace_window_revokes_the_family(monkeypatch, signed_in, tab, new_client):
+    client, email, _ = signed_in
+    stolen = dict(client.cookies)
+    r = _refresh(client)
+    assert r.status_code == 200
+    access = r.json()["access_token"]
+    other_device = new_client()
+    other_access = other_device.post("/api/auth/signin", json={"email": email, "password": "pw123456"}).json()["access_token"]
+
+    monkeypatch.setattr(refresh_grace.cache, "seconds", 0)
+    reused = refresh_grace.cache.stats()["reuse_detected"]
+    assert _refresh(tab(stolen)).status_code == 401
+    assert refresh_grace.cache.stats()["reuse_detected"] == reused + 1
+    # the legitimate successor and its access token are gone with the thief's copy
+    assert _refresh(client).status_code == 401
+    assert client.get("/api/auth/sessions", headers={"Authorization": f"Bearer {access}"}).status_code == 401
+    # other sign-ins are separate families
+    assert other_device.get("/api/auth/sessions", headers={"Authorization": f"Bearer {other_access}"}).status_code == 200
+    assert _refresh(other_device).status_code == 200
+
+
+def test_grace_cache_is_sealed_and_follows_rotations():
+    cache = refresh_grace.GraceCache(10, 100)
+    t0, t1, t2 = "token-0", "token-1", "token-2"
+    cache.put(utils.hash_token(t0), t0, ["u", "s1", t1])
+    cache.put(utils.hash_token(t1), t1, ["u", "s2", t2])
+    assert cache.get(utils.hash_token(t0), t0) == ["u", "s2", t2]
+    # the entry only opens with the parent token itself
+    assert cache.get(utils.hash_token(t0), "guess") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_grace_window_ends_when_the_session_is_revoked(signed_in, tab):
+    client, _, _ = signed_in
+    parent = dict(client.cookies)
+    r = _refresh(client)
+    assert r.status_code == 200
+    access = r.json()["access_token"]
+    assert client.post("/api/auth/sessions/revoke-all", headers={"Authorization": f"Bearer {access}"}).status_code == 200
+    # the parent is still within the grace window, but its successor is revoked
+    assert _refresh(tab(parent)).status_code == 401
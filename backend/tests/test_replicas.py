@@ -0,0 +1,83 @@
+import sys
+import os
+import sqlite3
+import pytest
+from sqlalchemy import create_engine, select, update
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import models, utils, database
+from app.database import Base, engine
+
+
+@pytest.fixture
+def replica_files(tmp_path):
+    if engine.dialect.name != "sqlite":
+        pytest.skip("replicas are stood in for by SQLite files")
+    paths = [str(tmp_path / "replica_a.db"), str(tmp_path / "replica_b.db")]
+    rs = database.configure_replicas([f"sqlite:///{p}" for p in paths])
+    for replica in rs.replicas:
+        Base.metadata.create_all(bind=replica.engine)
+    yield paths, rs
+    database.configure_replicas([])
+    for replica in rs.replicas:
+        replica.engine.dispose()
+
+
+def _snapshot_primary(paths):
+    # stand-in for replication: copy the primary into each replica file
+    src = sqlite3.connect(engine.url.database)
+    for path in paths:
+        dst = sqlite3.connect(path)
+        src.backup(dst)
+        dst.close()
+    src.close()
+
+
+def test_reads_round_robin_over_healthy_replicas(replica_files):
+    _, rs = replica_files
+    a, b = rs.replicas
+    session = database.ReadSessionLocal()
+    stmt = select(models.User.id)
+    assert [session.get_bind(clause=stmt) for _ in range(4)] == [a.bind, b.bind, a.bind, b.bind]
+    assert session.get_bind(clause=update(models.User).values(status="active")) is session.info["primary"]
+
+    b.engine.dispose()
+    b.engine = create_engine("sqlite:////nonexistent/dir/replica.db")  # replica went away
+    rs.check_all()
+    assert not b.healthy and a.healthy
+    assert {session.get_bind(clause=stmt) for _ in range(3)} == {a.bind}
+    a.healthy = False
+    assert session.get_bind(clause=stmt) is session.info["primary"]
+    assert rs.stats()["primary_reads"] == 1
+    session.close()
+
+
+def test_client_reads_its_own_writes_then_falls_back_to_replicas(replica_files, client, verified_user):
+    paths, rs = replica_files
+    _, email = verified_user("replica")
+    _snapshot_primary(paths)  # replicas have the user but not the session made below
+
+    r = client.post("/api/auth/signin", json={"email": email, "password": "pw123456"})
+    assert "db_primary=1" in r.headers["set-cookie"]
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    sid = utils.decode_access_token(r.json()["access_token"])["sid"]
+
+    # right after the write, the sticky cookie keeps this client on the primary
+    assert [s["id"] for s in client.get("/api/auth/sessions", headers=headers).json()] == [sid]
+    replica_reads = rs.stats()["replica_reads"]
+
+    # once it expires, reads go to a (lagging) replica
+    client.cookies.delete("db_primary")
+    assert client.get("/api/auth/sessions", headers=headers).json() == []
+    assert rs.stats()["replica_reads"] > replica_reads
+
+
+def test_pgbouncer_mode_disables_prepared_statements():
+    kwargs = database._engine_kwargs("postgresql+asyncpg://u:p@pgbouncer:6432/app", pgbouncer=True)
+    assert kwargs["connect_args"]["statement_cache_size"] == 0
+    assert kwargs["connect_args"]["prepared_statement_cache_size"] == 0
+    names = {kwargs["connect_args"]["prepared_statement_name_func"]() for _ in range(2)}
+    assert len(names) == 2
+    assert database._engine_kwargs("postgresql://u:p@pgbouncer:6432/app", pgbouncer=True)["connect_args"] == {}
+    assert "connect_args" not in database._engine_kwargs("postgresql+asyncpg://u:p@db/app")
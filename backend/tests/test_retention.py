@@ -0,0 +1,47 @@
+import sys
+import os
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import models, retention, utils
+from app.database import SessionLocal
+
+
+def test_sweep_deletes_dead_rows_in_batches():
+    now = datetime.utcnow()
+    db = SessionLocal()
+    user = models.User(email=f"ret-{uuid.uuid4().hex[:8]}@example.com")
+    db.add(user)
+    db.flush()
+
+    def rt(expires_at, revoked=False, created_at=None, **kw):
+        return models.RefreshToken(user_id=user.id, token_hash=utils.hash_token(uuid.uuid4().hex), expires_at=expires_at, revoked=revoked, created_at=created_at or now, **kw)
+
+    expired = [rt(now - timedelta(days=3)) for _ in range(5)]
+    stale_revoked = [rt(now + timedelta(days=5), revoked=True, created_at=now - timedelta(days=9)) for _ in range(2)]
+    # a rotated token whose family is still live stays for reuse detection
+    rotated = rt(now + timedelta(days=5), revoked=True, created_at=now - timedelta(days=9), id=str(uuid.uuid4()), rotated_at=now - timedelta(days=8))
+    keep = [rt(now + timedelta(days=5)), rt(now + timedelta(days=5), revoked=True), rt(now - timedelta(hours=1)),
+            rotated, rt(now + timedelta(days=13), family_id=rotated.id)]
+    otts = [
+        models.OneTimeToken(user_id=user.id, token_hash=utils.hash_token(uuid.uuid4().hex), type=models.TokenType.password_reset, expires_at=e)
+        for e in (now - timedelta(days=2), now + timedelta(hours=1))
+    ]
+    db.add_all(expired + stale_revoked + keep + otts)
+    db.commit()
+    keep_ids = {r.id for r in keep}
+    uid = user.id
+    db.close()
+
+    result = retention.sweep(batch_size=2, pause=0, now=now)
+    assert result["refresh_tokens"] >= 7
+    assert result["one_time_tokens"] >= 1
+    assert retention.stats["runs"] >= 1
+
+    db = SessionLocal()
+    remaining = {r.id for r in db.query(models.RefreshToken).filter(models.RefreshToken.user_id == uid)}
+    assert remaining == keep_ids
+    assert db.query(models.OneTimeToken).filter(models.OneTimeToken.user_id == uid).count() == 1
+    db.close()
@@ -0,0 +1,97 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import models, utils, revocation
+from app.database import engine, SessionLocal
+
+
+def _signin(client, email):
+    r = client.post("/api/auth/signin", json={"email": email, "password": "pw123456"})
+    assert r.status_code == 200
+    return r.json()["access_token"]
+
+
+def _me(client, access):
+    return client.get("/api/auth/sessions", headers={"Authorization": f"Bearer {access}"}).status_code
+
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    bloom = revocation.BloomFilter(10_000, 0.01)
+    for i in range(10_000):
+        bloom.add(f"jti:{i}")
+    assert all(f"jti:{i}" in bloom for i in range(10_000))
+    false_positives = sum(f"other:{i}" in bloom for i in range(20_000))
+    assert false_positives < 20_000 * 0.02
+    assert bloom.nbytes < 13_000  # ~9.6 bits per item at 1%
+
+
+def test_revoke_all_and_session_revoke_reject_access_tokens(client, verified_user):
+    _, email = verified_user("rev")
+    first, second = _signin(client, email), _signin(client, email)
+    assert _me(client, first) == 200
+
+    sid = utils.decode_access_token(first)["sid"]
+    r = client.post("/api/auth/sessions/revoke", json={"session_id": sid}, headers={"Authorization": f"Bearer {second}"})
+    assert r.status_code == 200
+    assert _me(client, first) == 401
+    assert _me(client, second) == 200
+
+    assert client.post("/api/auth/sessions/revoke-all", headers={"Authorization": f"Bearer {second}"}).status_code == 200
+    assert _me(client, second) == 401
+    # tokens issued after the cutoff are fine
+    assert _me(client, _signin(client, email)) == 200
+
+
+def test_session_revoke_and_logout_end_every_rotation_of_the_session(client, verified_user):
+    _, email = verified_user("rev")
+    for end in ("revoke", "logout"):
+        first = _signin(client, email)
+        r = client.post("/api/auth/refresh", headers={"x-csrf": client.cookies.get("csrf_token")})
+        second = r.json()["access_token"]
+        if end == "revoke":
+            sid = utils.decode_access_token(second)["sid"]
+            client.post("/api/auth/sessions/revoke", json={"session_id": sid}, headers={"Authorization": f"Bearer {second}"})
+        else:
+            client.post("/api/auth/logout", headers={"x-csrf": client.cookies.get("csrf_token")})
+        # the access token from before the rotation has another sid
+        assert _me(client, second) == 401
+        assert _me(client, first) == 401
+
+
+def test_other_workers_sync_from_the_table_and_confirm_filter_hits(client, verified_user):
+    uid, email = verified_user("rev")
+    access = _signin(client, email)
+    payload = utils.decode_access_token(access)
+
+    # another worker, loaded before the revocation
+    other = revocation.Denylist(capacity=1000, exact_size=0, bind=engine)
+    other.load()
+    assert other.check(payload) == (False, [])
+
+    db = SessionLocal()
+    user = db.get(models.User, uid)
+    user.status = models.UserStatus.suspended
+    db.commit()
+    other.sync()
+    assert other.check(payload) == (True, [])
+    user.status = models.UserStatus.active
+    db.commit()
+
+    # exact set disabled: a filter hit is confirmed against the table
+    token_sid = payload["sid"]
+    revocation.revoke_session(db, token_sid)
+    db.commit()
+    other.sync()
+    fresh = dict(payload, iat=payload["iat"] + 3600)  # past the suspension cutoff
+    revoked, unsure = other.check(fresh)
+    assert not revoked and unsure == [f"sid:{token_sid}"]
+    assert other.confirm(db, unsure) is True
+
+    # a false positive is confirmed once, then answered from memory
+    assert other.confirm(db, ["sid:never-revoked"]) is False
+    other.filter.add("sid:never-revoked")
+    assert other.check({"sub": uid, "iat": fresh["iat"], "sid": "never-revoked"}) == (False, [])
+    assert other.stats()["false_positives"] == 1
+    db.close()
@@ -0,0 +1,101 @@
+import sys
+import os
+import uuid
+import time
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import main as app_main
+from app import models, utils
+from app.database import engine, SessionLocal
+
+
+def _user_with_sessions(n: int):
+    """A user with ``n`` sessions: every 10th active, every 10th+1 expired, the rest revoked."""
+    db = SessionLocal()
+    user = models.User(email=f"pg-{uuid.uuid4().hex[:8]}@example.com", email_verified=True, password_hash="x")
+    db.add(user)
+    db.commit()
+    uid = user.id
+    db.close()
+    now = datetime.utcnow()
+    rows = []
+    for i in range(n):
+        kind = i % 10
+        rows.append({
+            "id": str(uuid.uuid4()), "user_id": uid, "token_hash": uuid.uuid4().hex * 2,
+            # a few share a timestamp so the id tiebreak is exercised
+            "created_at": now - timedelta(seconds=(n - i) // 3),
+            "expires_at": now - timedelta(days=1) if kind == 1 else now + timedelta(days=14),
+            "revoked": kind > 1,
+        })
+    with engine.begin() as conn:
+        for lo in range(0, n, 10000):
+            conn.execute(insert(models.RefreshToken.__table__), rows[lo:lo + 10000])
+    return uid, {"active": n // 10, "expired": n // 10, "revoked": n - 2 * (n // 10), "all": n}
+
+
+def _walk(client, headers, status, limit):
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"status": status, "limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get("/api/auth/sessions", params=params, headers=headers)
+        assert r.status_code == 200
+        seen.extend(r.json())
+        pages += 1
+        cursor = r.headers.get("x-next-cursor")
+        if not cursor:
+            return seen, pages
+
+
+def test_keyset_pages_are_complete_and_ordered():
+    uid, counts = _user_with_sessions(1000)
+    client = TestClient(app_main.app)
+    headers = {"Authorization": f"Bearer {utils.create_access_token(uid)}"}
+    for status, expected in counts.items():
+        seen, pages = _walk(client, headers, status, 64)
+        assert len(seen) == expected
+        assert len({s["id"] for s in seen}) == expected
+        assert pages == -(-expected // 64)
+        keys = [(s["created_at"], s["id"]) for s in seen]
+        assert keys == sorted(keys, reverse=True)
+    active, _ = _walk(client, headers, "active", 200)
+    assert not any(s["revoked"] for s in active)
+
+    assert client.get("/api/auth/sessions", params={"cursor": "%%%"}, headers=headers).status_code == 400
+    assert client.get("/api/auth/sessions", params={"limit": 0}, headers=headers).status_code == 422
+    assert client.get("/api/auth/sessions", params={"status": "bogus"}, headers=headers).status_code == 422
+
+
+def test_listing_stays_one_indexed_query_with_100k_sessions(count_queries):
+    uid, _ = _user_with_sessions(100_000)
+    client = TestClient(app_main.app)
+    headers = {"Authorization": f"Bearer {utils.create_access_token(uid)}"}
+    client.get("/api/auth/sessions", params={"limit": 1}, headers=headers)  # warm the principal cache
+
+    r = client.get("/api/auth/sessions", params={"limit": 200}, headers=headers)
+    cursor = r.headers["x-next-cursor"]
+    for _ in range(100):
+        r = client.get("/api/auth/sessions", params={"limit": 200, "cursor": cursor}, headers=headers)
+        cursor = r.headers["x-next-cursor"]
+    # a page 20k rows deep costs the same single query as the first one
+    t0 = time.perf_counter()
+    with count_queries() as q:
+        r = client.get("/api/auth/sessions", params={"limit": 200, "cursor": cursor, "status": "active"}, headers=headers)
+    elapsed = time.perf_counter() - t0
+    assert r.status_code == 200 and len(r.json()) == 200
+    assert len(q) == 1
+    assert elapsed < 1.0
+
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            plan = " ".join(row[-1] for row in conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT id FROM refresh_tokens WHERE user_id = :u AND (created_at, id) < (:c, :i) "
+                "ORDER BY created_at DESC, id DESC LIMIT 201"), {"u": uid, "c": datetime.utcnow(), "i": ""}))
+        assert "ix_refresh_tokens_user_id_created_at_id" in plan
+        assert "TEMP B-TREE" not in plan
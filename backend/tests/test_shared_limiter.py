@@ -0,0 +1,73 @@
+import sys
+import os
+import subprocess
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.shared_limiter import SharedTable, SharedMemoryLimiter, SLOT, HEADER_SIZE
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# each process hammers the same key from several threads and prints how many calls it was allowed
+_WORKER = """
+import sys, threading
+from app.shared_limiter import SharedTable, SharedMemoryLimiter
+limiter = SharedMemoryLimiter(100, 3600, SharedTable(sys.argv[1], 1024), name="ip")
+counts = []
+def run():
+    counts.append(sum(limiter.allow("10.0.0.1") for _ in range(100)))
+threads = [threading.Thread(target=run) for _ in range(4)]
+for t in threads: t.start()
+for t in threads: t.join()
+print(sum(counts))
+"""
+
+
+def test_limit_is_shared_across_processes(tmp_path):
+    path = str(tmp_path / "rl")
+    procs = [subprocess.Popen([sys.executable, "-c", _WORKER, path], cwd=BACKEND, stdout=subprocess.PIPE, text=True)
+             for _ in range(4)]
+    allowed = [int(p.communicate(timeout=60)[0]) for p in procs]
+    # 1600 attempts from 4 processes x 4 threads; the limit holds in total, not per worker
+    assert sum(allowed) == 100
+    # a restarted worker maps the same counts
+    assert SharedMemoryLimiter(100, 3600, SharedTable(path, 1024), name="ip").allow("10.0.0.1") is False
+
+
+def test_table_is_fixed_size_and_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "rl")
+    table = SharedTable(path, 16)
+    limiter = SharedMemoryLimiter(1, 3600, table)
+    for i in range(1000):
+        limiter.allow(f"k{i}")
+    assert os.path.getsize(path) == HEADER_SIZE + 16 * SLOT.size
+    assert limiter.evictions == 1000 - 16
+    # an existing file keeps its size; a different setting does not remap it
+    assert SharedTable(path, 4096).slots == 16
+    # separate limiters on one table do not share keys
+    other = SharedMemoryLimiter(1, 3600, table, name="other")
+    assert other.allow("k999") is True
+    assert limiter.allow("k999") is False
+
+
+def test_threads_in_one_process_do_not_overshoot(tmp_path):
+    limiter = SharedMemoryLimiter(500, 3600, SharedTable(str(tmp_path / "rl"), 64))
+    allowed = []
+
+    def run():
+        allowed.append(sum(limiter.allow("hot") for _ in range(250)))
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(allowed) == 500
+
+
+def test_check_without_consuming(tmp_path):
+    limiter = SharedMemoryLimiter(1, 3600, SharedTable(str(tmp_path / "rl"), 16))
+    assert limiter.allow("k", consume=False) and limiter.allow("k", consume=False)
+    assert limiter.allow("k")
+    assert not limiter.allow("k", consume=False)
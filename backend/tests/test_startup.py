@@ -0,0 +1,86 @@
+import sys
+import os
+import time
+import subprocess
+import pytest
+from sqlalchemy import create_engine, inspect
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import rate_limiter, login_guard, schema
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class FakeRedis:
+    def __init__(self):
+        self.alive = True
+
+    def ping(self):
+        if not self.alive:
+            raise ConnectionError("connection refused")
+        return True
+
+    def register_script(self, source):
+        return lambda keys=(), args=(): 0
+
+
+def test_importing_the_app_does_not_connect_to_redis():
+    # a blackholed address: a connect attempt at import would hang for the timeout
+    env = dict(os.environ, REDIS_URL="redis://10.255.255.1:6379/0", REDIS_SOCKET_TIMEOUT="30")
+    code = "import app.main; from app import rate_limiter as r; print(r.health.state, r.health.client, r.redis_client)"
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=env, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.split() == ["connecting", "None", "None"]
+    assert time.perf_counter() - t0 < 30
+
+
+def test_health_switches_limiters_and_guard_between_backends(monkeypatch):
+    health = rate_limiter.health
+    fake = FakeRedis()
+    monkeypatch.setattr(health, "url", "redis://fake:6379/0")
+    monkeypatch.setattr(health, "client", fake)
+    monkeypatch.setattr(health, "state", "connecting")
+    monkeypatch.setattr(health, "transitions", 0)
+    monkeypatch.setattr(rate_limiter, "ip_limiter", rate_limiter._memory_limiters[0])
+    monkeypatch.setattr(rate_limiter, "auth_limiter", rate_limiter._memory_limiters[1])
+    monkeypatch.setattr(login_guard.guard, "tracker", login_guard._memory_tracker)
+
+    assert health.check()
+    assert health.state == "up" and rate_limiter.redis_client is fake
+    assert isinstance(rate_limiter.ip_limiter, rate_limiter.RedisLimiter)
+    assert isinstance(rate_limiter.auth_limiter, rate_limiter.RedisLimiter)
+    assert isinstance(login_guard.guard.tracker, login_guard.RedisTracker)
+
+    fake.alive = False
+    assert not health.check()
+    assert health.state == "down" and rate_limiter.redis_client is None
+    assert rate_limiter.ip_limiter is rate_limiter._memory_limiters[0]
+    assert login_guard.guard.tracker is login_guard._memory_tracker
+    assert health.transitions == 2
+
+
+def test_background_connect_does_not_block_start():
+    health = rate_limiter.RedisHealth("redis://127.0.0.1:1/0", retry_max=0.2)
+    t0 = time.perf_counter()
+    health.start()
+    assert time.perf_counter() - t0 < 0.1
+    deadline = time.monotonic() + 5
+    while health.state != "down" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    health.stop()
+    assert health.state == "down"
+
+
+def test_schema_check_against_migration_heads(tmp_path):
+    from alembic.script import ScriptDirectory
+
+    assert schema.head_revisions() == set(ScriptDirectory(os.path.join(BACKEND, "migrations")).get_heads())
+    bind = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    with pytest.raises(schema.SchemaOutOfDate):
+        schema.check(bind, mode="strict")
+    assert schema.check(bind, mode="warn") is False
+    assert schema.check(bind, mode="upgrade") is True
+    assert schema.check(bind, mode="strict") is True
+    assert "ix_refresh_tokens_user_id_created_at_id" in {ix["name"] for ix in inspect(bind).get_indexes("refresh_tokens")}
@@ -10,15 +10,20 @@ const API = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:9003'
 
 export default function Sessions(){
   const [sessions,setSessions]=useState([])
+  const [cursor,setCursor]=useState(null)
   const [msg,setMsg]=useState(null)
 
-  async function load(){
+  async function load(after){
     const token = localStorage.getItem('access_token')
     if(!token){ setMsg('Not signed in'); return }
-    const res = await fetch(`${API}/api/auth/sessions`, {headers: {Authorization: `Bearer ${token}`}})
+    const params = new URLSearchParams({status: 'active'})
+    if(after){ params.set('cursor', after) }
+    // credentials carry the db_primary cookie, so a list right after a revoke reads the primary
+    const res = await fetch(`${API}/api/auth/sessions?${params}`, {headers: {Authorization: `Bearer ${token}`}, credentials: 'include'})
     if(res.ok){
       const data = await res.json()
-      setSessions(data)
+      setSessions(after ? prev => prev.concat(data) : data)
+      setCursor(res.headers.get('x-next-cursor'))
     } else {
       setMsg('Failed to load sessions')
     }
@@ -36,7 +41,7 @@ export default function Sessions(){
   async function revokeAll(){
     const token = localStorage.getItem('access_token')
     const csrf = getCsrf()
-    const res = await fetch(`${API}/api/auth/sessions/revoke-all`, {method:'POST', headers: {Authorization: `Bearer ${token}`, 'x-csrf': csrf}})
+    const res = await fetch(`${API}/api/auth/sessions/revoke-all`, {method:'POST', headers: {Authorization: `Bearer ${token}`, 'x-csrf': csrf}, credentials: 'include'})
     if(res.ok){ load() }
   }
 
@@ -50,12 +55,14 @@ export default function Sessions(){
         <li key={s.id} style={{marginTop:8}}>
           <div><strong>{s.device_info || 'Unknown device'}</strong></div>
           <div>Created: {s.created_at}</div>
+          <div>Last seen: {s.last_seen_at || 'Never'}{s.last_ip ? ` from ${s.last_ip}` : ''}</div>
           <div>Expires: {s.expires_at}</div>
           <div>Revoked: {s.revoked ? 'Yes':'No'}</div>
           <div><button onClick={()=>revoke(s.id)}>Revoke</button></div>
         </li>
       ))}
       </ul>
+      {cursor && <button onClick={()=>load(cursor)}>Load more</button>}
     </div>
   )
 }
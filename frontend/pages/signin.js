@@ -3,6 +3,24 @@ import Router from 'next/router'
 
 const API = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:9003'
 
+// After repeated failures the server asks for a proof of work: find a counter
+// so that sha256("<challenge>:<counter>") starts with <bits> zero bits.
+async function solveChallenge(challenge){
+  const bits = parseInt(challenge.split('.')[1], 10)
+  const encoder = new TextEncoder()
+  for(let counter = 0; ; counter++){
+    const proof = `${challenge}:${counter}`
+    const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', encoder.encode(proof)))
+    let zeros = 0
+    for(const byte of digest){
+      if(byte === 0){ zeros += 8; continue }
+      zeros += Math.clz32(byte) - 24
+      break
+    }
+    if(zeros >= bits) return proof
+  }
+}
+
 export default function SignIn(){
   const [email,setEmail]=useState('')
   const [password,setPassword]=useState('')
@@ -14,13 +32,19 @@ export default function SignIn(){
     setLoading(true)
     setMsg(null)
     let res, data
+    const attempt = (proof) => fetch(`${API}/api/auth/signin`, {
+      method: 'POST',
+      headers: proof ? {'Content-Type':'application/json', 'X-Login-Proof': proof} : {'Content-Type':'application/json'},
+      body: JSON.stringify({email,password}),
+      credentials: 'include'
+    })
     try {
-      res = await fetch(`${API}/api/auth/signin`, {
-        method: 'POST',
-        headers: {'Content-Type':'application/json'},
-        body: JSON.stringify({email,password}),
-        credentials: 'include'
-      })
+      res = await attempt()
+      const challenge = res.status === 429 && res.headers.get('X-Login-Challenge')
+      if(challenge){
+        setMsg('Verifying...')
+        res = await attempt(await solveChallenge(challenge))
+      }
     } catch (err) {
       setLoading(false)
       setMsg('Network error: ' + (err.message || 'Failed to reach server'))